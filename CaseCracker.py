@@ -1,95 +1,297 @@
-# CaseCracker.py 
+# CaseCracker.py
 # Created by SuperGrok and Sir_Cornealious on X
 
 import argparse
 import logging
 import os
 import shutil
+import signal
+import sys
 import tempfile
-import tkinter as tk
-from tkinter import messagebox
 import requests
-from gui import CaseCrackerGUI
-from processing import process_pdfs, analyze_combined_ocr, interactive_query
-from utils import setup_logging
+from inputs import discover_files, prepare_inputs
+from manifest import JobManifest
+from processing import ProcessingCancelled, process_pdfs, analyze_combined_ocr, interactive_query
+from utils import (setup_logging, start_logging, create_case_dir, API_KEY_ENV, API_KEY_FILE, DEFAULT_QUERY, OCR_EXTENSIONS, OCR_WORKERS, OCR_USE_TEXT_LAYER,
+                   ANALYSIS_STREAM, JPEG_RETENTION, JPEG_RETENTION_POLICIES, FOLLOWUP_CONVERSATION, OCR_BATCH, OCR_TILING, INPUT_RECURSIVE)
+
+# Exit codes for command-line mode, so batch schedulers can tell failures apart
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_API_ERROR = 3
+EXIT_FILE_ERROR = 4
+EXIT_INCOMPLETE = 5
+
+PROCESSING_MODES = ["ocr_only", "ocr_and_analysis", "analyze_only"]
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Crack your case with xAI. Runs the GUI when no inputs are given, otherwise runs headless."
+    )
+    parser.add_argument("inputs", nargs="*", help="Input files or directories (PDF/images for OCR, a .txt file for analyze_only)")
+    parser.add_argument("--mode", choices=PROCESSING_MODES, default="ocr_and_analysis", help="Processing mode (default: ocr_and_analysis)")
+    parser.add_argument("-o", "--output-dir", help="Directory the timestamped case directory is created in")
+    parser.add_argument("--case-name", help="Name of the case directory instead of a timestamp")
+    query_group = parser.add_mutually_exclusive_group()
+    query_group.add_argument("-q", "--query", help="Analysis query")
+    query_group.add_argument("--query-file", help="File containing the analysis query")
+    parser.add_argument("--api-key-env", default=API_KEY_ENV, help=f"Environment variable holding the API key (default: {API_KEY_ENV})")
+    parser.add_argument("--api-key-file", default=API_KEY_FILE, help="File holding the API key, used when the environment variable is unset")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS, help=f"Concurrent OCR calls per document (default: {OCR_WORKERS})")
+    parser.add_argument("--no-recursive", action="store_true", help="Only take files directly inside input directories")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the shared OCR cache")
+    parser.add_argument("--stream", action="store_true",
+                        help="Print analysis and follow-up answers token by token as they arrive")
+    parser.add_argument("--ocr-batch", action="store_true",
+                        help="Pack several short pages into each OCR request, falling back to one page per call")
+    parser.add_argument("--ocr-tiling", action="store_true",
+                        help="Split dense pages into tiles OCR'd concurrently and stitched back together")
+    parser.add_argument("--no-text-layer", action="store_true", help="OCR every PDF page, ignoring embedded text")
+    parser.add_argument("--jpeg-retention", choices=JPEG_RETENTION_POLICIES, default=JPEG_RETENTION,
+                        help=f"What to do with rasterized page JPEGs after OCR (default: {JPEG_RETENTION})")
+    parser.add_argument("--interactive", action="store_true", help="Start the interactive follow-up prompt after analysis")
+    parser.add_argument("--conversation", action="store_true",
+                        help="Ask follow-ups as one continuing conversation instead of selecting earlier answers")
+    parser.add_argument("--watch", metavar="DIR",
+                        help="Keep running and OCR documents as they arrive in DIR into one case directory (--case-name, "
+                             "default: the name of DIR), until interrupted")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="Console log level in command-line mode")
+    return parser
+
+def resolve_api_key(env_var, key_file):
+    api_key = os.environ.get(env_var, "").strip()
+    if not api_key and key_file and os.path.exists(key_file):
+        with open(key_file, "r") as f:
+            api_key = f.read().strip()
+    if not api_key:
+        raise ValueError(f"No API key found in ${env_var} or {key_file}")
+    return api_key
+
+def resolve_inputs(paths, processing_mode, recursive=INPUT_RECURSIVE):
+    """
+    Expands input files and directories (searched recursively unless recursive is False) into a list of
+    absolute file paths, which may come from any number of directories.
+    """
+    extensions = (".txt",) if processing_mode == "analyze_only" else OCR_EXTENSIONS
+    input_paths = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            input_paths.extend(discover_files(path, extensions, recursive=recursive))
+        elif os.path.isfile(path):
+            if not path.lower().endswith(extensions):
+                raise ValueError(f"Unsupported input for {processing_mode}: {path}")
+            input_paths.append(path)
+        else:
+            raise FileNotFoundError(f"Input not found: {path}")
+    if not input_paths:
+        raise ValueError("No input files found")
+    if processing_mode == "analyze_only" and len(input_paths) != 1:
+        raise ValueError("analyze_only takes exactly one .txt file")
+    return input_paths
+
+def run_pipeline(api_key, input_paths, timestamp_dir, query, processing_mode, logger,
+                 interactive=True, max_workers=OCR_WORKERS, use_cache=True,
+                 use_text_layer=OCR_USE_TEXT_LAYER, stream=ANALYSIS_STREAM, jpeg_retention=JPEG_RETENTION,
+                 conversation=FOLLOWUP_CONVERSATION, ocr_batch=OCR_BATCH, ocr_tiling=OCR_TILING, progress=None, cancel=None):
+    """
+    Runs OCR and/or analysis of input_paths for one case and returns the combined OCR file. Identical inputs
+    are OCR'd once (see prepare_inputs); in analyze_only mode input_paths holds the one text file to analyze.
+    progress(stage, done, total) and the cancel event are passed to process_pdfs; cancelling before analysis
+    raises ProcessingCancelled.
+    """
+    jpeg_dir = os.path.join(timestamp_dir, "JPEG")
+    ocr_dir = os.path.join(timestamp_dir, "OCR")
+    analysis_dir = os.path.join(timestamp_dir, "ANALYSIS")
+    followups_dir = os.path.join(timestamp_dir, "QUARRY")
+
+    if processing_mode in ["ocr_only", "ocr_and_analysis"]:
+        logger.info("Processing files...")
+        input_dir, files_to_process = prepare_inputs(input_paths, timestamp_dir)
+        combined_ocr_file = process_pdfs(api_key, input_dir, files_to_process, jpeg_dir, ocr_dir,
+                                         max_workers=max_workers, use_cache=use_cache,
+                                         use_text_layer=use_text_layer, jpeg_retention=jpeg_retention,
+                                         batch=ocr_batch, tile=ocr_tiling, progress=progress, cancel=cancel)
+        logger.info("File processing complete")
+    else:  # analyze_only
+        logger.info("Skipping OCR, using provided text file for analysis")
+        combined_ocr_file = input_paths[0]  # Use the selected text file directly
+
+    if processing_mode == "ocr_only":
+        logger.info(f"OCR processing complete. Results saved to: {timestamp_dir}")
+        return combined_ocr_file
+
+    if cancel is not None and cancel.is_set():
+        raise ProcessingCancelled("Cancelled before analysis")
+    logger.info("Performing combined analysis...")
+    if progress is not None:
+        progress("analysis", 0, 1)
+    analyze_combined_ocr(api_key, combined_ocr_file, analysis_dir, query, stream=stream)
+    logger.info("Analysis complete")
+    if progress is not None:
+        progress("analysis", 1, 1)
+    logger.info(f"Results saved to {timestamp_dir}")
+
+    if interactive:
+        logger.info("Starting interactive query")
+        interactive_query(api_key, combined_ocr_file, followups_dir, stream=stream, conversation=conversation)
+    return combined_ocr_file
+
+def ocr_failures(timestamp_dir):
+    """Returns (failed files, failed pages) recorded in the case's job manifest."""
+    manifest = JobManifest(os.path.join(timestamp_dir, "OCR"))
+    try:
+        return manifest.failures()
+    finally:
+        manifest.close()
+
+def run_cli(args):
+    logger = logging.getLogger(__name__)
+    try:
+        if not args.output_dir and args.mode != "analyze_only":
+            raise ValueError("--output-dir is required for OCR modes")
+        input_paths = resolve_inputs(args.inputs, args.mode, recursive=not args.no_recursive)
+        api_key = resolve_api_key(args.api_key_env, args.api_key_file)
+        query = args.query or DEFAULT_QUERY
+        if args.query_file:
+            with open(args.query_file, "r", encoding='utf-8') as f:
+                query = f.read().strip()
+        save_dir = args.output_dir or os.path.dirname(input_paths[0])
+        timestamp_dir = create_case_dir(os.path.abspath(save_dir), args.case_name)
+    except ValueError as e:
+        logger.error(f"Configuration error: {str(e)}")
+        return EXIT_USAGE
+    except (OSError, IOError) as e:
+        logger.error(f"File operation error: {str(e)}")
+        return EXIT_FILE_ERROR
+
+    logger = setup_logging(timestamp_dir)
+    logger.info(f"Starting headless {args.mode} run on {len(input_paths)} file(s)")
+    try:
+        run_pipeline(api_key, input_paths, timestamp_dir, query, args.mode, logger,
+                     interactive=args.interactive, max_workers=args.workers, use_cache=not args.no_cache,
+                     use_text_layer=not args.no_text_layer, stream=args.stream,
+                     jpeg_retention=args.jpeg_retention, conversation=args.conversation,
+                     ocr_batch=args.ocr_batch, ocr_tiling=args.ocr_tiling)
+        print(timestamp_dir)
+        if args.mode != "analyze_only":
+            failed_files, failed_pages = ocr_failures(timestamp_dir)
+            if failed_files or failed_pages:
+                logger.error(f"OCR incomplete: {failed_files} file(s) and {failed_pages} page(s) failed")
+                return EXIT_INCOMPLETE
+        return EXIT_OK
+    except requests.RequestException as e:
+        logger.exception(f"API request error: {str(e)}")
+        return EXIT_API_ERROR
+    except (OSError, IOError) as e:
+        logger.exception(f"File operation error: {str(e)}")
+        return EXIT_FILE_ERROR
+    except ValueError as e:
+        logger.exception(f"Configuration error: {str(e)}")
+        return EXIT_USAGE
+    except Exception as e:
+        logger.exception(f"Unexpected error: {str(e)}")
+        return EXIT_FAILURE
+
+def run_watch(args):
+    logger = logging.getLogger(__name__)
+    try:
+        if not args.output_dir:
+            raise ValueError("--output-dir is required for --watch")
+        intake_dir = os.path.abspath(args.watch)
+        api_key = resolve_api_key(args.api_key_env, args.api_key_file)
+        # A fixed case name, so a restarted watcher resumes the same case
+        case_dir = create_case_dir(os.path.abspath(args.output_dir), args.case_name or os.path.basename(intake_dir))
+    except ValueError as e:
+        logger.error(f"Configuration error: {str(e)}")
+        return EXIT_USAGE
+    except (OSError, IOError) as e:
+        logger.error(f"File operation error: {str(e)}")
+        return EXIT_FILE_ERROR
+
+    logger = setup_logging(case_dir)
+    from watch import IntakeWatcher
+    try:
+        watcher = IntakeWatcher(api_key, intake_dir, case_dir, max_workers=args.workers, use_cache=not args.no_cache,
+                                use_text_layer=not args.no_text_layer, jpeg_retention=args.jpeg_retention,
+                                batch=args.ocr_batch, tile=args.ocr_tiling)
+    except ValueError as e:
+        logger.error(f"Configuration error: {str(e)}")
+        return EXIT_USAGE
+    except (OSError, IOError) as e:
+        logger.error(f"File operation error: {str(e)}")
+        return EXIT_FILE_ERROR
+    # Stop between batches on SIGTERM as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        logger.info("Interrupted")
+    finally:
+        watcher.close()
+    logger.info(f"Stopped watching {intake_dir}. Results are in {case_dir}")
+    print(case_dir)
+    return EXIT_OK
+
+def run_gui_mode():
+    from gui import CaseCrackerGUI
 
-def main():
     # Set up temporary logging before GUI starts
     temp_dir = tempfile.mkdtemp()
     temp_log = os.path.join(temp_dir, "casecracker_temp.log")
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(temp_log, mode='w'),
-            logging.StreamHandler()
-        ],
-        force=True
-    )
+    start_logging(log_file=temp_log)
     logger = logging.getLogger(__name__)
     logger.debug("Initializing main with temporary logger")
 
     gui = CaseCrackerGUI()
 
+    def run_job(api_key, input_paths, timestamp_dir, query, processing_mode, progress, cancel):
+        # Runs on the GUI's worker thread; the GUI reports the outcome and handles follow-ups itself
+        job_logger = setup_logging(timestamp_dir)
+        job_logger.info("Starting main processing")
+        # Selected folders are expanded here, off the GUI thread
+        input_paths = resolve_inputs(input_paths, processing_mode)
+        job_logger.debug(f"GUI job: {len(input_paths)} input files, timestamp_dir={timestamp_dir}, "
+                         f"processing_mode={processing_mode}")
+        return run_pipeline(api_key, input_paths, timestamp_dir, query, processing_mode, job_logger,
+                            interactive=False, progress=progress, cancel=cancel)
+
     try:
         logger.debug("Starting GUI mode")
-        api_key, input_dir, files_to_process, timestamp_dir, query, processing_mode = gui.run_gui()
-        logger.debug(f"GUI returned: api_key={len(api_key)} chars, input_dir={input_dir}, files_to_process={files_to_process}, timestamp_dir={timestamp_dir}, processing_mode={processing_mode}")
-
-        # Switch to timestamped logger after GUI completes
-        logger = setup_logging(timestamp_dir)
-        logger.info("Starting main processing")
-
-        jpeg_dir = os.path.join(timestamp_dir, "JPEG")
-        ocr_dir = os.path.join(timestamp_dir, "OCR")
-        analysis_dir = os.path.join(timestamp_dir, "ANALYSIS")
-        followups_dir = os.path.join(timestamp_dir, "QUARRY")
-
-        if processing_mode in ["ocr_only", "ocr_and_analysis"]:
-            logger.info("Processing files...")
-            combined_ocr_file = process_pdfs(api_key, input_dir, files_to_process, jpeg_dir, ocr_dir)
-            logger.info("File processing complete")
-        else:  # analyze_only
-            logger.info("Skipping OCR, using provided text file for analysis")
-            combined_ocr_file = os.path.join(input_dir, files_to_process[0])  # Use the selected text file directly
-
-        if processing_mode == "ocr_only":
-            logger.info(f"OCR processing complete. Results saved to: {timestamp_dir}")
-            tk.Tk().withdraw()
-            messagebox.showinfo("Success", f"OCR processing complete. Results saved to: {timestamp_dir}")
-            return
-
-        logger.info("Performing combined analysis...")
-        analysis_result = analyze_combined_ocr(api_key, combined_ocr_file, analysis_dir, query)
-        logger.info("Analysis complete")
-
-        logger.info(f"Results saved to {timestamp_dir}")
-        tk.Tk().withdraw()
-        messagebox.showinfo("Success", f"Processing complete. Results saved to: {timestamp_dir}")
-        logger.info("Starting interactive query")
-        interactive_query(api_key, combined_ocr_file, followups_dir)
-
+        timestamp_dir = gui.run_gui(run_job)
+        logger.info(f"GUI closed. Results saved to {timestamp_dir}")
+        return EXIT_OK
+    # The GUI has already shown these errors in its own window
     except requests.RequestException as e:
-        logger.exception(f"API request error: {str(e)}")
-        tk.Tk().withdraw()
-        messagebox.showerror("Error", f"API request failed: {str(e)}")
+        logger.error(f"API request error: {str(e)}")
+        return EXIT_API_ERROR
     except (OSError, IOError) as e:
-        logger.exception(f"File operation error: {str(e)}")
-        tk.Tk().withdraw()
-        messagebox.showerror("Error", f"File operation failed: {str(e)}")
+        logger.error(f"File operation error: {str(e)}")
+        return EXIT_FILE_ERROR
     except ValueError as e:
-        logger.exception(f"Configuration error: {str(e)}")
-        tk.Tk().withdraw()
-        messagebox.showerror("Error", f"Invalid configuration: {str(e)}")
+        logger.error(f"Configuration error: {str(e)}")
+        return EXIT_USAGE
     except Exception as e:
         logger.exception(f"Unexpected error: {str(e)}")
-        tk.Tk().withdraw()
-        messagebox.showerror("Error", f"An unexpected error occurred: {str(e)}")
+        return EXIT_FAILURE
     finally:
         logger.debug("Cleaning up")
         gui.cleanup_temp_dir()
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir, ignore_errors=True)
 
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.watch and not args.inputs:
+        return run_gui_mode()
+    # Until the case directory exists, records also go to a temporary file that setup_logging carries into the case log
+    temp_dir = tempfile.mkdtemp()
+    start_logging(console_level=args.log_level, log_file=os.path.join(temp_dir, "casecracker_temp.log"))
+    try:
+        return run_watch(args) if args.watch else run_cli(args)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
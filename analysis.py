@@ -0,0 +1,204 @@
+# analysis.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import json
+import logging
+import os
+import re
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from api_client import get_client
+from combined_ocr import PAGE_BREAK, RECORD_END, load_index, iter_pages
+from response_archive import get_response_archive
+from token_utils import MAX_TOKENS, estimate_tokens, truncate_text
+from utils import ANALYSIS_MODEL, ANALYSIS_CHUNK_TOKENS, ANALYSIS_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Rough chars per token, used only to split a single page that is larger than a chunk
+CHARS_PER_TOKEN = 4.45
+
+def split_units(ocr_content, combined_ocr_file=None):
+    """
+    Splits combined OCR into (label, text) units on document and page boundaries.
+    Indexed combined files are read page by page through the index; any other text is split on
+    its "File:" headers and page breaks.
+    """
+    if combined_ocr_file and load_index(combined_ocr_file):
+        return [(f"{file_key}, page {page_num}", text) for _, file_key, page_num, text in iter_pages(combined_ocr_file)]
+    units = []
+    for record in re.split(r"(?m)^(?=File: )", ocr_content):
+        if not record.strip():
+            continue
+        match = re.match(r"File: (.*?)\n(?:### OCR ###\n)?", record)
+        name = match.group(1) if match else "text"
+        body = record[match.end():] if match else record
+        if body.endswith(RECORD_END):
+            body = body[:-len(RECORD_END)]
+        for page_num, page in enumerate(body.split(PAGE_BREAK), 1):
+            units.append((f"{name}, page {page_num}", page))
+    return units
+
+def _split_oversized(label, text, budget):
+    if estimate_tokens(text) <= budget:
+        return [(label, text)]
+    size = int(budget * CHARS_PER_TOKEN)
+    pieces = [text[i:i + size] for i in range(0, len(text), size)]
+    return [(f"{label} (part {n} of {len(pieces)})", truncate_text(piece, budget)) for n, piece in enumerate(pieces, 1)]
+
+def pack_chunks(units, budget):
+    """Greedily packs units, in order, into chunks whose estimated size stays within budget tokens."""
+    chunks = []
+    current, current_tokens = [], 0
+    for label, text in units:
+        for piece_label, piece in _split_oversized(label, text, budget):
+            tokens = estimate_tokens(piece) + 10  # Label and separator overhead
+            if current and current_tokens + tokens > budget:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append((piece_label, piece))
+            current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _call(client, prompt, logs_dir, log_name):
+    payload = {
+        "model": ANALYSIS_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.01
+    }
+    response_json = client.chat(payload)
+    get_response_archive(logs_dir).append(log_name, response_json)
+    return response_json['choices'][0]['message']['content']
+
+def _map_chunk(client, chunk_id, total, chunk, query, logs_dir):
+    excerpt = "\n\n".join(f"[{label}]\n{text}" for label, text in chunk)
+    prompt = (
+        f"You are reviewing part {chunk_id} of {total} of the OCR-extracted text for an investigation. "
+        f"Other parts are reviewed separately and all findings will be merged afterwards.\n\n{excerpt}\n\n"
+        f"Task: {query}\n\nReport only findings supported by this part, citing the bracketed file and page labels."
+    )
+    logger.debug(f"Sending map analysis call for chunk {chunk_id}/{total}")
+    return _call(client, prompt, logs_dir, f"analysis_map_response_{chunk_id:03d}")
+
+def _reduce(client, partials, query, logs_dir, name, final):
+    findings = "\n\n".join(f"=== Findings from {source} ===\n{text}" for source, text in partials)
+    instruction = (
+        "Merge them into one complete answer to the task" if final
+        else "Merge them into one consolidated set of findings"
+    )
+    prompt = (
+        f"The OCR-extracted text for an investigation was analyzed in separate parts. "
+        f"Here are the partial findings:\n\n{findings}\n\nTask: {query}\n\n"
+        f"{instruction}. Remove duplicates, reconcile contradictions, and cite in square brackets "
+        f"the sources each conclusion rests on (e.g. [Chunk 3]), keeping any citations already present."
+    )
+    logger.debug(f"Sending reduce analysis call {name}")
+    return _call(client, truncate_text(prompt, MAX_TOKENS), logs_dir, f"analysis_{name}_response")
+
+def _batch_partials(partials, budget):
+    """
+    Groups partial findings, in order, into merge batches of about budget tokens.
+    Every batch takes at least two partials so each reduce pass shrinks the number of findings.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for source, text in partials:
+        tokens = estimate_tokens(text)
+        if len(current) >= 2 and current_tokens + tokens > budget:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((source, text))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def analyze_map_reduce(api_key, ocr_content, analysis_dir, logs_dir, query, combined_ocr_file=None,
+                       chunk_tokens=ANALYSIS_CHUNK_TOKENS, max_workers=ANALYSIS_WORKERS):
+    """
+    Analyzes OCR text larger than one request by splitting it into chunk_tokens-sized chunks on
+    document/page boundaries, analyzing the chunks concurrently (map), then merging the partial
+    findings in as many passes as needed (reduce). A failed merge passes its findings to the next pass
+    unmerged, and pages of failed chunks are listed in a note at the end of the analysis. Writes
+    combined_analysis.txt and analysis_chunks.json, which records the pages in each chunk and which
+    chunks fed each merge.
+    """
+    client = get_client(api_key)
+    chunks = pack_chunks(split_units(ocr_content, combined_ocr_file), chunk_tokens)
+    logger.info(f"Map-reduce analysis over {len(chunks)} chunks with {max_workers} workers")
+    provenance = {"chunks": [], "reduce_passes": []}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(_map_chunk, client, i, len(chunks), chunk, query, logs_dir)
+                   for i, chunk in enumerate(chunks, 1)]
+        partials = []
+        for i, (chunk, future) in enumerate(zip(chunks, futures), 1):
+            record = {"id": f"Chunk {i}", "units": [label for label, _ in chunk],
+                      "tokens": sum(estimate_tokens(text) for _, text in chunk)}
+            try:
+                partials.append((f"Chunk {i}", future.result()))
+                record["status"] = "ok"
+            except (requests.RequestException, KeyError, IndexError, ValueError, OSError) as e:
+                logger.error(f"Map analysis failed for chunk {i}: {str(e)}")
+                record["status"] = f"failed: {str(e)}"
+            provenance["chunks"].append(record)
+        if not partials:
+            raise ValueError("Every analysis chunk failed")
+
+        # Reduce until the findings fit in a single merge call
+        pass_num = 0
+        retried = False
+        while True:
+            pass_num += 1
+            batches = _batch_partials(partials, chunk_tokens)
+            if len(batches) == 1:
+                provenance["final_inputs"] = [source for source, _ in partials]
+                result = _reduce(client, partials, query, logs_dir, "reduce_final", final=True)
+                break
+            logger.info(f"Reduce pass {pass_num}: merging {len(partials)} findings in {len(batches)} batches")
+            futures = [executor.submit(_reduce, client, batch, query, logs_dir, f"reduce_{pass_num}_{j}", False)
+                       for j, batch in enumerate(batches, 1)]
+            merged = []
+            merges = []
+            error = None
+            for j, (batch, future) in enumerate(zip(batches, futures), 1):
+                name = f"Merge {pass_num}-{j}"
+                record = {"id": name, "inputs": [source for source, _ in batch]}
+                try:
+                    merged.append((name, future.result()))
+                    record["status"] = "ok"
+                except (requests.RequestException, KeyError, IndexError, ValueError, OSError) as e:
+                    # The batch's findings go on to the next pass unmerged
+                    logger.error(f"Reduce analysis failed for {name}, passing its findings through: {str(e)}")
+                    record["status"] = f"failed: {str(e)}"
+                    merged.extend(batch)
+                    error = e
+                merges.append(record)
+            provenance["reduce_passes"].append(merges)
+            if len(merged) == len(partials):
+                # Nothing merged; the pass is repeated once before the analysis gives up
+                if retried:
+                    raise error
+                retried = True
+            else:
+                retried = False
+            partials = merged
+
+    failed_units = [unit for record in provenance["chunks"] if record["status"] != "ok" for unit in record["units"]]
+    if failed_units:
+        result += (f"\n\n---\nNote: {len(failed_units)} part(s) of the OCR text could not be analyzed, "
+                   f"so these findings do not cover:\n" + "\n".join(f"- {unit}" for unit in failed_units) + "\n")
+
+    analysis_file = os.path.join(analysis_dir, "combined_analysis.txt")
+    with open(analysis_file, "w", encoding='utf-8') as f:
+        f.write(result)
+        f.flush()
+    logger.debug(f"Saved analysis file: {analysis_file}")
+    provenance_file = os.path.join(analysis_dir, "analysis_chunks.json")
+    with open(provenance_file, "w", encoding='utf-8') as f:
+        json.dump(provenance, f, indent=2)
+        f.flush()
+    logger.debug(f"Saved analysis provenance: {provenance_file}")
+    return result
@@ -0,0 +1,67 @@
+# answer_cache.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_NAME = "answer_cache.sqlite"
+
+def normalize_question(question):
+    """Case and whitespace differences don't make a question new."""
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+def answer_key(model, context, history, question):
+    """
+    Builds the cache key of a follow-up from the model, the exact context sent, the conversation or
+    selected history included, and the normalized question.
+    """
+    digest = hashlib.sha256()
+    for part in (model, hashlib.sha256(context.encode("utf-8")).hexdigest(), history, normalize_question(question)):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class AnswerCache:
+    """
+    Per-case cache of follow-up answers, stored as SQLite next to the follow-ups, so a repeated
+    question over the same context and history is answered without an API call.
+    """
+    def __init__(self, followups_dir):
+        self.path = os.path.join(followups_dir, ANSWER_CACHE_NAME)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, question TEXT, answer TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, question, answer):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO answers (key, question, answer, created) VALUES (?, ?, ?, ?)",
+                               (key, question, answer, time.time()))
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
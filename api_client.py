@@ -0,0 +1,211 @@
+# api_client.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import email.utils
+import json
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import get_metrics
+from token_utils import calibrate, count_tokens
+from utils import API_URL, TIMEOUT, API_MAX_RETRIES, API_BACKOFF_BASE, API_BACKOFF_MAX, API_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying; 429 and 503 may also carry a Retry-After header
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+class XAIClient:
+    """
+    Shared xAI chat-completions client.
+    Keeps TLS connections alive in a pooled session, retries timeouts, connection errors and
+    retryable status codes with exponential backoff and full jitter (honouring Retry-After),
+    and records the latency of every HTTP attempt.
+    """
+    def __init__(self, api_key, api_url=API_URL, timeout=TIMEOUT, max_retries=API_MAX_RETRIES,
+                 backoff_base=API_BACKOFF_BASE, backoff_max=API_BACKOFF_MAX, pool_size=API_POOL_SIZE):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def _record(self, latency, status, request=None, retry=False):
+        with self._lock:
+            self.latencies.append(latency)
+        body = getattr(request, "body", None) or b""
+        get_metrics().record_request(latency, status, len(body), retry)
+        logger.debug("API call finished in %.3fs (status=%s)", latency, status)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        if not value or response.status_code not in (429, 503):
+            return None
+        try:
+            return min(self.backoff_max, max(0.0, float(value)))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            if retry_at is None:
+                return None
+            return min(self.backoff_max, max(0.0, retry_at.timestamp() - time.time()))
+
+    def post(self, payload, **kwargs):
+        """
+        POSTs a chat-completions payload with retries and returns the final response.
+        Raises requests.RequestException once retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.api_url, json=payload, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(time.perf_counter() - start, type(e).__name__, e.request, attempt > 0)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"API call failed ({str(e)}), retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+                continue
+            self._record(time.perf_counter() - start, response.status_code, response.request, attempt > 0)
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                try:
+                    delay = self._retry_after(response)
+                except (TypeError, ValueError):
+                    delay = None
+                if delay is None:
+                    delay = self._backoff(attempt)
+                logger.warning(f"API returned {response.status_code}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                response.close()
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response
+
+    def chat(self, payload):
+        """
+        Sends a chat-completions request and returns the decoded JSON response.
+        Logs counted vs. reported prompt tokens and feeds text-only prompts back into the token calibration.
+        """
+        prompt_text, text_only = _prompt_text(payload)
+        counted = count_tokens(prompt_text) if prompt_text else 0
+        response = self.post(payload)
+        response_json = response.json()
+        usage = response_json.get("usage") or {}
+        get_metrics().record_response(payload.get("model"), usage, len(response.content))
+        prompt_tokens = usage.get("prompt_tokens")
+        logger.info("Tokens: prompt=%s (counted %s), completion=%s", prompt_tokens, counted, usage.get('completion_tokens'))
+        if text_only and prompt_text and isinstance(prompt_tokens, int):
+            calibrate(prompt_text, prompt_tokens)
+        return response_json
+
+    def stream_chat(self, payload, on_text=None):
+        """
+        Sends a streaming chat-completions request and consumes the server-sent event stream,
+        calling on_text with each content delta as it arrives. Returns a response dict assembled
+        in the non-streaming shape, with a "timing" entry holding time-to-first-token and total seconds.
+        """
+        prompt_text, text_only = _prompt_text(payload)
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        start = time.perf_counter()
+        first_token = None
+        parts = []
+        received = 0
+        assembled = {"choices": [{"index": 0, "message": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+        with self.post(payload, stream=True) as response:
+            # Iterated as bytes: SSE is always UTF-8, but requests would decode a text/event-stream without
+            # a charset as ISO-8859-1
+            for raw_line in response.iter_lines(chunk_size=None):
+                received += len(raw_line) + 1
+                line = raw_line.decode("utf-8")
+                # Blank lines separate events; lines starting with ":" are keep-alive comments
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                for key in ("id", "model", "created", "system_fingerprint"):
+                    if key in event:
+                        assembled[key] = event[key]
+                if event.get("usage"):
+                    assembled["usage"] = event["usage"]
+                for choice in event.get("choices") or []:
+                    if choice.get("finish_reason"):
+                        assembled["choices"][0]["finish_reason"] = choice["finish_reason"]
+                    text = (choice.get("delta") or {}).get("content")
+                    if not text:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    parts.append(text)
+                    if on_text is not None:
+                        on_text(text)
+        total = time.perf_counter() - start
+        assembled["choices"][0]["message"]["content"] = "".join(parts)
+        assembled["timing"] = {
+            "ttft": round(first_token, 3) if first_token is not None else None,
+            "total": round(total, 3)
+        }
+        usage = assembled.get("usage") or {}
+        get_metrics().record_response(payload.get("model"), usage, received)
+        logger.info(f"Streamed response: ttft={assembled['timing']['ttft']}s, total={total:.3f}s, "
+                    f"completion tokens={usage.get('completion_tokens')}")
+        if text_only and prompt_text and isinstance(usage.get("prompt_tokens"), int):
+            calibrate(prompt_text, usage["prompt_tokens"])
+        return assembled
+
+    def latency_stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return {"calls": 0}
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3)
+        return {
+            "calls": len(latencies),
+            "mean": round(sum(latencies) / len(latencies), 3),
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "max": round(latencies[-1], 3)
+        }
+
+def _prompt_text(payload):
+    """Returns the text of a chat payload's messages and whether the messages are text only."""
+    parts = []
+    text_only = True
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            for item in content or []:
+                if item.get("type") == "text":
+                    parts.append(item.get("text", ""))
+                else:
+                    text_only = False
+    return "\n".join(parts), text_only
+
+def get_client(api_key):
+    """Returns the process-wide client for api_key, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = XAIClient(api_key)
+            _clients[api_key] = client
+        return client
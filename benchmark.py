@@ -0,0 +1,199 @@
+# benchmark.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import requests
+from mock_xai_server import MockXAIServer, WORDS
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = (1275, 1650)  # US letter at 150 DPI
+LINES_PER_PAGE = 40
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the OCR, analysis and follow-up pipeline end to end against a local mock xAI server."
+    )
+    parser.add_argument("--pages", type=int, default=20, help="Synthetic pages to generate (default: 20)")
+    parser.add_argument("--files", type=int, default=2, help="Files the pages are spread over (default: 2)")
+    parser.add_argument("--format", choices=["pdf", "png"], default="png",
+                        help="Synthetic input format; pdf needs Poppler (default: png)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock response latency in seconds (default: 0.2)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Mock latency jitter in seconds (default: 0.05)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--burst-every", type=int, default=0, help="Start a 429 burst after every N requests (0: never)")
+    parser.add_argument("--burst-length", type=int, default=3, help="Requests per 429 burst (default: 3)")
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with 429s (default: 0)")
+    parser.add_argument("--response-chars", type=int, default=2000, help="Characters per mock completion (default: 2000)")
+    parser.add_argument("--followups", type=int, default=2, help="Follow-up queries to run after analysis (default: 2)")
+    parser.add_argument("--stream", action="store_true", help="Stream analysis and follow-up answers")
+    parser.add_argument("--batch", action="store_true", help="Pack several pages into each OCR request")
+    parser.add_argument("--workers", type=int, help="Concurrent OCR calls per document (default: OCR_WORKERS)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for synthetic pages and mock behaviour")
+    parser.add_argument("--work-dir", help="Directory for inputs and the case (default: a temporary directory, removed afterwards)")
+    parser.add_argument("-o", "--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+def generate_inputs(input_dir, pages, files, fmt, seed=0):
+    """
+    Writes `pages` synthetic typed pages of random case vocabulary, spread over `files` files
+    (multi-page PDFs, or one PNG per page). Returns the file names in order.
+    """
+    # Imported lazily so the mock server can be used without Pillow
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    def page_image(page_num):
+        image = Image.new("L", PAGE_SIZE, 255)
+        draw = ImageDraw.Draw(image)
+        draw.text((100, 60), f"EXHIBIT {page_num}", fill=0)
+        for line in range(LINES_PER_PAGE):
+            text = " ".join(rng.choice(WORDS) for _ in range(12))
+            draw.text((100, 110 + line * 36), text, fill=0)
+        return image
+
+    names = []
+    if fmt == "png":
+        for page_num in range(1, pages + 1):
+            name = f"synthetic-page-{page_num:04d}.png"
+            page_image(page_num).save(os.path.join(input_dir, name))
+            names.append(name)
+        return names
+    files = max(1, min(files, pages))
+    per_file = [pages // files + (1 if i < pages % files else 0) for i in range(files)]
+    page_num = 0
+    for index, count in enumerate(per_file, 1):
+        images = []
+        for _ in range(count):
+            page_num += 1
+            images.append(page_image(page_num).convert("RGB"))
+        name = f"synthetic-part_{index}_of_{files}.pdf" if files > 1 else "synthetic.pdf"
+        images[0].save(os.path.join(input_dir, name), "PDF", resolution=150, save_all=True, append_images=images[1:])
+        names.append(name)
+    return names
+
+def peak_rss():
+    """Peak resident set size in bytes of this process and of its finished children (e.g. pdftoppm)."""
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return None
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    }
+
+def scripted_input(queries):
+    """Stands in for input() in interactive_query: selects no earlier follow-ups, asks each query, then exits."""
+    remaining = list(queries)
+    def answer(prompt=""):
+        if prompt.startswith("Select"):
+            return "0"
+        return remaining.pop(0) if remaining else "exit"
+    return answer
+
+def run_benchmark(args):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="casecracker_bench_")
+    server = MockXAIServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           burst_every=args.burst_every, burst_length=args.burst_length, retry_after=args.retry_after,
+                           response_chars=args.response_chars, seed=args.seed).start()
+    # The endpoint is read when utils is imported, so the pipeline is imported only after the server is up
+    os.environ["XAI_API_URL"] = server.url
+    from api_client import get_client
+    from metrics import get_metrics
+    from processing import process_pdfs, analyze_combined_ocr, interactive_query
+    from utils import OCR_WORKERS, create_case_dir
+
+    api_key = "benchmark"
+    report = {"config": vars(args), "stages": {}}
+    original_input = builtins.input
+    try:
+        input_dir = os.path.join(work_dir, "inputs")
+        shutil.rmtree(input_dir, ignore_errors=True)
+        os.makedirs(input_dir)
+        start = time.perf_counter()
+        files = generate_inputs(input_dir, args.pages, args.files, args.format, args.seed)
+        report["stages"]["generate"] = {"wall": round(time.perf_counter() - start, 3), "files": len(files)}
+
+        # A fresh case every run, so the job manifest never resumes an earlier benchmark
+        shutil.rmtree(os.path.join(work_dir, "case"), ignore_errors=True)
+        case_dir = create_case_dir(work_dir, "case")
+        run_start = time.perf_counter()
+        start = time.perf_counter()
+        combined_ocr_file = process_pdfs(api_key, input_dir, files, os.path.join(case_dir, "JPEG"),
+                                         os.path.join(case_dir, "OCR"), max_workers=args.workers or OCR_WORKERS,
+                                         use_cache=False, batch=args.batch)
+        ocr_wall = time.perf_counter() - start
+        # Throughput counts the pages that came back with text, not the pages asked for
+        counters = get_metrics().snapshot()["counters"]
+        pages = counters.get("pages_ocr", 0) + counters.get("pages_cached", 0)
+        report["stages"]["ocr"] = {"wall": round(ocr_wall, 3), "pages_requested": args.pages, "pages": pages,
+                                   "pages_failed": counters.get("pages_failed", 0),
+                                   "pages_per_sec": round(pages / ocr_wall, 3) if ocr_wall else None,
+                                   "server": server.snapshot()}
+
+        # Answers printed by the pipeline would mix with the JSON report on stdout
+        answers = io.StringIO()
+        start = time.perf_counter()
+        analysis_ok = True
+        try:
+            with contextlib.redirect_stdout(answers):
+                analyze_combined_ocr(api_key, combined_ocr_file, os.path.join(case_dir, "ANALYSIS"),
+                                     "Summarize the evidence.", stream=args.stream)
+        except (requests.RequestException, OSError, ValueError):
+            analysis_ok = False
+        report["stages"]["analysis"] = {"wall": round(time.perf_counter() - start, 3), "ok": analysis_ok}
+
+        if args.followups:
+            builtins.input = scripted_input([f"What does exhibit {n} say about the payment?" for n in range(1, args.followups + 1)])
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(answers):
+                interactive_query(api_key, combined_ocr_file, os.path.join(case_dir, "QUARRY"), stream=args.stream)
+            report["stages"]["followups"] = {"wall": round(time.perf_counter() - start, 3), "queries": args.followups}
+
+        report["wall_time"] = round(time.perf_counter() - run_start, 3)
+        report["requests"] = get_client(api_key).latency_stats()
+        server_stats = server.snapshot()
+        report["server"] = server_stats
+        report["bytes_uploaded"] = server_stats["bytes_received"]
+        report["peak_rss_bytes"] = peak_rss()
+        report["metrics"] = get_metrics().snapshot()
+        return report
+    finally:
+        builtins.input = original_input
+        server.stop()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level), format='%(asctime)s - %(levelname)s - %(message)s')
+    report = run_benchmark(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding='utf-8') as f:
+            f.write(output + "\n")
+        logger.info(f"Saved benchmark report: {args.output}")
+    else:
+        print(output)
+    if not report["stages"]["ocr"]["pages"]:
+        logger.error("No pages were OCR'd; the throughput figures are meaningless")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# combined_ocr.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+PAGE_BREAK = "\n\n--- Page Break ---\n\n"
+RECORD_END = f"\n{'-'*50}\n"
+
+def index_path(combined_ocr_file):
+    return combined_ocr_file + ".idx"
+
+def load_index(combined_ocr_file, path=None):
+    """
+    Returns the index entries of combined_ocr_file (or of the index at path) in write order. Each entry
+    holds the record's group, file_key, byte offset, length and digest, and [page_num, offset, length]
+    for every page. A torn trailing line from an interrupted write is ignored.
+    """
+    path = path or index_path(combined_ocr_file)
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Ignoring incomplete index line in {path}")
+    return entries
+
+def latest_entries(entries):
+    """
+    Keeps only the newest record per file_key, in the position the document was first written,
+    so a re-OCR'd document supersedes its earlier record without changing the document order.
+    """
+    latest = {}
+    for entry in entries:
+        latest[entry["file_key"]] = entry
+    return list(latest.values())
+
+def _read_range(f, offset, length):
+    f.seek(offset)
+    return f.read(length).decode("utf-8")
+
+def record_digest(record):
+    return hashlib.blake2b(record, digest_size=8).hexdigest()
+
+def matches_data(entries, combined_ocr_file):
+    """Returns whether every entry's byte range exists in combined_ocr_file and still holds the record it indexed."""
+    size = os.path.getsize(combined_ocr_file)
+    with open(combined_ocr_file, "rb") as f:
+        for entry in entries:
+            if entry["offset"] + entry["length"] > size:
+                return False
+            f.seek(entry["offset"])
+            record = f.read(entry["length"])
+            # Entries written before digests were recorded can only be checked for their header
+            if not record.startswith(f"File: {entry['group']}\n".encode("utf-8")):
+                return False
+            if "digest" in entry and record_digest(record) != entry["digest"]:
+                return False
+    return True
+
+def iter_pages(combined_ocr_file):
+    """Yields (group, file_key, page_num, text) for every current page, reading only the indexed byte ranges."""
+    with open(combined_ocr_file, "rb") as f:
+        for entry in latest_entries(load_index(combined_ocr_file)):
+            for page_num, offset, length in entry["pages"]:
+                yield entry["group"], entry["file_key"], page_num, _read_range(f, offset, length)
+
+def read_combined_ocr(combined_ocr_file):
+    """
+    Returns the current combined OCR text. Indexed files are assembled from their latest records;
+    any other text file (e.g. one picked for analyze_only) is read as is.
+    """
+    entries = load_index(combined_ocr_file)
+    if not entries:
+        with open(combined_ocr_file, "r", encoding='utf-8') as f:
+            return f.read()
+    with open(combined_ocr_file, "rb") as f:
+        return "".join(_read_range(f, entry["offset"], entry["length"]) for entry in latest_entries(entries))
+
+class CombinedOCRWriter:
+    """
+    Append-only writer for combined_ocr.txt. Each document is written as one record and fsync'd
+    before its index line is appended, so a record is visible to readers only once it is complete
+    on disk. Index entries carry a digest of their record, checked on open: bytes past the last
+    indexed record (a record torn by a crash) are truncated, a compaction interrupted between
+    replacing the data and the index is finished, and an index that no longer matches its data is
+    moved aside with it, leaving process_pdfs to rewrite every document from the job manifest.
+    """
+    def __init__(self, combined_ocr_file):
+        self.path = combined_ocr_file
+        self.index_file = index_path(combined_ocr_file)
+        self._recover()
+        self._data = open(self.path, "ab")
+        self._index = open(self.index_file, "a", encoding='utf-8')
+
+    def _recover(self):
+        tmp_index = self.index_file + ".tmp"
+        if os.path.exists(self.path + ".tmp"):
+            os.remove(self.path + ".tmp")
+        if os.path.exists(tmp_index):
+            # compact() replaces the data and then the index; a crash between the two leaves the new index here
+            if os.path.exists(self.path) and matches_data(load_index(self.path, tmp_index), self.path):
+                logger.warning(f"Finishing interrupted compaction of {self.path}")
+                os.replace(tmp_index, self.index_file)
+            else:
+                os.remove(tmp_index)
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "r+b") as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    # Drop a torn last line so the next entry starts on a line of its own
+                    logger.warning(f"Truncating incomplete index line from {self.index_file}")
+                    f.truncate(data.rfind(b"\n") + 1)
+        self.entries = load_index(self.path)
+        if not os.path.exists(self.path):
+            if self.entries:
+                self._move_aside(self.index_file)
+                self.entries = []
+            return
+        size = os.path.getsize(self.path)
+        if not self.entries and not os.path.exists(self.index_file):
+            if size:
+                # Written without an index (older versions); keep it aside rather than mixing formats
+                self._move_aside(self.path)
+            return
+        if not matches_data(self.entries, self.path):
+            logger.warning(f"Index {self.index_file} does not match {self.path}; documents will be rewritten")
+            self._move_aside(self.path, self.index_file)
+            self.entries = []
+            return
+        end = max((entry["offset"] + entry["length"] for entry in self.entries), default=0)
+        if size > end:
+            logger.warning(f"Truncating {size - end} bytes of incomplete record from {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+
+    def _move_aside(self, *paths):
+        for path in paths:
+            if os.path.exists(path):
+                backup = path + ".bak"
+                os.replace(path, backup)
+                logger.warning(f"Moved {path} to {backup}")
+
+    def has_record(self, file_key):
+        return any(entry["file_key"] == file_key for entry in self.entries)
+
+    def append(self, group, file_key, pages):
+        """Appends one document given as [(page_num, text), ...] and returns its index entry."""
+        self._data.seek(0, os.SEEK_END)
+        offset = self._data.tell()
+        chunks = [f"File: {group}\n### OCR ###\n".encode("utf-8")]
+        position = offset + len(chunks[0])
+        page_entries = []
+        for i, (page_num, text) in enumerate(pages):
+            if i:
+                separator = PAGE_BREAK.encode("utf-8")
+                chunks.append(separator)
+                position += len(separator)
+            data = text.encode("utf-8")
+            page_entries.append([page_num, position, len(data)])
+            chunks.append(data)
+            position += len(data)
+        chunks.append(RECORD_END.encode("utf-8"))
+        record = b"".join(chunks)
+        self._data.write(record)
+        self._data.flush()
+        os.fsync(self._data.fileno())
+        entry = {"group": group, "file_key": file_key, "offset": offset, "length": len(record),
+                 "digest": record_digest(record), "pages": page_entries}
+        self._index.write(json.dumps(entry) + "\n")
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        self.entries.append(entry)
+        logger.debug("Appended %d bytes for %s at offset %d", len(record), file_key, offset)
+        return entry
+
+    def compact(self):
+        """Rewrites the file without superseded records; a no-op when every record is current."""
+        current = latest_entries(self.entries)
+        if len(current) == len(self.entries):
+            return
+        self.close()
+        tmp_path = self.path + ".tmp"
+        tmp_index = self.index_file + ".tmp"
+        new_entries = []
+        with open(self.path, "rb") as src, open(tmp_path, "wb") as dst, open(tmp_index, "w", encoding='utf-8') as idx:
+            for entry in current:
+                src.seek(entry["offset"])
+                record = src.read(entry["length"])
+                shift = dst.tell() - entry["offset"]
+                dst.write(record)
+                new_entry = dict(entry, offset=entry["offset"] + shift,
+                                 pages=[[num, offset + shift, length] for num, offset, length in entry["pages"]])
+                idx.write(json.dumps(new_entry) + "\n")
+                new_entries.append(new_entry)
+            dst.flush()
+            os.fsync(dst.fileno())
+            idx.flush()
+            os.fsync(idx.fileno())
+        os.replace(tmp_path, self.path)
+        os.replace(tmp_index, self.index_file)
+        logger.debug(f"Compacted {self.path}: dropped {len(self.entries) - len(new_entries)} superseded records")
+        self.entries = new_entries
+        self._data = open(self.path, "ab")
+        self._index = open(self.index_file, "a", encoding='utf-8')
+
+    def close(self):
+        if not self._data.closed:
+            self._data.close()
+        if not self._index.closed:
+            self._index.close()
@@ -0,0 +1,16 @@
+# conftest.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import pytest
+import api_client
+from mock_xai_server import MockXAIServer
+
+# Manual smoke scripts that run at import (they need a local PDF, Poppler and a display), not pytest tests
+collect_ignore = ["test_pdf2image.py", "test_tkinter.py"]
+
+@pytest.fixture
+def mock_client(monkeypatch):
+    """Yields (api_key, server): a local mock xAI server and an API key whose client sends to it."""
+    with MockXAIServer(latency=0.01, jitter=0, response_chars=200, seed=0) as server:
+        monkeypatch.setitem(api_client._clients, "mock-key", api_client.XAIClient("mock-key", api_url=server.url))
+        yield "mock-key", server
@@ -0,0 +1,196 @@
+# followup.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import json
+import logging
+import os
+import re
+import time
+from answer_cache import AnswerCache, answer_key
+from api_client import get_client
+from combined_ocr import index_path, read_combined_ocr
+from metrics import begin_case
+from response_archive import get_response_archive
+from retrieval import load_or_build
+from token_utils import MAX_TOKENS, TokenCounter, estimate_tokens, truncate_text
+from utils import (ANALYSIS_MODEL, ANALYSIS_STREAM, FOLLOWUP_RETRIEVAL, FOLLOWUP_TOP_K, FOLLOWUP_TOKEN_BUDGET,
+                   FOLLOWUP_CONVERSATION, FOLLOWUP_ANSWER_CACHE, get_followup_files)
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = ("You are assisting a criminal investigation. Answer follow-up questions about the case using the "
+                 "OCR-extracted text provided, citing the bracketed file and page labels where available.")
+
+class FollowupSession:
+    """
+    Follow-up questions about one case. Each answer is saved as QUARRY/followup_NNN.txt with its raw response
+    in logs/. In conversation mode the request keeps a fixed system/context prefix and appends each question
+    and answer as chat messages, so earlier turns are byte-identical between requests and provider-side prompt
+    caching can apply; otherwise each question is a single message with any selected earlier follow-ups.
+    Answers are cached per case by (context, history, question), so repeating a question is instant.
+    """
+    def __init__(self, api_key, combined_ocr_file, followups_dir, retrieval=FOLLOWUP_RETRIEVAL, top_k=FOLLOWUP_TOP_K,
+                 token_budget=FOLLOWUP_TOKEN_BUDGET, stream=ANALYSIS_STREAM, conversation=FOLLOWUP_CONVERSATION,
+                 use_cache=FOLLOWUP_ANSWER_CACHE):
+        if not os.access(followups_dir, os.W_OK):
+            raise PermissionError(f"No write permission for {followups_dir}")
+        self.client = get_client(api_key)
+        self.combined_ocr_file = combined_ocr_file
+        self.followups_dir = followups_dir
+        case_dir = os.path.dirname(followups_dir)
+        self.logs_dir = os.path.join(case_dir, "logs")
+        self.index_dir = os.path.join(case_dir, "OCR")
+        self.retrieval = retrieval
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.stream = stream
+        self.conversation = conversation
+        self.cache = AnswerCache(followups_dir) if use_cache else None
+        self.metrics = begin_case(case_dir)
+        self.counter = len(get_followup_files(followups_dir)) + 1
+        self.turns = []
+        self.ocr_content = ""
+        self.index = None
+        self._signature = None
+
+    def _refresh(self):
+        """Reloads the OCR text or retrieval index only when the combined file or its index has changed."""
+        if not os.path.exists(self.combined_ocr_file):
+            return
+        signature = tuple(os.path.getsize(p) if os.path.exists(p) else None
+                          for p in (self.combined_ocr_file, index_path(self.combined_ocr_file)))
+        if signature == self._signature:
+            return
+        if self.retrieval:
+            self.index = load_or_build(self.combined_ocr_file, self.index_dir)
+        else:
+            self.ocr_content = read_combined_ocr(self.combined_ocr_file)
+        if self.turns:
+            logger.info("OCR output changed; starting a new conversation")
+            self.turns = []
+        self._signature = signature
+
+    def previous_questions(self):
+        """Returns [(followup_file, question), ...] for the follow-ups saved so far."""
+        questions = []
+        for followup_file in get_followup_files(self.followups_dir):
+            with open(os.path.join(self.followups_dir, followup_file), "r", encoding='utf-8') as f:
+                match = re.search(r"Follow-up Query:\n(.*?)\nResponse:", f.read(), re.DOTALL)
+            questions.append((followup_file, match.group(1).strip() if match else ""))
+        return questions
+
+    def selected_history(self, indices):
+        """Returns the text of the saved follow-ups at the given 1-based indices, for single-message mode."""
+        followup_files = get_followup_files(self.followups_dir)
+        selected_content = ""
+        for idx in sorted(set(indices)):
+            if 1 <= idx <= len(followup_files):
+                with open(os.path.join(self.followups_dir, followup_files[idx - 1]), "r", encoding='utf-8') as f:
+                    selected_content += f"\nPrevious Follow-up:\n{f.read().strip()}\n"
+        return selected_content
+
+    def _retrieved(self, query, used_tokens):
+        # Only the pages most relevant to this question, within the remaining token budget
+        context, labels = self.index.context_for(query, self.top_k, self.token_budget - used_tokens)
+        logger.info(f"Follow-up context: {len(labels)} retrieved pages")
+        return ("Here are the pages of the OCR-extracted text most relevant to the question, labelled by file and "
+                f"page:\n\n{context}")
+
+    def _single_message(self, query, selected_content):
+        if self.index is not None:
+            context = self._retrieved(query, estimate_tokens(f"{selected_content}\n{query}"))
+        else:
+            context = f"Here is the OCR-extracted text for your investigation:\n\n{self.ocr_content}"
+        full_query = f"{context}\n\n{selected_content}\n\nFollow-up question:\n{query}"
+        query_tokens = estimate_tokens(full_query)
+        if query_tokens > MAX_TOKENS:
+            logger.warning(f"Query exceeds token limit ({query_tokens} tokens). Truncating...")
+            full_query = truncate_text(full_query, MAX_TOKENS)
+        return [{"role": "user", "content": full_query}], context, selected_content
+
+    def _conversation_messages(self, query):
+        if self.index is not None:
+            # The retrieved pages travel with their question, so the system prefix and earlier turns never change
+            system = SYSTEM_PROMPT
+            user = f"{self._retrieved(query, estimate_tokens(query))}\n\nFollow-up question:\n{query}"
+            context = user
+        else:
+            system = f"{SYSTEM_PROMPT}\n\nHere is the OCR-extracted text for your investigation:\n\n{self.ocr_content}"
+            if estimate_tokens(system) > MAX_TOKENS // 2:
+                logger.warning("OCR text exceeds half the token limit. Truncating the conversation context...")
+                system = truncate_text(system, MAX_TOKENS // 2)
+            user = f"Follow-up question:\n{query}"
+            context = system
+        counter = TokenCounter(MAX_TOKENS)
+        counter.add(system, user)
+        # Keep the most recent turns that fit; dropping the oldest only happens once the history outgrows the limit
+        kept = []
+        for turn in reversed(self.turns):
+            if not counter.try_add(*turn):
+                logger.info(f"Dropping {len(self.turns) - len(kept)} oldest conversation turns to stay within the token limit")
+                break
+            kept.insert(0, turn)
+        messages = [{"role": "system", "content": system}]
+        for user_content, answer in kept:
+            messages.append({"role": "user", "content": user_content})
+            messages.append({"role": "assistant", "content": answer})
+        messages.append({"role": "user", "content": user})
+        return messages, context, json.dumps(kept), user
+
+    def ask(self, query, selected_content="", on_text=None):
+        """
+        Answers one follow-up question and saves it. With streaming, on_text receives the answer as it arrives
+        (on a cache hit, the whole cached answer at once). Returns the answer text.
+        """
+        self._refresh()
+        start = time.perf_counter()
+        if self.conversation:
+            messages, context, history, user_content = self._conversation_messages(query)
+        else:
+            messages, context, history = self._single_message(query, selected_content)
+            user_content = messages[-1]["content"]
+        key = answer_key(ANALYSIS_MODEL, context, history, query)
+        followup_file = os.path.join(self.followups_dir, f"followup_{self.counter:03d}.txt")
+        header = f"Follow-up Query:\n{query}\nResponse:\n"
+        footer = f"\n{'-'*50}\n"
+
+        answer = self.cache.get(key) if self.cache is not None else None
+        if answer is not None:
+            logger.info("Answered follow-up from the local answer cache")
+            self.metrics.count("followup_cache_hits")
+            if self.stream and on_text is not None:
+                on_text(answer)
+            with open(followup_file, "w", encoding='utf-8') as f:
+                f.write(f"{header}{answer}{footer}")
+        else:
+            payload = {"model": ANALYSIS_MODEL, "messages": messages, "temperature": 0.01}
+            logger.debug("Sending follow-up query API call")
+            if self.stream:
+                with open(followup_file, "w", encoding='utf-8') as f:
+                    f.write(header)
+                    def write_text(text):
+                        f.write(text)
+                        f.flush()
+                        if on_text is not None:
+                            on_text(text)
+                    response_json = self.client.stream_chat(payload, write_text)
+                    f.write(footer)
+            else:
+                response_json = self.client.chat(payload)
+            answer = response_json['choices'][0]['message']['content']
+            get_response_archive(self.logs_dir).append(f"followup_response_{self.counter:03d}", response_json)
+            if not self.stream:
+                with open(followup_file, "w", encoding='utf-8') as f:
+                    f.write(f"{header}{answer}{footer}")
+            if self.cache is not None:
+                self.cache.put(key, query, answer)
+        logger.debug(f"Saved follow-up file: {followup_file}")
+        self.turns.append((user_content, answer))
+        self.counter += 1
+        self.metrics.add_time("followup", time.perf_counter() - start)
+        self.metrics.save()
+        return answer
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
@@ -3,27 +3,62 @@
 
 import json
 import os
+import queue
 import shutil
 import tempfile
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import requests
-from datetime import datetime
 import logging
 import time
-from utils import API_URL, TIMEOUT, API_KEY_FILE
+from utils import API_KEY_FILE, ANALYSIS_MODEL, DEFAULT_QUERY, OCR_EXTENSIONS, create_case_dir
+from api_client import get_client
+from followup import FollowupSession
+from processing import ProcessingCancelled
+
+# Milliseconds between checks of the worker's event queue
+POLL_INTERVAL_MS = 100
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+def error_message(error):
+    if isinstance(error, requests.RequestException):
+        return f"API request failed: {str(error)}"
+    if isinstance(error, (OSError, IOError)):
+        return f"File operation failed: {str(error)}"
+    if isinstance(error, ValueError):
+        return f"Invalid configuration: {str(error)}"
+    return f"An unexpected error occurred: {str(error)}"
 
 class CaseCrackerGUI:
+    """
+    Collects the run configuration in tabs, then runs the job on a worker thread while the window stays
+    live. The worker reports progress through a queue that the Tk loop drains, so widgets are only ever
+    touched from the GUI thread. Cancelling stops the run at the next page boundary. Follow-up questions
+    are asked in the Run tab as one conversation, with answers streamed in as they arrive.
+    """
     def __init__(self):
         self.api_key = None
         self.input_paths = []
         self.save_dir = None
-        self.query = "Analyze this text for insights related to the investigation of this crime. Identify crimes committed or evidence of conspiracy"
+        self.query = DEFAULT_QUERY
         self.processing_mode = "ocr_and_analysis"  # Default mode
         self.temp_dir = None
         self.logger = logging.getLogger(__name__)
         self.root = None
         self.pdf_paths_file = None
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker = None
+        self.followup_worker = None
+        self.session = None
+        self.combined_ocr_file = None
+        self.error = None
+        self.close_requested = False
 
     def setup_temp_dir(self):
         self.temp_dir = tempfile.mkdtemp()
@@ -54,10 +89,39 @@ class CaseCrackerGUI:
         else:
             self.logger.debug("No pdf_paths file to restore or pdf_paths_file is None")
 
-    def run_gui(self):
+    def _run_job(self, run_job, config):
+        """Worker thread: runs the job and reports the outcome on the event queue."""
+        def progress(stage, done, total):
+            self.events.put(("progress", stage, done, total))
+        try:
+            self.events.put(("done", run_job(*config, progress=progress, cancel=self.cancel_event)))
+        except ProcessingCancelled as e:
+            self.events.put(("cancelled", str(e)))
+        except Exception as e:
+            self.logger.exception(f"Processing failed: {str(e)}")
+            self.events.put(("error", e))
+
+    def _ask(self, question):
+        """Follow-up worker thread: streams the answer to the event queue."""
+        try:
+            if self.session is None:
+                self.session = FollowupSession(self.api_key, self.combined_ocr_file, os.path.join(self.save_dir, "QUARRY"),
+                                               stream=True, conversation=True)
+            self.session.ask(question, on_text=lambda text: self.events.put(("text", text)))
+            self.events.put(("answer", None))
+        except (requests.RequestException, OSError, IOError, ValueError, KeyError) as e:
+            self.logger.exception(f"Follow-up query failed: {str(e)}")
+            self.events.put(("answer", e))
+
+    def run_gui(self, run_job):
+        """
+        Shows the GUI until it is closed. run_job(api_key, input_paths, timestamp_dir, query, processing_mode,
+        progress=..., cancel=...) is run on a worker thread once processing is started and
+        returns the combined OCR file. Returns the case directory; an error from the job is re-raised.
+        """
         self.root = tk.Tk()
         self.root.title("Case Cracker")
-        self.root.geometry("600x400")
+        self.root.geometry("700x560")
 
         # Set up temporary directory and pdf_paths_file
         self.setup_temp_dir()
@@ -90,13 +154,11 @@ class CaseCrackerGUI:
                     messagebox.showerror("Error", "API key cannot be empty.", parent=self.root)
                     return
                 try:
-                    headers = {"Authorization": f"Bearer {key}"}
-                    response = requests.post(API_URL, headers=headers, json={
-                        "model": "grok-3-fast-latest",
+                    get_client(key).chat({
+                        "model": ANALYSIS_MODEL,
                         "messages": [{"role": "user", "content": "Test"}],
                         "temperature": 0.01
-                    }, timeout=TIMEOUT)
-                    response.raise_for_status()
+                    })
                     with open(API_KEY_FILE, "w") as f:
                         f.write(key)
                     self.api_key = key
@@ -182,7 +244,22 @@ class CaseCrackerGUI:
                     messagebox.showerror("Error", f"File picker error: {str(e)}", parent=self.root)
                     self.logger.error(f"File picker error: {str(e)}")
 
+            def select_input_folder():
+                self.logger.debug(f"Opening folder picker, current input_paths: {self.input_paths}")
+                if self.processing_mode == "analyze_only":
+                    messagebox.showerror("Error", "Please select a single .txt file for 'Analyze Only' mode.", parent=self.root)
+                    return
+                folder = filedialog.askdirectory(title="Select Folder of Files to Process", parent=self.root)
+                if not folder:
+                    return
+                # Expanded (recursively) and de-duplicated when the job starts
+                self.input_paths = [folder]
+                input_display.config(text=f"Selected: {folder} (all subfolders)")
+                self.logger.debug(f"Updated input_paths: {self.input_paths}")
+                notebook.select(3)
+
             ttk.Button(input_frame, text="Select Files", command=select_input_files).pack(pady=10)
+            ttk.Button(input_frame, text="Select Folder", command=select_input_folder).pack(pady=5)
 
             # Save Location Tab (Index 3)
             save_frame = ttk.Frame(notebook)
@@ -205,7 +282,7 @@ class CaseCrackerGUI:
                         notebook.select(2)
                         return
                 else:
-                    if not all(p.lower().endswith(('.pdf', '.jpeg', '.jpg', '.png')) for p in self.input_paths):
+                    if not all(os.path.isdir(p) or p.lower().endswith(OCR_EXTENSIONS) for p in self.input_paths):
                         messagebox.showerror("Error", "Please select only PDF, JPEG, JPG, or PNG files for OCR modes.", parent=self.root)
                         self.input_paths = []
                         input_display.config(text="Selected: None")
@@ -215,13 +292,7 @@ class CaseCrackerGUI:
                 if not save_dir:
                     save_dir = os.path.expanduser("~/Desktop/CaseCracker/")
                     messagebox.showinfo("Info", f"No directory selected. Using default: {save_dir}", parent=self.root)
-                os.makedirs(save_dir, exist_ok=True)
-                timestamp = datetime.now().strftime("%Y%m%d%H%M")
-                timestamp_dir = os.path.join(save_dir, timestamp)
-                os.makedirs(timestamp_dir, exist_ok=True)
-                for subdir in ["JPEG", "OCR", "ANALYSIS", "QUARRY", "logs"]:
-                    os.makedirs(os.path.join(timestamp_dir, subdir), exist_ok=True)
-                self.save_dir = timestamp_dir
+                self.save_dir = create_case_dir(save_dir)
                 save_display.config(text=f"Selected: {self.save_dir}")
                 self.logger.debug(f"Selected save location: {self.save_dir}")
                 notebook.select(4)
@@ -249,11 +320,136 @@ class CaseCrackerGUI:
                     messagebox.showerror("Error", "No files selected. Please select at least one file.", parent=self.root)
                     self.logger.debug(f"No files selected: input_paths={self.input_paths}")
                     return
+                if self.worker is not None:
+                    notebook.select(5)
+                    return
                 self.logger.debug(f"Starting processing with input_paths: {self.input_paths}")
-                self.root.quit()
+                config = (self.api_key, list(self.input_paths), self.save_dir, self.query, self.processing_mode)
+                self.worker = threading.Thread(target=self._run_job, args=(run_job, config), name="casecracker-worker")
+                self.worker.start()
+                status_label.config(text="Starting...")
+                cancel_button.config(state=tk.NORMAL)
+                notebook.select(5)
 
             ttk.Button(query_frame, text="Start Processing", command=start_processing).pack(pady=10)
 
+            # Run Tab (Index 5)
+            run_frame = ttk.Frame(notebook)
+            notebook.add(run_frame, text="Run")
+            status_label = ttk.Label(run_frame, text="Not started")
+            status_label.pack(pady=5)
+            progress_bar = ttk.Progressbar(run_frame, length=500, mode="determinate")
+            progress_bar.pack(pady=5)
+            rate_label = ttk.Label(run_frame, text="")
+            rate_label.pack(pady=5)
+            answer_text = tk.Text(run_frame, height=14, width=80, wrap=tk.WORD, state=tk.DISABLED)
+            question_frame = ttk.Frame(run_frame)
+            question_entry = ttk.Entry(question_frame, width=60, state=tk.DISABLED)
+            rate_start = []
+
+            def cancel_run():
+                self.logger.info("Cancel requested")
+                self.cancel_event.set()
+                cancel_button.config(state=tk.DISABLED)
+                status_label.config(text="Cancelling after the pages in progress...")
+
+            cancel_button = ttk.Button(run_frame, text="Cancel", command=cancel_run, state=tk.DISABLED)
+            cancel_button.pack(pady=5)
+
+            def append_answer(text):
+                answer_text.config(state=tk.NORMAL)
+                answer_text.insert(tk.END, text)
+                answer_text.see(tk.END)
+                answer_text.config(state=tk.DISABLED)
+
+            def ask_followup(event=None):
+                question = question_entry.get().strip()
+                if not question or (self.followup_worker is not None and self.followup_worker.is_alive()):
+                    return
+                question_entry.delete(0, tk.END)
+                ask_button.config(state=tk.DISABLED)
+                append_answer(f"Q: {question}\nA: ")
+                self.followup_worker = threading.Thread(target=self._ask, args=(question,), name="casecracker-followup")
+                self.followup_worker.start()
+
+            ask_button = ttk.Button(question_frame, text="Ask", command=ask_followup, state=tk.DISABLED)
+            question_entry.bind("<Return>", ask_followup)
+            question_entry.pack(side=tk.LEFT, padx=5)
+            ask_button.pack(side=tk.LEFT)
+            question_frame.pack(pady=5)
+            answer_text.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
+
+            def show_progress(stage, done, total):
+                if stage == "analysis":
+                    rate_label.config(text="")
+                    if done < total:
+                        status_label.config(text="Analyzing the OCR text...")
+                        progress_bar.config(mode="indeterminate")
+                        progress_bar.start(POLL_INTERVAL_MS)
+                    else:
+                        progress_bar.stop()
+                        progress_bar.config(mode="determinate", maximum=1, value=1)
+                    return
+                progress_bar.config(mode="determinate", maximum=max(1, total), value=done)
+                status_label.config(text=f"OCR: {done} of {total} pages")
+                now = time.monotonic()
+                if not rate_start:
+                    # Pages already done when the run starts (resumed, text layer) don't count towards the rate
+                    rate_start.extend([now, done])
+                    return
+                elapsed, pages = now - rate_start[0], done - rate_start[1]
+                if elapsed > 0 and pages > 0:
+                    rate = pages / elapsed
+                    rate_label.config(text=f"{rate * 60:.1f} pages/min, about {format_duration((total - done) / rate)} left")
+
+            def finish_run(text):
+                status_label.config(text=text)
+                cancel_button.config(state=tk.DISABLED)
+                if self.close_requested:
+                    self.root.quit()
+
+            def poll_events():
+                try:
+                    while True:
+                        event = self.events.get_nowait()
+                        kind = event[0]
+                        if kind == "progress":
+                            show_progress(*event[1:])
+                        elif kind == "done":
+                            self.combined_ocr_file = event[1]
+                            finish_run(f"Processing complete. Results saved to: {self.save_dir}")
+                            if self.processing_mode != "ocr_only" and not self.close_requested:
+                                question_entry.config(state=tk.NORMAL)
+                                ask_button.config(state=tk.NORMAL)
+                                append_answer("Ask follow-up questions about the case below.\n\n")
+                        elif kind == "cancelled":
+                            finish_run(f"Cancelled. Finished pages are saved in: {self.save_dir}")
+                        elif kind == "error":
+                            self.error = event[1]
+                            finish_run("Processing failed")
+                            if not self.close_requested:
+                                messagebox.showerror("Error", error_message(event[1]), parent=self.root)
+                        elif kind == "text":
+                            append_answer(event[1])
+                        elif kind == "answer":
+                            append_answer("\n\n" if event[1] is None else f"\n[Follow-up failed: {str(event[1])}]\n\n")
+                            ask_button.config(state=tk.NORMAL)
+                except queue.Empty:
+                    pass
+                self.root.after(POLL_INTERVAL_MS, poll_events)
+
+            def on_close():
+                if self.worker is not None and self.worker.is_alive():
+                    if not messagebox.askyesno("Cancel Run", "Processing is still running. Cancel it and close?", parent=self.root):
+                        return
+                    self.close_requested = True
+                    cancel_run()
+                    return
+                self.root.quit()
+
+            self.root.protocol("WM_DELETE_WINDOW", on_close)
+            self.root.after(POLL_INTERVAL_MS, poll_events)
+
             # Save input_paths before mainloop
             self.save_input_paths()
 
@@ -265,18 +461,19 @@ class CaseCrackerGUI:
             self.restore_input_paths()
 
             self.logger.debug(f"Post-mainloop validation, input_paths: {self.input_paths}")
-            if not (self.api_key and self.save_dir):
-                raise ValueError("Incomplete configuration")
-            if len(self.input_paths) == 0:
-                raise ValueError("No files selected")
-            self.logger.debug(f"Returning from GUI: input_paths={self.input_paths}")
-            try:
-                input_dir = os.path.dirname(self.input_paths[0])
-            except IndexError:
-                self.logger.error(f"IndexError in input_dir calculation, input_paths: {self.input_paths}")
-                raise ValueError("No files selected after validation")
-            input_files = [os.path.basename(p) for p in self.input_paths]
-            return self.api_key, input_dir, input_files, self.save_dir, self.query, self.processing_mode
+            if self.worker is None:
+                if not (self.api_key and self.save_dir):
+                    raise ValueError("Incomplete configuration")
+                raise ValueError("Closed before processing was started")
+            # The worker stops at the next page boundary once cancelled
+            self.cancel_event.set()
+            self.worker.join()
+            if self.followup_worker is not None:
+                self.followup_worker.join()
+            if self.error is not None:
+                raise self.error
+            self.logger.debug(f"Returning from GUI: save_dir={self.save_dir}")
+            return self.save_dir
 
         except requests.RequestException as e:
             self.logger.exception(f"API request error: {str(e)}")
@@ -291,6 +488,8 @@ class CaseCrackerGUI:
             self.logger.exception(f"Unexpected error: {str(e)}")
             raise
         finally:
+            if self.session is not None:
+                self.session.close()
             if self.root and self.root.winfo_exists():
                 self.logger.debug("Closing GUI")
                 self.root.quit()
@@ -0,0 +1,117 @@
+# image_optimizer.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import base64
+import io
+import logging
+from utils import OCR_IMAGE_TARGET_BYTES, OCR_IMAGE_MIN_LONG_EDGE
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the optimizer's output changes, since it is part of the OCR cache key
+OPTIMIZER_VERSION = 1
+
+# Pixels darker than this count as ink when cropping margins
+INK_THRESHOLD = 235
+# Padding kept around the detected content, in pixels
+CROP_PADDING = 16
+# A page is treated as colour when more than this fraction of pixels has visible chroma
+COLOR_PIXEL_FRACTION = 0.002
+COLOR_CHROMA = 40
+# A grayscale page is bilevel (typed text) when fewer than this fraction of pixels are mid-tones
+MIDTONE_FRACTION = 0.06
+# JPEG qualities tried, in order, before the page is scaled down
+JPEG_QUALITIES = (85, 75, 65, 55)
+SCALE_STEP = 0.85
+
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+
+def to_data_url(image_bytes, mime):
+    return f"data:{mime};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+
+def _content_bbox(gray, width, height):
+    ink = gray.point(lambda p: 255 if p < INK_THRESHOLD else 0)
+    bbox = ink.getbbox()
+    if not bbox:
+        return None
+    left, top, right, bottom = bbox
+    return (max(0, left - CROP_PADDING), max(0, top - CROP_PADDING),
+            min(width, right + CROP_PADDING), min(height, bottom + CROP_PADDING))
+
+def _has_color(rgb):
+    from PIL import ImageChops
+    thumb = rgb.copy()
+    thumb.thumbnail((256, 256))
+    r, g, b = thumb.split()
+    chroma = ImageChops.lighter(ImageChops.lighter(ImageChops.difference(r, g), ImageChops.difference(g, b)),
+                                ImageChops.difference(r, b))
+    histogram = chroma.histogram()
+    colored = sum(histogram[COLOR_CHROMA:])
+    return colored > COLOR_PIXEL_FRACTION * thumb.width * thumb.height
+
+def _is_bilevel(gray):
+    histogram = gray.histogram()
+    midtones = sum(histogram[64:192])
+    return midtones < MIDTONE_FRACTION * gray.width * gray.height
+
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+def optimize_image(image_bytes, target_bytes=OCR_IMAGE_TARGET_BYTES, min_long_edge=OCR_IMAGE_MIN_LONG_EDGE):
+    """
+    Shrinks a page image before vision upload: crops blank margins, drops colour from pages without
+    colour content (bilevel PNG for clean black-and-white text, grayscale JPEG otherwise), then lowers
+    JPEG quality and, if needed, resolution until the page fits in target_bytes. The long edge is never
+    scaled below min_long_edge so small print stays legible. The original is kept if it is already smaller.
+    Returns (bytes, mime type, settings dict).
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        original_mime = MIME_TYPES.get(source.format, "image/jpeg")
+        rgb = source.convert("RGB")
+    gray = rgb.convert("L")
+    settings = {"original_bytes": len(image_bytes), "original_size": list(rgb.size)}
+
+    bbox = _content_bbox(gray, rgb.width, rgb.height)
+    if bbox and bbox != (0, 0, rgb.width, rgb.height):
+        rgb = rgb.crop(bbox)
+        gray = gray.crop(bbox)
+        settings["crop"] = list(bbox)
+
+    if _has_color(rgb):
+        work, settings["mode"] = rgb, "color"
+    else:
+        work, settings["mode"] = gray, "gray"
+        if _is_bilevel(gray):
+            data = _encode(gray.point(lambda p: 255 if p > 160 else 0).convert("1"), "PNG", optimize=True)
+            if len(data) <= target_bytes:
+                settings.update(mode="bilevel", size=list(gray.size), bytes=len(data))
+                return _keep_smaller(image_bytes, original_mime, data, "image/png", settings)
+
+    best = None
+    scale = 1.0
+    while True:
+        size = (max(1, int(work.width * scale)), max(1, int(work.height * scale)))
+        resized = work if scale == 1.0 else work.resize(size, Image.LANCZOS)
+        for quality in JPEG_QUALITIES:
+            data = _encode(resized, "JPEG", quality=quality, optimize=True)
+            if best is None or len(data) < len(best[0]):
+                best = (data, quality, size)
+            if len(data) <= target_bytes:
+                settings.update(quality=quality, size=list(size), bytes=len(data))
+                return _keep_smaller(image_bytes, original_mime, data, "image/jpeg", settings)
+        if max(work.width, work.height) * scale * SCALE_STEP < min_long_edge:
+            break
+        scale *= SCALE_STEP
+    data, quality, size = best
+    settings.update(quality=quality, size=list(size), bytes=len(data), over_target=True)
+    return _keep_smaller(image_bytes, original_mime, data, "image/jpeg", settings)
+
+def _keep_smaller(original, original_mime, data, mime, settings):
+    if len(data) >= len(original):
+        settings.update(kept_original=True, bytes=len(original))
+        return original, original_mime, settings
+    return data, mime, settings
@@ -0,0 +1,152 @@
+# inputs.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from utils import INPUT_WORKERS, INPUTS_INDEX, OCR_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+# Bytes hashed first to tell same-sized files apart before reading them in full
+HEAD_BYTES = 64 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
+# Case subdirectory holding links to the inputs when they come from more than one directory
+STAGING_DIR = "INPUT"
+
+def _scan_dir(directory, extensions):
+    files, subdirs = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            # Symlinked directories are not followed, so a link loop can't make the walk endless
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_file() and entry.name.lower().endswith(extensions):
+                files.append(entry.path)
+    return files, subdirs
+
+def discover_files(directory, extensions=OCR_EXTENSIONS, recursive=True, workers=INPUT_WORKERS):
+    """
+    Lists the files with the given extensions in directory, and with recursive in all its subdirectories.
+    Directories are scanned concurrently, which matters on network shares where every listing is a round trip.
+    Returns sorted absolute paths.
+    """
+    found = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {executor.submit(_scan_dir, os.path.abspath(directory), extensions)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    files, subdirs = future.result()
+                except OSError as e:
+                    logger.warning(f"Skipping unreadable directory: {str(e)}")
+                    continue
+                found.extend(files)
+                if recursive:
+                    pending.update(executor.submit(_scan_dir, subdir, extensions) for subdir in subdirs)
+    return sorted(found)
+
+def file_digest(path, limit=None):
+    """BLAKE2b of the file's contents, or of its first limit bytes."""
+    digest = hashlib.blake2b(digest_size=32)
+    remaining = limit
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(HASH_CHUNK_BYTES if remaining is None else min(HASH_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+def _split_by(paths, key, executor):
+    """Groups paths by key(path), computed concurrently; returns {key: paths} for keys shared by several paths."""
+    groups = {}
+    for path, value in zip(paths, executor.map(key, paths)):
+        groups.setdefault(value, []).append(path)
+    return {value: group for value, group in groups.items() if len(group) > 1}
+
+def find_duplicates(paths, workers=INPUT_WORKERS):
+    """
+    Groups byte-identical files. Only files that share a size are read; of those, only files that also share
+    their first HEAD_BYTES are hashed in full. Returns {path: digest} for every file that has a duplicate.
+    """
+    by_size = {}
+    for path in paths:
+        by_size.setdefault(os.path.getsize(path), []).append(path)
+    digests = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for same_size in (group for group in by_size.values() if len(group) > 1):
+            for same_head in _split_by(same_size, lambda path: file_digest(path, HEAD_BYTES), executor).values():
+                for digest, identical in _split_by(same_head, file_digest, executor).items():
+                    digests.update((path, digest) for path in identical)
+    return digests
+
+def _link(source, target):
+    """Symlink, else hard link, else copy, whichever the filesystem allows."""
+    for make_link in (os.symlink, os.link):
+        try:
+            make_link(source, target)
+            return
+        except (OSError, NotImplementedError):
+            continue
+    shutil.copy2(source, target)
+
+def prepare_inputs(input_paths, case_dir, workers=INPUT_WORKERS):
+    """
+    Turns input file paths into (input_dir, file names) for process_pdfs. Byte-identical files are kept once,
+    under the first path in sorted order. When the files come from several directories, each one is linked
+    into the case's INPUT directory under a name built from its path relative to the common parent, so names
+    from different folders can't collide. OCR/inputs.json records every original path of every document.
+    """
+    paths = sorted(dict.fromkeys(os.path.abspath(path) for path in input_paths))
+    digests = find_duplicates(paths, workers)
+    unique = {}
+    for path in paths:
+        unique.setdefault(digests.get(path, path), []).append(path)
+    documents = list(unique.values())
+    skipped = len(paths) - len(documents)
+    if skipped:
+        logger.info(f"Skipping {skipped} duplicate input files; each is processed once under its first path")
+        for document in documents:
+            if len(document) > 1:
+                logger.debug(f"{document[0]} is identical to {document[1:]}")
+
+    directories = {os.path.dirname(document[0]) for document in documents}
+    if len(directories) == 1:
+        input_dir = directories.pop()
+        names = [os.path.basename(document[0]) for document in documents]
+    else:
+        input_dir = os.path.join(case_dir, STAGING_DIR)
+        os.makedirs(input_dir, exist_ok=True)
+        root = os.path.commonpath(list(directories))
+        names = []
+        taken = set()
+        for document in documents:
+            name = os.path.relpath(document[0], root).replace(os.sep, "_")
+            # Prefixed, so a -part_N_of_M suffix still ends the name
+            counter = 2
+            base = name
+            while name in taken:
+                name = f"{counter}_{base}"
+                counter += 1
+            target = os.path.join(input_dir, name)
+            if os.path.lexists(target):
+                # Left by an earlier run of this case; the inputs may have changed since
+                os.remove(target)
+            _link(document[0], target)
+            taken.add(name)
+            names.append(name)
+        logger.info(f"Inputs from {len(directories)} directories are linked into {input_dir}")
+
+    index = [{"name": name, "paths": document} for name, document in zip(names, documents)]
+    with open(os.path.join(case_dir, "OCR", INPUTS_INDEX), "w", encoding='utf-8') as f:
+        json.dump({"input_dir": input_dir, "files": index}, f, indent=2)
+    return input_dir, names
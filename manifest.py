@@ -0,0 +1,155 @@
+# manifest.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.sqlite"
+
+# Page states
+RASTERIZED = "rasterized"
+OCR_DONE = "ocr_done"
+FAILED = "failed"
+
+class JobManifest:
+    """
+    Transactional per-file and per-page record of a case's OCR progress, stored as SQLite in the OCR directory.
+    An interrupted run resumes at the first page that is not OCR'd, and the combined output is rebuilt from it.
+    """
+    def __init__(self, ocr_dir):
+        self.path = os.path.join(ocr_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "file_key TEXT PRIMARY KEY, group_name TEXT NOT NULL, page_count INTEGER, "
+                "state TEXT NOT NULL DEFAULT 'pending', updated REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "file_key TEXT NOT NULL, page_num INTEGER NOT NULL, state TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, jpeg_path TEXT, text TEXT, error TEXT, updated REAL NOT NULL, "
+                "PRIMARY KEY (file_key, page_num))"
+            )
+        logger.debug(f"Job manifest opened: {self.path}")
+
+    def register_file(self, file_key, group_name):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO files (file_key, group_name, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(file_key) DO UPDATE SET group_name = excluded.group_name",
+                (file_key, group_name, time.time())
+            )
+
+    def set_page_count(self, file_key, page_count):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE files SET page_count = ?, updated = ? WHERE file_key = ?",
+                               (page_count, time.time(), file_key))
+
+    def mark_rasterized(self, file_key, page_num, jpeg_path):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO pages (file_key, page_num, state, jpeg_path, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(file_key, page_num) DO UPDATE SET state = excluded.state, "
+                "jpeg_path = excluded.jpeg_path, updated = excluded.updated",
+                (file_key, page_num, RASTERIZED, jpeg_path, time.time())
+            )
+
+    def record_page(self, file_key, page_num, text, error=None):
+        """Records the outcome of one OCR attempt; failed pages keep their error marker text and are retried next run."""
+        state = FAILED if error else OCR_DONE
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO pages (file_key, page_num, state, attempts, text, error, updated) VALUES (?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT(file_key, page_num) DO UPDATE SET state = excluded.state, attempts = attempts + 1, "
+                "text = excluded.text, error = excluded.error, updated = excluded.updated",
+                (file_key, page_num, state, text, error, time.time())
+            )
+
+    def pending_pages(self, file_key, page_count):
+        """Returns the page numbers of file_key that are not OCR'd yet, in order."""
+        with self._lock:
+            done = {row[0] for row in self._conn.execute(
+                "SELECT page_num FROM pages WHERE file_key = ? AND state = ?", (file_key, OCR_DONE))}
+        return [page_num for page_num in range(1, page_count + 1) if page_num not in done]
+
+    def complete_file(self, file_key):
+        """Marks file_key done when every page is OCR'd; returns whether it is."""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT f.page_count, COUNT(p.page_num) FROM files f "
+                "LEFT JOIN pages p ON p.file_key = f.file_key AND p.state = ? WHERE f.file_key = ?",
+                (OCR_DONE, file_key)
+            ).fetchone()
+            done = row is not None and row[0] is not None and row[1] >= row[0]
+            self._conn.execute("UPDATE files SET state = ?, updated = ? WHERE file_key = ?",
+                               ("done" if done else "pending", time.time(), file_key))
+        return done
+
+    def fail_file(self, file_key):
+        """Marks file_key failed as a whole (e.g. a PDF that can't be read); it is retried on the next run."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE files SET state = ?, updated = ? WHERE file_key = ?",
+                               (FAILED, time.time(), file_key))
+
+    def is_file_done(self, file_key):
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM files WHERE file_key = ?", (file_key,)).fetchone()
+        return row is not None and row[0] == "done"
+
+    def completed_groups(self):
+        """Returns the names of groups whose files are all done."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT group_name FROM files GROUP BY group_name HAVING SUM(state != 'done') = 0").fetchall()
+        return {row[0] for row in rows}
+
+    def document_pages(self, file_key):
+        """Returns [(page_num, text), ...] for file_key in page order, including failed-page markers."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT page_num, text FROM pages WHERE file_key = ? AND text IS NOT NULL ORDER BY page_num",
+                (file_key,)).fetchall()
+
+    def document_text(self, file_key):
+        """Returns the OCR text of file_key with pages joined in order, including failed-page markers."""
+        return "\n\n--- Page Break ---\n\n".join(text for _, text in self.document_pages(file_key))
+
+    def iter_documents(self):
+        """Yields (group_name, file_key) for every file with OCR text, in the order files were registered."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT group_name, file_key FROM files WHERE EXISTS "
+                "(SELECT 1 FROM pages p WHERE p.file_key = files.file_key AND p.text IS NOT NULL) ORDER BY rowid").fetchall()
+        for group_name, file_key in rows:
+            yield group_name, file_key
+
+    def page_images(self, file_key):
+        """Returns [(page_num, state, jpeg_path), ...] for the rasterized pages of file_key."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT page_num, state, jpeg_path FROM pages WHERE file_key = ? AND jpeg_path IS NOT NULL ORDER BY page_num",
+                (file_key,)).fetchall()
+
+    def failures(self):
+        """Returns (failed files, failed pages): files that could not be read and pages whose last OCR attempt failed."""
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files WHERE state = ?", (FAILED,)).fetchone()[0]
+            pages = self._conn.execute("SELECT COUNT(*) FROM pages WHERE state = ?", (FAILED,)).fetchone()[0]
+        return files, pages
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*), SUM(attempts) FROM pages GROUP BY state").fetchall()
+        return {state: {"pages": count, "attempts": attempts or 0} for state, count, attempts in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
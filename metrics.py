@@ -0,0 +1,167 @@
+# metrics.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from utils import METRICS_FILE, METRICS_TEXTFILE, MODEL_PRICES
+
+logger = logging.getLogger(__name__)
+
+def _percentile(values, p):
+    return round(values[min(len(values) - 1, int(p * len(values)))], 3)
+
+class RunMetrics:
+    """
+    Thread-safe counters for one case: wall time per pipeline stage, every HTTP attempt (latency,
+    status, bytes), retries, pages by outcome, and prompt/completion tokens per model from each
+    response's usage block. Saved as metrics.json in the case directory and, when METRICS_TEXTFILE is
+    set, as a Prometheus textfile-collector file rewritten on every save.
+    """
+    def __init__(self, case_dir=None):
+        self.case_dir = case_dir
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.latencies = []
+        self.requests = {"attempts": 0, "retries": 0, "errors": 0, "bytes_sent": 0, "bytes_received": 0, "statuses": {}}
+        self.tokens = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Times a block of work under a stage name; nested and repeated stages add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_request(self, latency, status, bytes_sent=0, retry=False):
+        with self._lock:
+            self.latencies.append(latency)
+            self.requests["attempts"] += 1
+            self.requests["bytes_sent"] += bytes_sent
+            self.requests["statuses"][str(status)] = self.requests["statuses"].get(str(status), 0) + 1
+            if retry:
+                self.requests["retries"] += 1
+            if not isinstance(status, int) or status >= 400:
+                self.requests["errors"] += 1
+
+    def record_response(self, model, usage, bytes_received=0):
+        with self._lock:
+            self.requests["bytes_received"] += bytes_received
+            entry = self.tokens.setdefault(model or "unknown", {"responses": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            entry["responses"] += 1
+            for key in ("prompt_tokens", "completion_tokens"):
+                if isinstance((usage or {}).get(key), int):
+                    entry[key] += usage[key]
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            data = {
+                "case_dir": self.case_dir,
+                "started": self.started,
+                "elapsed": round(time.time() - self.started, 3),
+                "stages": {name: {"count": entry["count"], "seconds": round(entry["seconds"], 3)}
+                           for name, entry in self.stages.items()},
+                "counters": dict(self.counters),
+                "requests": json.loads(json.dumps(self.requests)),
+                "tokens": json.loads(json.dumps(self.tokens))
+            }
+        if latencies:
+            data["requests"]["latency"] = {
+                "mean": round(sum(latencies) / len(latencies), 3),
+                "p50": _percentile(latencies, 0.50),
+                "p95": _percentile(latencies, 0.95),
+                "max": round(latencies[-1], 3)
+            }
+        total_cost = 0.0
+        for model, entry in data["tokens"].items():
+            prices = MODEL_PRICES.get(model)
+            if prices:
+                entry["cost_usd"] = round((entry["prompt_tokens"] * prices[0] + entry["completion_tokens"] * prices[1]) / 1e6, 4)
+                total_cost += entry["cost_usd"]
+        if MODEL_PRICES:
+            data["cost_usd"] = round(total_cost, 4)
+        return data
+
+    def save(self):
+        """Writes metrics.json to the case directory and refreshes the Prometheus textfile, if configured."""
+        data = self.snapshot()
+        try:
+            if self.case_dir:
+                _write_atomic(os.path.join(self.case_dir, METRICS_FILE), json.dumps(data, indent=2))
+            if METRICS_TEXTFILE:
+                _write_atomic(METRICS_TEXTFILE, to_prometheus(data))
+        except (OSError, IOError) as e:
+            logger.warning(f"Could not save metrics: {str(e)}")
+        return data
+
+def _write_atomic(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def to_prometheus(data):
+    """Formats a metrics snapshot in the Prometheus text exposition format, labelled by case."""
+    case = f'case="{_label(os.path.basename(data["case_dir"] or ""))}"'
+    lines = [
+        "# TYPE casecracker_stage_seconds counter",
+        *(f'casecracker_stage_seconds{{{case},stage="{_label(name)}"}} {entry["seconds"]}'
+          for name, entry in data["stages"].items()),
+        "# TYPE casecracker_processed_total counter",
+        *(f'casecracker_processed_total{{{case},kind="{_label(name)}"}} {value}'
+          for name, value in data["counters"].items()),
+        "# TYPE casecracker_api_requests_total counter",
+        *(f'casecracker_api_requests_total{{{case},status="{_label(status)}"}} {value}'
+          for status, value in data["requests"]["statuses"].items()),
+        "# TYPE casecracker_api_retries_total counter",
+        f'casecracker_api_retries_total{{{case}}} {data["requests"]["retries"]}',
+        "# TYPE casecracker_api_bytes_total counter",
+        f'casecracker_api_bytes_total{{{case},direction="sent"}} {data["requests"]["bytes_sent"]}',
+        f'casecracker_api_bytes_total{{{case},direction="received"}} {data["requests"]["bytes_received"]}',
+        "# TYPE casecracker_tokens_total counter"
+    ]
+    for model, entry in data["tokens"].items():
+        for kind in ("prompt", "completion"):
+            lines.append(f'casecracker_tokens_total{{{case},model="{_label(model)}",kind="{kind}"}} {entry[f"{kind}_tokens"]}')
+    latency = data["requests"].get("latency")
+    if latency:
+        lines.append("# TYPE casecracker_api_latency_seconds gauge")
+        lines.extend(f'casecracker_api_latency_seconds{{{case},stat="{stat}"}} {value}' for stat, value in latency.items())
+    return "\n".join(lines) + "\n"
+
+_active = RunMetrics()
+_active_lock = threading.Lock()
+
+def begin_case(case_dir):
+    """Makes case_dir the case that metrics are recorded for, and returns its metrics."""
+    global _active
+    case_dir = os.path.abspath(case_dir)
+    with _active_lock:
+        if _active.case_dir != case_dir:
+            _active = RunMetrics(case_dir)
+        return _active
+
+def get_metrics():
+    """Returns the metrics of the active case (an unsaved collector if no case has started)."""
+    return _active
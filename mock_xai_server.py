@@ -0,0 +1,181 @@
+# mock_xai_server.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+WORDS = ("the defendant witness report evidence payment account transfer meeting statement agent officer "
+         "invoice contract signature date exhibit record company property vehicle phone call").split()
+
+class MockXAIServer:
+    """
+    Local stand-in for the xAI chat-completions endpoint, for benchmarks and offline testing.
+    Answers every POST after `latency` seconds (+/- `jitter`) with `response_chars` characters of text,
+    fails a random `error_rate` fraction of requests with 500, and after every `burst_every` requests
+    answers the next `burst_length` with 429 and a Retry-After of `retry_after` seconds.
+    Streaming requests are answered with a server-sent event stream of `stream_chunk_chars` deltas, or,
+    with `canned_stream`, by replaying those raw SSE bytes verbatim in `stream_chunk_chars`-byte pieces.
+    Point the app at it by setting XAI_API_URL to `url` before importing it.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, jitter=0.05, error_rate=0.0, burst_every=0,
+                 burst_length=0, retry_after=0, response_chars=2000, stream_chunk_chars=16, canned_stream=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.response_chars = response_chars
+        self.stream_chunk_chars = stream_chunk_chars
+        self.canned_stream = canned_stream
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "bytes_received": 0, "bytes_sent": 0, "errors": 0, "throttled": 0, "streams": 0}
+        self._lock = threading.Lock()
+        self._burst_left = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Mock xAI server listening on {self.url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def _decide(self, body_bytes):
+        """Returns the status code for the next request and updates the counters."""
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["bytes_received"] += body_bytes
+            if self._burst_left:
+                self._burst_left -= 1
+                self.stats["throttled"] += 1
+                return 429
+            if self.burst_every and self.burst_length and self.stats["requests"] % self.burst_every == 0:
+                self._burst_left = self.burst_length - 1
+                self.stats["throttled"] += 1
+                return 429
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500
+            return 200
+
+    def _text(self):
+        """Returns random words exactly response_chars long."""
+        words = []
+        length = -1  # No separator before the first word
+        while length < self.response_chars:
+            word = self.random.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)[:self.response_chars]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _send(self, status, body, content_type="application/json", headers=None):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                with server._lock:
+                    server.stats["bytes_sent"] += len(data)
+
+            def _chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+                with server._lock:
+                    server.stats["bytes_sent"] += len(data)
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status = server._decide(len(raw))
+                time.sleep(max(0.0, server.latency + server.random.uniform(-server.jitter, server.jitter)))
+                if status == 429:
+                    self._send(429, json.dumps({"error": "rate limited"}), headers={"Retry-After": str(server.retry_after)})
+                    return
+                if status != 200:
+                    self._send(status, json.dumps({"error": "mock server error"}))
+                    return
+                try:
+                    payload = json.loads(raw)
+                except ValueError:
+                    self._send(400, json.dumps({"error": "invalid JSON"}))
+                    return
+                images = sum(1 for message in payload.get("messages", []) if isinstance(message.get("content"), list)
+                             for part in message["content"] if part.get("type") == "image_url")
+                if images > 1:
+                    # Batched OCR: one delimited text per page image
+                    text = "\n".join(f"=== PAGE {n} ===\n{server._text()}" for n in range(1, images + 1))
+                else:
+                    text = server._text()
+                usage = {"prompt_tokens": max(1, len(raw) // 4), "completion_tokens": max(1, len(text) // 4)}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                model = payload.get("model", "mock")
+                if not payload.get("stream"):
+                    self._send(200, json.dumps({
+                        "id": "mock", "object": "chat.completion", "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": usage
+                    }))
+                    return
+                with server._lock:
+                    server.stats["streams"] += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                step = max(1, server.stream_chunk_chars)
+                if server.canned_stream is not None:
+                    # Pieces may end inside a multi-byte character, as they can on a real connection
+                    for start in range(0, len(server.canned_stream), step):
+                        self._chunk(server.canned_stream[start:start + step])
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                    return
+                for start in range(0, len(text), step):
+                    event = {"id": "mock", "model": model,
+                             "choices": [{"index": 0, "delta": {"content": text[start:start + step]}}]}
+                    self._chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                final = {"id": "mock", "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                         "usage": usage}
+                self._chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
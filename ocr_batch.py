@@ -0,0 +1,97 @@
+# ocr_batch.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import logging
+import re
+import threading
+from utils import OCR_BATCH_MAX_PAGES, OCR_BATCH_MAX_BYTES, OCR_BATCH_MAX_OUTPUT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Starting guess for OCR output tokens per KB of page image, refined from every response
+TOKENS_PER_KB_PRIOR = 4.0
+# Weight of the newest observation in the running estimate
+OBSERVATION_WEIGHT = 0.2
+# Base64 inflates the image bytes in the JSON payload
+BASE64_OVERHEAD = 4 / 3
+
+PAGE_MARKER = re.compile(r"^[ \t]*=== PAGE (\d+) ===[ \t]*$", re.MULTILINE)
+
+def batch_prompt(count):
+    return (f"You are given {count} page images. Perform OCR on each image and extract its raw text. "
+            f"Output every page in the order given, each starting with a line of the form \"=== PAGE n ===\" "
+            f"(n from 1 to {count}) followed by that page's text. Output nothing else.")
+
+# Stands in for the batch prompt in cache keys of batched pages, so rewording the prompt invalidates them
+BATCH_CACHE_PROMPT = batch_prompt("N")
+
+def split_batch_text(text, count):
+    """
+    Splits a batched OCR response into per-page texts. Returns None unless exactly pages 1..count are
+    present, in order, so a garbled response falls back to single-page calls.
+    """
+    markers = list(PAGE_MARKER.finditer(text))
+    if [int(m.group(1)) for m in markers] != list(range(1, count + 1)):
+        return None
+    if text[:markers[0].start()].strip():
+        return None
+    pages = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        pages.append(text[marker.end():end].strip("\n"))
+    return pages
+
+class BatchPacker:
+    """
+    Groups short pages of a document into multi-image OCR requests. A batch is closed when another page
+    would exceed max_pages, the payload byte cap, or the expected output token budget. Expected output
+    is estimated from each page's image size with a tokens-per-KB ratio learned from earlier responses,
+    so text-heavy documents get smaller batches. Pages expected to need half the budget or more go alone.
+    """
+    def __init__(self, max_pages=OCR_BATCH_MAX_PAGES, max_bytes=OCR_BATCH_MAX_BYTES, max_output_tokens=OCR_BATCH_MAX_OUTPUT_TOKENS):
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_output_tokens = max_output_tokens
+        self.tokens_per_kb = TOKENS_PER_KB_PRIOR
+        self.pending = []
+        self._bytes = 0
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def expected_tokens(self, image_size):
+        with self._lock:
+            return image_size / 1024 * self.tokens_per_kb
+
+    def observe(self, image_bytes, completion_tokens):
+        """Updates the tokens-per-KB estimate from a response covering image_bytes of page images."""
+        if not image_bytes or not isinstance(completion_tokens, int):
+            return
+        ratio = completion_tokens / (image_bytes / 1024)
+        with self._lock:
+            self.tokens_per_kb += OBSERVATION_WEIGHT * (ratio - self.tokens_per_kb)
+        logger.debug("OCR output estimate now %.2f tokens/KB", self.tokens_per_kb)
+
+    def is_single(self, image_size):
+        return (self.expected_tokens(image_size) >= self.max_output_tokens / 2
+                or image_size * BASE64_OVERHEAD >= self.max_bytes / 2)
+
+    def add(self, item, image_size):
+        """
+        Queues item for batching. Returns the batch that was closed to make room for it, if any.
+        """
+        payload_bytes = image_size * BASE64_OVERHEAD
+        tokens = self.expected_tokens(image_size)
+        closed = None
+        if self.pending and (len(self.pending) >= self.max_pages or self._bytes + payload_bytes > self.max_bytes
+                             or self._tokens + tokens > self.max_output_tokens):
+            closed = self.flush()
+        self.pending.append(item)
+        self._bytes += payload_bytes
+        self._tokens += tokens
+        return closed
+
+    def flush(self):
+        batch, self.pending = self.pending, []
+        self._bytes = 0
+        self._tokens = 0
+        return batch
@@ -0,0 +1,135 @@
+# page_filter.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import hashlib
+import logging
+import threading
+from utils import OCR_BLANK_MAX_INK_PIXELS
+
+logger = logging.getLogger(__name__)
+
+# Page classifications
+NEW = "new"
+BLANK = "blank"
+DUPLICATE = "duplicate"
+
+# Pixels darker than this count as ink
+INK_THRESHOLD = 160
+# Fraction of each edge ignored when measuring ink, so scanner borders and punch holes don't count
+EDGE_MARGIN = 0.03
+# Dark blobs smaller than this many pixels are scanner specks, not marks
+SPECK_PIXELS = 4
+# Pages with at least this many dark pixels have content; only sparser pages are scanned for specks
+SPECK_SCAN_LIMIT = 5000
+
+class PageEntry:
+    """A page seen by the filter; duplicates of it reuse the OCR result of its future."""
+    def __init__(self, label, page_hash):
+        self.label = label
+        self.hash = page_hash
+        self.future = None
+
+    def result(self):
+        return self.future.result()
+
+def ink_pixels(gray):
+    """
+    Counts the dark pixels of a grayscale image that belong to blobs of at least SPECK_PIXELS (8-connected),
+    so dust and scanner noise don't count as content. Only sparse images are walked blob by blob.
+    """
+    dark = sum(gray.histogram()[:INK_THRESHOLD])
+    if dark >= SPECK_SCAN_LIMIT:
+        return dark
+    width = gray.width
+    mask = gray.point(lambda p: 255 if p < INK_THRESHOLD else 0).tobytes()
+    remaining = set()
+    index = mask.find(255)
+    while index != -1:
+        remaining.add(index)
+        index = mask.find(255, index + 1)
+    ink = 0
+    while remaining:
+        stack = [remaining.pop()]
+        size = 0
+        while stack:
+            index = stack.pop()
+            size += 1
+            x = index % width
+            neighbours = [index - width, index + width]
+            if x > 0:
+                neighbours += [index - width - 1, index - 1, index + width - 1]
+            if x < width - 1:
+                neighbours += [index - width + 1, index + 1, index + width + 1]
+            for neighbour in neighbours:
+                if neighbour in remaining:
+                    remaining.remove(neighbour)
+                    stack.append(neighbour)
+        if size >= SPECK_PIXELS:
+            ink += size
+    return ink
+
+def fingerprint(image_path):
+    """
+    Returns (pixel hash, ink pixels) for a page image. The hash covers the size and every decoded
+    grayscale pixel, so only pixel-identical pages share it; pages that merely look alike (two filled-in
+    copies of one form) never do. Ink is counted at full resolution inside the page, excluding a thin
+    edge margin, so a lone stamp or signature line still registers.
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        gray = image.convert("L")
+    width, height = gray.size
+    dx, dy = int(width * EDGE_MARGIN), int(height * EDGE_MARGIN)
+    ink = ink_pixels(gray.crop((dx, dy, width - dx, height - dy)))
+
+    digest = hashlib.blake2b(f"{width}x{height}".encode(), digest_size=32)
+    digest.update(gray.tobytes())
+    return digest.hexdigest(), ink
+
+class PageFilter:
+    """
+    Local pre-pass run on each rasterized page before OCR, shared across all files of a run so
+    duplicates between split parts are caught. Pages with no marks beyond scanner specks are classified
+    blank; pages whose decoded pixels are identical to an earlier page's are classified duplicates of that
+    page. Near matches are deliberately not reused: in evidence, a page that looks like another may differ
+    in one figure.
+    """
+    def __init__(self, blank_ink_pixels=OCR_BLANK_MAX_INK_PIXELS):
+        self.blank_ink_pixels = blank_ink_pixels
+        self.entries = {}
+        self.counts = {NEW: 0, BLANK: 0, DUPLICATE: 0}
+        self._lock = threading.Lock()
+
+    def classify(self, image_path, label):
+        """
+        Returns (kind, entry). For NEW pages, entry is the page's own PageEntry and the caller sets its future;
+        for DUPLICATE pages it is the entry of the earlier page; for BLANK pages it is None.
+        """
+        try:
+            page_hash, ink = fingerprint(image_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not fingerprint {image_path}, sending it to OCR: {str(e)}")
+            entry = PageEntry(label, None)
+            with self._lock:
+                self.counts[NEW] += 1
+            return NEW, entry
+
+        with self._lock:
+            if ink < self.blank_ink_pixels:
+                self.counts[BLANK] += 1
+                logger.debug("Blank page %s (%d ink pixels)", label, ink)
+                return BLANK, None
+            entry = self.entries.get(page_hash)
+            if entry is not None:
+                self.counts[DUPLICATE] += 1
+                logger.debug("Page %s duplicates %s", label, entry.label)
+                return DUPLICATE, entry
+            entry = PageEntry(label, page_hash)
+            self.entries[page_hash] = entry
+            self.counts[NEW] += 1
+            return NEW, entry
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
@@ -0,0 +1,173 @@
+# page_tiler.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import difflib
+import io
+import logging
+import math
+import re
+from page_filter import INK_THRESHOLD
+from utils import OCR_TILE_MIN_LINES, OCR_TILE_LINES, OCR_TILE_MAX
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever tile layout or stitching changes, since tiled pages have their own OCR cache key
+TILER_VERSION = 1
+
+# Pages are analysed at this width; full resolution is only used for the tile crops
+ANALYSIS_WIDTH = 1000
+# Ink runs shorter than this (analysis pixels) are specks, not text lines
+MIN_LINE_HEIGHT = 2
+# A vertical gutter at least this fraction of the content width separates columns; columns narrower than
+# MIN_COLUMN_FRACTION mean a table, which is never split across its columns
+GUTTER_FRACTION = 0.02
+MIN_COLUMN_FRACTION = 0.25
+# Padding around a cut made in the white space between lines, in analysis pixels
+CUT_PADDING = 2
+# Lines compared when removing text repeated where two tiles overlap, and how similar they must be
+STITCH_MAX_LINES = 4
+STITCH_SIMILARITY = 0.9
+
+def _profile(mask, rows):
+    """Mean ink per row (rows=True) or per column of a binarized image."""
+    from PIL import Image
+    size = (1, mask.height) if rows else (mask.width, 1)
+    return list(mask.resize(size, Image.BOX).tobytes())
+
+def _runs(profile, inked=True):
+    """Returns [(start, end), ...] of consecutive inked (or blank) entries."""
+    runs = []
+    start = None
+    for i, value in enumerate(profile + [0 if inked else 1]):
+        if (value > 0) == inked:
+            if start is None:
+                start = i
+        elif start is not None:
+            runs.append((start, i))
+            start = None
+    return runs
+
+def _columns(content):
+    width = content.width
+    gutters = [(start, end) for start, end in _runs(_profile(content, rows=False), inked=False)
+               if start > 0 and end < width and end - start >= GUTTER_FRACTION * width]
+    edges = [0] + [(start + end) // 2 for start, end in gutters] + [width]
+    columns = list(zip(edges, edges[1:]))
+    if any(right - left < MIN_COLUMN_FRACTION * width for left, right in columns):
+        return [(0, width)]
+    return columns
+
+def _cuts(lines, height, bands):
+    """
+    Picks bands - 1 cut rows, preferring the white space between text lines nearest each even split.
+    Returns [(y, extent, through_text), ...], where extent is how far the tiles on either side reach past y.
+    """
+    pitch = max(MIN_LINE_HEIGHT, (lines[-1][1] - lines[0][0]) // max(1, len(lines)))
+    gaps = [((a[1] + b[0]) // 2, b[0] - a[1]) for a, b in zip(lines, lines[1:])]
+    cuts = []
+    for k in range(1, bands):
+        target = height * k // bands
+        nearest = min(gaps, key=lambda gap: abs(gap[0] - target), default=None)
+        if nearest is not None and abs(nearest[0] - target) <= height / bands / 4:
+            cuts.append((nearest[0], nearest[1] // 2 + CUT_PADDING, False))
+        else:
+            # No white space nearby: cut through the text and let both tiles see the lines around it
+            cuts.append((target, pitch * 2, True))
+    return cuts
+
+def plan_tiles(image_bytes, min_lines=OCR_TILE_MIN_LINES, lines_per_tile=OCR_TILE_LINES, max_tiles=OCR_TILE_MAX):
+    """
+    Decides whether a page is dense and, if so, how to split it. Text lines are counted from the row ink
+    profile of each column (columns are found from clear vertical gutters). A page with fewer than
+    min_lines lines in total is not dense and gets no tiles. Otherwise each column is cut into horizontal
+    bands of about lines_per_tile lines, preferably in the space between lines, with overlap where a cut
+    has to go through text. Returns [(column, (left, top, right, bottom), overlaps_previous), ...] in
+    reading order, in pixels of the original image, or [] for a page that should be OCR'd whole.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        gray = source.convert("L")
+    scale = min(1.0, ANALYSIS_WIDTH / gray.width)
+    small = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))), Image.BOX)
+    mask = small.point(lambda p: 255 if p < INK_THRESHOLD else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return []
+    content = mask.crop(bbox)
+
+    columns = []
+    for left, right in _columns(content):
+        column = content.crop((left, 0, right, content.height))
+        lines = [(start, end) for start, end in _runs(_profile(column, rows=True)) if end - start >= MIN_LINE_HEIGHT]
+        columns.append((left, right, lines))
+    total_lines = sum(len(lines) for _, _, lines in columns)
+    if total_lines < min_lines:
+        return []
+
+    bands = [max(1, math.ceil(len(lines) / lines_per_tile)) for _, _, lines in columns]
+    while sum(bands) > max_tiles and max(bands) > 1:
+        bands[bands.index(max(bands))] -= 1
+
+    tiles = []
+    for index, ((left, right, lines), count) in enumerate(zip(columns, bands)):
+        if not lines:
+            continue
+        cuts = _cuts(lines, content.height, count)
+        edges = [(0, 0, False)] + cuts + [(content.height, 0, False)]
+        for (top, top_extent, overlaps), (bottom, bottom_extent, _) in zip(edges, edges[1:]):
+            box = (bbox[0] + left, bbox[1] + max(0, top - top_extent),
+                   bbox[0] + right, bbox[1] + min(content.height, bottom + bottom_extent))
+            tiles.append((index, tuple(min(limit, round(v / scale)) for v, limit in
+                                       zip(box, (gray.width, gray.height, gray.width, gray.height))), overlaps))
+    if len(tiles) < 2:
+        return []
+    logger.debug("Dense page: %d lines in %d columns, %d tiles", total_lines, len(columns), len(tiles))
+    return tiles
+
+def crop_tiles(image_bytes, boxes, quality=90):
+    """Crops the tiles from the full-resolution page. Returns a list of JPEG bytes."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        page = source.convert("RGB")
+    crops = []
+    for box in boxes:
+        buffer = io.BytesIO()
+        page.crop(box).save(buffer, "JPEG", quality=quality)
+        crops.append(buffer.getvalue())
+    return crops
+
+def _normalize(line):
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+def _repeated_lines(previous, following):
+    """Number of leading non-empty lines of following that repeat the trailing lines of previous."""
+    tail = [_normalize(line) for line in previous if line.strip()][-STITCH_MAX_LINES:]
+    head = [_normalize(line) for line in following if line.strip()][:STITCH_MAX_LINES]
+    for count in range(min(len(tail), len(head)), 0, -1):
+        if all(difflib.SequenceMatcher(None, a, b).ratio() >= STITCH_SIMILARITY
+               for a, b in zip(tail[-count:], head[:count])):
+            return count
+    return 0
+
+def stitch_tiles(tiles, texts):
+    """
+    Joins tile texts in reading order: the bands of each column top to bottom, then the columns left to
+    right. Where a band was cut through text, lines the next band repeats from the overlap are dropped;
+    bands cut in the white space between lines share no text and are joined as they are.
+    """
+    columns = {}
+    for (column, _, overlaps), text in zip(tiles, texts):
+        lines = columns.setdefault(column, [])
+        following = text.strip("\n").splitlines()
+        repeated = _repeated_lines(lines, following) if overlaps else 0
+        if repeated:
+            # Skip the repeated non-empty lines and any blank lines between them
+            skipped = 0
+            while following and (skipped < repeated or not following[0].strip()):
+                if following[0].strip():
+                    skipped += 1
+                following.pop(0)
+        lines.extend(following)
+    return "\n\n".join("\n".join(lines) for _, lines in sorted(columns.items()))
@@ -3,298 +3,755 @@
 
 import requests
 import os
-import json
-from pdf2image import convert_from_path
-import base64
+import mimetypes
 import re
 import logging
-from utils import API_URL, TIMEOUT, POPPLER_PATH, get_followup_files
-from token_utils import estimate_tokens, truncate_text
+import sqlite3
+import time
+from itertools import chain
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils import (POPPLER_PATH, OCR_WORKERS, OCR_MODEL, OCR_PROMPT, OCR_DETAIL, ANALYSIS_MODEL,
+                   OCR_IMAGE_OPTIMIZE, OCR_BATCH, OCR_TILING, OCR_SKIP_BLANK_DUPLICATES, OCR_USE_TEXT_LAYER, JPEG_RETENTION, ANALYSIS_MAP_REDUCE, FOLLOWUP_RETRIEVAL, FOLLOWUP_TOP_K, FOLLOWUP_TOKEN_BUDGET,
+                   ANALYSIS_STREAM, FOLLOWUP_CONVERSATION, FOLLOWUP_ANSWER_CACHE)
+from analysis import analyze_map_reduce
+from api_client import get_client
+from combined_ocr import CombinedOCRWriter, read_combined_ocr
+from followup import FollowupSession
+from image_optimizer import OPTIMIZER_VERSION, optimize_image, to_data_url
+from manifest import JobManifest, MANIFEST_NAME, OCR_DONE
+from metrics import begin_case, get_metrics
+from ocr_batch import BATCH_CACHE_PROMPT, BatchPacker, batch_prompt, split_batch_text
+from page_filter import PageFilter, NEW, BLANK
+from page_tiler import TILER_VERSION, crop_tiles, plan_tiles, stitch_tiles
+from ocr_cache import cache_key, get_ocr_cache
+from raster_scheduler import RasterScheduler
+from response_archive import get_response_archive
+from text_layer import usable_text_pages
+from token_utils import MAX_TOKENS, estimate_tokens, truncate_text
 
 logger = logging.getLogger(__name__)
 
-def convert_pdf_to_jpeg(pdf_path, jpeg_dir):
+# Split documents arrive as <name>-part_N_of_M.<ext>; their parts are OCR'd as one group
+PART_PATTERN = re.compile(r"-part_(\d+)_of_(\d+)\.(?:pdf|jpeg|jpg|png)$", re.IGNORECASE)
+
+class ProcessingCancelled(Exception):
+    """Raised by process_pdfs after its cancel event was set; OCR'd pages are kept for the next run."""
+
+def pdf_page_count(pdf_path):
+    """
+    Returns the page count of a PDF. Raises ValueError if Poppler can't read this file; a missing Poppler
+    (PDFInfoNotInstalledError) propagates, since no other file would fare better.
+    """
+    from pdf2image import pdfinfo_from_path
+    from pdf2image.exceptions import PDFPageCountError, PDFSyntaxError
     try:
-        if not os.access(jpeg_dir, os.W_OK):
-            raise PermissionError(f"No write permission for {jpeg_dir}")
-        images = convert_from_path(pdf_path, dpi=200, thread_count=2, poppler_path=POPPLER_PATH)
-        jpeg_paths = []
-        failed_paths = []
-        base_name = os.path.basename(pdf_path).replace(".pdf", "")
-        for i, image in enumerate(images):
-            jpeg_path = os.path.join(jpeg_dir, f"{base_name}-page-{i+1}.jpg")
-            try:
-                image.save(jpeg_path, "JPEG", quality=85)
-                jpeg_paths.append(jpeg_path)
-                logger.debug(f"Saved JPEG: {jpeg_path}")
-            except (OSError, IOError) as e:
-                logger.error(f"Failed to save JPEG for page {i+1} of {pdf_path}: {str(e)}")
-                failed_paths.append(jpeg_path)
-        return jpeg_paths, failed_paths
-    except (OSError, IOError, ValueError) as e:
-        logger.error(f"Error converting PDF {pdf_path}: {str(e)}")
-        return [], [pdf_path]
-
-def extract_ocr(pdf_path, jpeg_paths, api_key, logs_dir):
+        return int(pdfinfo_from_path(pdf_path, poppler_path=POPPLER_PATH)["Pages"])
+    except (PDFPageCountError, PDFSyntaxError) as e:
+        # pdf2image's errors derive from Exception only, so they would slip past the usual handlers
+        raise ValueError(f"Cannot read PDF {pdf_path}: {str(e)}") from e
+
+def _page_cache_key(image_bytes, optimize, tiled=False, batched=False):
+    # The optimizer and tiling change what is uploaded, so their versions are part of the key
+    detail_key = f"{OCR_DETAIL}|optimizer-{OPTIMIZER_VERSION}" if optimize else OCR_DETAIL
+    if tiled:
+        detail_key += f"|tiles-{TILER_VERSION}"
+    # Text split out of a batched response was produced by the batch prompt, not OCR_PROMPT
+    prompt = BATCH_CACHE_PROMPT if batched else OCR_PROMPT
+    return cache_key(image_bytes, OCR_MODEL, prompt, detail_key)
+
+def _upload_image(jpeg_path, image_bytes, optimize, mime=None):
+    """Returns (upload_bytes, mime) for a page, optimized if requested."""
+    mime = mime or mimetypes.guess_type(jpeg_path)[0] or "image/jpeg"
+    if not optimize:
+        return image_bytes, mime
     try:
-        ocr_texts = []
-        headers = {"Authorization": f"Bearer {api_key}"}
-        base_name = os.path.basename(pdf_path).replace(".pdf", "").replace(".jpeg", "").replace(".jpg", "").replace(".png", "")
-        for i, jpeg_path in enumerate(jpeg_paths):
-            logger.debug(f"Sending OCR API call for {jpeg_path}")
-            base64_image = base64.b64encode(open(jpeg_path, "rb").read()).decode("utf-8")
+        upload_bytes, mime, settings = optimize_image(image_bytes)
+        logger.debug("Optimized %s: saved %d bytes, settings=%s", jpeg_path, len(image_bytes) - len(upload_bytes), settings)
+        return upload_bytes, mime
+    except (OSError, ValueError) as e:
+        logger.warning(f"Image optimization failed for {jpeg_path}, uploading original: {str(e)}")
+        return image_bytes, mime
+
+def _image_part(upload_bytes, mime):
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": to_data_url(upload_bytes, mime),
+            "detail": OCR_DETAIL
+        }
+    }
+
+def _ocr_request(upload_bytes, mime, archive_key, api_key, logs_dir):
+    """Sends one prepared image for OCR and archives the response. Returns the text; raises on failure."""
+    payload = {
+        "model": OCR_MODEL,
+        "messages": [{
+            "role": "user",
+            "content": [
+                _image_part(upload_bytes, mime),
+                {"type": "text", "text": OCR_PROMPT}
+            ]
+        }],
+        "temperature": 0.01
+    }
+    logger.debug("Sending OCR API call for %s", archive_key)
+    response_json = get_client(api_key).chat(payload)
+    ocr_text = response_json['choices'][0]['message']['content']
+    get_response_archive(logs_dir).append(archive_key, response_json)
+    logger.debug("Received OCR response for %s", archive_key)
+    return ocr_text
+
+def _ocr_upload(upload_bytes, mime, page_num, base_name, api_key, logs_dir, cache=None, key=None):
+    """Sends one prepared page image for OCR. Returns (text, error) like _ocr_page."""
+    try:
+        ocr_text = _ocr_request(upload_bytes, mime, f"ocr_response_{base_name}_page-{page_num}", api_key, logs_dir)
+        if cache is not None:
+            cache.put(key, ocr_text)
+        get_metrics().count("pages_ocr")
+        return ocr_text, None
+    except (requests.RequestException, ValueError, KeyError, IndexError, OSError, IOError) as e:
+        # The client has already retried transient failures; mark the page and keep going
+        logger.error(f"OCR failed for page {page_num} of {base_name}: {str(e)}")
+        get_metrics().count("pages_failed")
+        return f"Error: OCR failed for page {page_num}: {str(e)}", str(e)
+
+def _ocr_tiles(image_bytes, tiles, jpeg_path, page_num, base_name, api_key, logs_dir, optimize, cache=None, key=None):
+    """
+    OCRs the tiles of a dense page concurrently and stitches their text in reading order.
+    Returns (text, error) like _ocr_page; the page fails if any of its tiles fails.
+    """
+    def ocr_tile(numbered):
+        number, tile_bytes = numbered
+        upload_bytes, mime = _upload_image(f"{jpeg_path} tile {number}", tile_bytes, optimize, "image/jpeg")
+        return _ocr_request(upload_bytes, mime, f"ocr_response_{base_name}_page-{page_num}_tile-{number}", api_key, logs_dir)
+
+    try:
+        crops = crop_tiles(image_bytes, [box for _, box, _ in tiles])
+        with ThreadPoolExecutor(max_workers=len(crops)) as executor:
+            texts = list(executor.map(ocr_tile, enumerate(crops, 1)))
+        ocr_text = stitch_tiles(tiles, texts)
+        if cache is not None:
+            cache.put(key, ocr_text)
+        get_metrics().count("pages_ocr")
+        get_metrics().count("pages_tiled")
+        get_metrics().count("ocr_tiles", len(crops))
+        return ocr_text, None
+    except (requests.RequestException, ValueError, KeyError, IndexError, OSError, IOError) as e:
+        logger.error(f"Tiled OCR failed for page {page_num} of {base_name}: {str(e)}")
+        get_metrics().count("pages_failed")
+        return f"Error: OCR failed for page {page_num}: {str(e)}", str(e)
+
+def _dense_page_tiles(jpeg_path, image_bytes):
+    try:
+        return plan_tiles(image_bytes)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not analyse the layout of {jpeg_path}, OCRing it whole: {str(e)}")
+        return []
+
+def _ocr_page(jpeg_path, page_num, base_name, api_key, logs_dir, cache=None, optimize=False, tile=False):
+    """
+    Runs OCR for a single page through the shared API client, which retries transient failures.
+    Returns (text, error): the page text and None, or an error marker for the page and the error message.
+    With tile, a dense page is split into tiles that are OCR'd concurrently and stitched back together.
+    """
+    try:
+        with open(jpeg_path, "rb") as image_file:
+            image_bytes = image_file.read()
+    except (OSError, IOError) as e:
+        logger.error(f"File operation error for {jpeg_path}: {str(e)}")
+        return f"Error: OCR failed for page {page_num}: {str(e)}", str(e)
+
+    tiles = _dense_page_tiles(jpeg_path, image_bytes) if tile else []
+    key = None
+    if cache is not None:
+        key = _page_cache_key(image_bytes, optimize, tiled=bool(tiles))
+        cached_text = cache.get(key)
+        if cached_text is not None:
+            logger.debug("OCR cache hit for %s", jpeg_path)
+            get_metrics().count("pages_cached")
+            return cached_text, None
+
+    if tiles:
+        logger.debug("Tiling dense page %s into %d tiles", jpeg_path, len(tiles))
+        return _ocr_tiles(image_bytes, tiles, jpeg_path, page_num, base_name, api_key, logs_dir, optimize, cache, key)
+    upload_bytes, mime = _upload_image(jpeg_path, image_bytes, optimize)
+    return _ocr_upload(upload_bytes, mime, page_num, base_name, api_key, logs_dir, cache, key)
+
+def _ocr_and_record(jpeg_path, page_num, base_name, api_key, logs_dir, cache, manifest, file_key, optimize, tile=False):
+    ocr_text, error = _ocr_page(jpeg_path, page_num, base_name, api_key, logs_dir, cache, optimize, tile)
+    if manifest is not None:
+        manifest.record_page(file_key, page_num, ocr_text, error)
+    return ocr_text, error
+
+def _ocr_batch(batch, base_name, api_key, logs_dir, cache, manifest, file_key, optimize, packer, tile=False):
+    """
+    OCRs a batch of (page_num, jpeg_path, future) in one multi-image request and resolves each page's
+    future with (text, error). Cached pages are served first, and with tile, dense pages are tiled alone. If the request fails, is cut off, or its
+    response does not split into exactly one text per page, the pages are OCR'd one call each instead.
+    """
+    run_metrics = get_metrics()
+    try:
+        prepared = []
+        for page_num, jpeg_path, future in batch:
+            try:
+                with open(jpeg_path, "rb") as image_file:
+                    image_bytes = image_file.read()
+            except (OSError, IOError):
+                # The single-page path reports and records the read error
+                future.set_result(_ocr_and_record(jpeg_path, page_num, base_name, api_key, logs_dir,
+                                                  cache, manifest, file_key, optimize))
+                continue
+            if tile and _dense_page_tiles(jpeg_path, image_bytes):
+                future.set_result(_ocr_and_record(jpeg_path, page_num, base_name, api_key, logs_dir,
+                                                  cache, manifest, file_key, optimize, tile))
+                continue
+            key = batch_key = None
+            if cache is not None:
+                # Single-page results are reused in batches, but batched results never leak into single-page runs
+                key = _page_cache_key(image_bytes, optimize)
+                batch_key = _page_cache_key(image_bytes, optimize, batched=True)
+                cached_text = cache.get(key)
+                if cached_text is None:
+                    cached_text = cache.get(batch_key)
+                if cached_text is not None:
+                    logger.debug("OCR cache hit for %s", jpeg_path)
+                    run_metrics.count("pages_cached")
+                    if manifest is not None:
+                        manifest.record_page(file_key, page_num, cached_text, None)
+                    future.set_result((cached_text, None))
+                    continue
+            upload_bytes, mime = _upload_image(jpeg_path, image_bytes, optimize)
+            prepared.append((page_num, future, (key, batch_key), len(image_bytes), upload_bytes, mime))
+
+        texts = None
+        if len(prepared) > 1:
+            page_nums = [page[0] for page in prepared]
             payload = {
-                "model": "grok-2-vision-latest",
+                "model": OCR_MODEL,
                 "messages": [{
                     "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                                "detail": "high"
-                            }
-                        },
-                        {"type": "text", "text": "Perform OCR on this image and extract the raw text."}
-                    ]
+                    "content": [_image_part(page[4], page[5]) for page in prepared]
+                               + [{"type": "text", "text": batch_prompt(len(prepared))}]
                 }],
                 "temperature": 0.01
             }
-            response = requests.post(API_URL, headers=headers, json=payload, timeout=TIMEOUT)
-            response.raise_for_status()
-            response_json = response.json()
-            ocr_text = response_json['choices'][0]['message']['content']
-            json_file = os.path.join(logs_dir, f"ocr_response_{base_name}_page-{i+1}.json")
-            with open(json_file, "w", encoding='utf-8') as f:
-                json.dump(response_json, f, indent=2)
-                f.flush()
-            logger.debug(f"Saved JSON response: {json_file}")
-            ocr_texts.append(ocr_text)
-            logger.debug(f"Received OCR response for {jpeg_path}")
-            # Keep JPEGs for debugging
-            logger.debug(f"Retained JPEG: {jpeg_path}")
+            try:
+                logger.debug("Sending batched OCR API call for pages %s of %s", page_nums, base_name)
+                response_json = get_client(api_key).chat(payload)
+                choice = response_json['choices'][0]
+                get_response_archive(logs_dir).append(
+                    f"ocr_batch_response_{base_name}_pages-{'-'.join(str(p) for p in page_nums)}", response_json)
+                if choice.get('finish_reason') != "length":
+                    texts = split_batch_text(choice['message']['content'], len(prepared))
+                if texts is not None:
+                    packer.observe(sum(page[3] for page in prepared), (response_json.get('usage') or {}).get('completion_tokens'))
+            except (requests.RequestException, ValueError, KeyError, IndexError, OSError, IOError) as e:
+                logger.warning(f"Batched OCR failed for pages {page_nums} of {base_name}: {str(e)}")
+            if texts is None:
+                logger.warning(f"Could not split the batched OCR response for pages {page_nums} of {base_name}; "
+                               "falling back to single-page calls")
+                run_metrics.count("ocr_batch_fallbacks")
+            else:
+                run_metrics.count("ocr_batches")
+
+        for i, (page_num, future, (key, batch_key), _, upload_bytes, mime) in enumerate(prepared):
+            if texts is not None:
+                ocr_text, error = texts[i], None
+                if cache is not None:
+                    cache.put(batch_key, ocr_text)
+                run_metrics.count("pages_ocr")
+            else:
+                ocr_text, error = _ocr_upload(upload_bytes, mime, page_num, base_name, api_key, logs_dir, cache, key)
+            if manifest is not None:
+                manifest.record_page(file_key, page_num, ocr_text, error)
+            future.set_result((ocr_text, error))
+    except BaseException as e:
+        # Never leave a page waiting on a future that will not be resolved
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        raise
+
+def extract_ocr(pdf_path, jpeg_paths, api_key, logs_dir, max_workers=OCR_WORKERS, use_cache=True,
+                manifest=None, file_key=None, optimize=OCR_IMAGE_OPTIMIZE, page_filter=None, batch=OCR_BATCH,
+                tile=OCR_TILING, on_page=None, cancel=None):
+    """
+    OCRs the pages of one document with up to max_workers concurrent API calls.
+    jpeg_paths holds JPEG paths numbered from page 1, or (page_num, jpeg_path) pairs.
+    Pages are reassembled in their original order; a failed page is marked in place
+    rather than failing the whole document. max_workers=1 gives sequential processing.
+    With use_cache, pages already OCR'd in any earlier run are served from the shared OCR cache.
+    With a manifest, each page's outcome is recorded under file_key as soon as it completes.
+    With optimize, each page is cropped, desaturated and compressed to a byte target before upload.
+    With a page_filter, blank pages get a placeholder and duplicates of earlier pages reuse their text
+    instead of being sent to OCR.
+    With batch, short pages are packed several to a request (see BatchPacker); larger pages still go alone.
+    With tile, dense pages are split into tiles OCR'd concurrently and stitched (see plan_tiles).
+    on_page is called after each page in order. Once the cancel event is set no further pages are
+    sent; pages already in flight still finish and are recorded.
+    """
+    run_metrics = get_metrics()
+    start = time.perf_counter()
+    try:
+        base_name = os.path.basename(pdf_path).replace(".pdf", "").replace(".jpeg", "").replace(".jpg", "").replace(".png", "")
+        cache = None
+        if use_cache:
+            try:
+                cache = get_ocr_cache()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"OCR cache unavailable, continuing without it: {str(e)}")
+        packer = BatchPacker() if batch else None
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            pages = []
+            for i, item in enumerate(jpeg_paths):
+                if cancel is not None and cancel.is_set():
+                    logger.info(f"Cancelled; not sending the remaining pages of {pdf_path}")
+                    break
+                page_num, jpeg_path = item if isinstance(item, tuple) else (i + 1, item)
+                kind, entry = (NEW, None)
+                if page_filter is not None:
+                    kind, entry = page_filter.classify(jpeg_path, f"{base_name} page {page_num}")
+                if kind == NEW:
+                    image_size = os.path.getsize(jpeg_path) if packer is not None else 0
+                    if packer is not None and not packer.is_single(image_size):
+                        future = Future()
+                        closed = packer.add((page_num, jpeg_path, future), image_size)
+                        if closed:
+                            executor.submit(_ocr_batch, closed, base_name, api_key, logs_dir, cache, manifest,
+                                            file_key, optimize, packer, tile)
+                    else:
+                        future = executor.submit(_ocr_and_record, jpeg_path, page_num, base_name, api_key, logs_dir,
+                                                 cache, manifest, file_key, optimize, tile)
+                    if entry is not None:
+                        entry.future = future
+                    pages.append((page_num, kind, future))
+                else:
+                    pages.append((page_num, kind, entry))
+            if packer is not None and packer.pending:
+                executor.submit(_ocr_batch, packer.flush(), base_name, api_key, logs_dir, cache, manifest,
+                                file_key, optimize, packer, tile)
+
+            ocr_texts = []
+            for page_num, kind, source in pages:
+                if kind == NEW:
+                    ocr_text, _ = source.result()
+                else:
+                    run_metrics.count(f"pages_{kind}")
+                    if kind == BLANK:
+                        ocr_text, error = f"[Blank page {page_num} skipped]", None
+                    else:
+                        original_text, error = source.result()
+                        ocr_text = f"[Duplicate of {source.label}]\n{original_text}"
+                    if manifest is not None:
+                        manifest.record_page(file_key, page_num, ocr_text, error)
+                ocr_texts.append(ocr_text)
+                if on_page is not None:
+                    on_page()
+        logger.debug(f"Completed OCR for {len(ocr_texts)} pages of {pdf_path} with {max_workers} workers")
+        if cache is not None:
+            logger.info(f"OCR cache stats after {base_name}: {cache.stats()}")
         return pdf_path, "\n\n--- Page Break ---\n\n".join(ocr_texts)
-    except requests.RequestException as e:
-        logger.error(f"OCR API error for {pdf_path}: {str(e)}")
-        return pdf_path, f"Error: {str(e)}"
     except (OSError, IOError) as e:
         logger.error(f"File operation error for {pdf_path}: {str(e)}")
         return pdf_path, f"Error: {str(e)}"
+    finally:
+        # Includes time blocked on the rasterizer feeding the pages
+        run_metrics.add_time("ocr", time.perf_counter() - start)
+
+def part_number(file_name):
+    match = PART_PATTERN.search(file_name)
+    return int(match.group(1)) if match else 0
 
 def group_split_files(pdf_files):
     grouped_files = {}
     for pdf in pdf_files:
-        base_name = re.sub(r"-part_\d+_of_\d+\.(pdf|jpeg|jpg|png)$", "", pdf, flags=re.IGNORECASE)
+        base_name = PART_PATTERN.sub("", pdf)
         grouped_files.setdefault(base_name, []).append(pdf)
     
     for base_name in grouped_files:
-        grouped_files[base_name].sort(
-            key=lambda x: int(re.search(r"part_(\d+)_of_\d+", x).group(1)) if "part_" in x.lower() else 0
-        )
+        grouped_files[base_name].sort(key=part_number)
     
     return grouped_files
 
 def get_processed_files(ocr_dir):
-    processed_files = set()
-    ocr_file = os.path.join(ocr_dir, "combined_ocr.txt")
-    if os.path.exists(ocr_file):
-        with open(ocr_file, "r", encoding='utf-8') as f:
-            content = f.read()
-            matches = re.findall(r"File: (.*?)\n", content)
-            processed_files = set(matches)
-    return processed_files
-
-def process_pdfs(api_key, pdf_dir, files_to_process, jpeg_dir, ocr_dir):
+    """Returns the groups whose every file is fully OCR'd according to the case's job manifest."""
+    if not os.path.exists(os.path.join(ocr_dir, MANIFEST_NAME)):
+        return set()
+    manifest = JobManifest(ocr_dir)
+    try:
+        return manifest.completed_groups()
+    finally:
+        manifest.close()
+
+def _track_rasterized(pages, manifest, file_key):
+    for page_num, jpeg_path in pages:
+        manifest.mark_rasterized(file_key, page_num, jpeg_path)
+        yield page_num, jpeg_path
+
+def _apply_jpeg_retention(manifest, file_key, jpeg_dir, retention):
+    """
+    Deletes the rasterized pages of a processed PDF from jpeg_dir: all of them with "delete", only pages
+    that were OCR'd successfully with "keep-on-failure" (so failures can be inspected and retried).
+    Input images outside jpeg_dir are never touched.
+    """
+    if retention == "keep":
+        return
+    jpeg_dir = os.path.abspath(jpeg_dir)
+    removed = 0
+    for page_num, state, jpeg_path in manifest.page_images(file_key):
+        if retention == "keep-on-failure" and state != OCR_DONE:
+            continue
+        if os.path.dirname(os.path.abspath(jpeg_path)) != jpeg_dir or not os.path.exists(jpeg_path):
+            continue
+        try:
+            os.remove(jpeg_path)
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Could not remove {jpeg_path}: {str(e)}")
+    if removed:
+        logger.debug(f"Removed {removed} JPEGs of {file_key} ({retention})")
+
+def _plan_pdf(manifest, full_path, file_path, use_text_layer):
+    """
+    Works out which pages of a PDF still need rasterizing and OCR, recording first any pending pages whose
+    embedded text layer is usable. Returns (pages to rasterize, number of pages taken from the text layer),
+    or None for a PDF that can't be read, which is marked failed so the rest of the run goes on without it.
+    """
+    try:
+        page_count = pdf_page_count(full_path)
+    except ValueError as e:
+        logger.error(f"Skipping {full_path}; it will be retried on the next run: {str(e)}")
+        manifest.fail_file(file_path)
+        return None
+    manifest.set_page_count(file_path, page_count)
+    pending = manifest.pending_pages(file_path, page_count)
+    if pending and len(pending) < page_count:
+        logger.info(f"Resuming {full_path} at page {pending[0]} ({len(pending)} of {page_count} pages left)")
+    if not use_text_layer or not pending:
+        return pending, 0
+    # Born-digital pages already carry their text; only the rest are rendered and OCR'd
+    text_pages = usable_text_pages(full_path, pending)
+    for page_num, text in text_pages.items():
+        manifest.record_page(file_path, page_num, text)
+    if text_pages:
+        get_metrics().count("pages_text_layer", len(text_pages))
+        pending = [page_num for page_num in pending if page_num not in text_pages]
+        logger.info(f"Used the text layer for {len(text_pages)} pages of {full_path}; {len(pending)} left for OCR")
+    return pending, len(text_pages)
+
+class _PageProgress:
+    """Counts pages done against pages planned for a progress(stage, done, total) callback."""
+    def __init__(self, progress):
+        self.progress = progress
+        self.done = 0
+        self.total = 0
+
+    def add(self, done=0, total=0):
+        self.done += done
+        self.total += total
+        if self.progress is not None:
+            self.progress("ocr", self.done, self.total)
+
+    def page(self):
+        self.add(done=1)
+
+def process_pdfs(api_key, pdf_dir, files_to_process, jpeg_dir, ocr_dir, max_workers=OCR_WORKERS, use_cache=True,
+                 skip_blank_duplicates=OCR_SKIP_BLANK_DUPLICATES, use_text_layer=OCR_USE_TEXT_LAYER,
+                 jpeg_retention=JPEG_RETENTION, batch=OCR_BATCH, tile=OCR_TILING, scheduler=None, progress=None,
+                 cancel=None):
+    """
+    OCRs files_to_process (names in pdf_dir) into ocr_dir, appending each document to combined_ocr.txt.
+    A scheduler passed in (e.g. by the watch mode) is used instead of a new rasterizer pool and left open.
+    progress(stage, done, total) is called as pages complete. Setting the cancel event stops the run at the
+    next page boundary and raises ProcessingCancelled once finished work is saved.
+    """
     logger = logging.getLogger(__name__)
+    manifest = None
+    own_scheduler = scheduler is None
+    run_metrics = begin_case(os.path.dirname(ocr_dir))
+    start = time.perf_counter()
     try:
         if not os.access(ocr_dir, os.W_OK):
             raise PermissionError(f"No write permission for {ocr_dir}")
         logs_dir = os.path.join(os.path.dirname(ocr_dir), "logs")
         grouped_files = group_split_files(files_to_process)
-        processed_files = get_processed_files(ocr_dir)
-        pdf_groups_to_process = {
-            base_name: files for base_name, files in grouped_files.items()
+        manifest = JobManifest(ocr_dir)
+        processed_files = manifest.completed_groups()
+        pdf_groups_to_process = [
+            (base_name, files) for base_name, files in grouped_files.items()
             if base_name not in processed_files
-        }
+        ]
         logger.info(f"Processing {len(pdf_groups_to_process)} new groups.")
 
         combined_ocr_file = os.path.join(ocr_dir, "combined_ocr.txt")
-        combined_ocr_content = ""
+        # Each document is appended to the combined file as soon as it finishes
+        writer = CombinedOCRWriter(combined_ocr_file)
+        # Shared by every file in the run, so duplicates across split parts are caught
+        page_filter = PageFilter() if skip_blank_duplicates else None
+        text_layer_pages = 0
+        page_progress = _PageProgress(progress)
+
+        # Plan every PDF up front so the rasterizer pool can render all of them, in order, while OCR runs
+        if own_scheduler:
+            scheduler = RasterScheduler(jpeg_dir)
+        plans = {}
+        with run_metrics.stage("plan"):
+            for base_name, group in pdf_groups_to_process:
+                for file_path in group:
+                    manifest.register_file(file_path, base_name)
+                    if manifest.is_file_done(file_path):
+                        continue
+                    if not file_path.lower().endswith('.pdf'):
+                        page_progress.total += 1
+                        continue
+                    full_path = os.path.join(pdf_dir, file_path)
+                    try:
+                        plans[file_path] = _plan_pdf(manifest, full_path, file_path, use_text_layer)
+                        if plans[file_path] is None:
+                            continue
+                        pending, text_count = plans[file_path]
+                        page_progress.done += text_count
+                        page_progress.total += len(pending) + text_count
+                    except (OSError, IOError, ValueError, KeyError) as e:
+                        logger.warning(f"Could not plan {full_path}; it will be retried with its group: {str(e)}")
+        scheduler.schedule([(os.path.join(pdf_dir, file_path), plan[0]) for file_path, plan in plans.items() if plan is not None])
+        page_progress.add()
 
-        # Process groups, retrying failed parts as individuals
-        for base_name, group in pdf_groups_to_process.items():
+        # Process groups, retrying failed parts as individuals (appended to the list being iterated)
+        for base_name, group in pdf_groups_to_process:
+            if cancel is not None and cancel.is_set():
+                break
             try:
+                group_output = ""
                 for file_path in group:
+                    if cancel is not None and cancel.is_set():
+                        break
                     full_path = os.path.join(pdf_dir, file_path)
-                    logger.debug(f"Starting processing for {full_path}")
-                    # Check file extension to determine processing path
-                    if file_path.lower().endswith('.pdf'):
-                        jpeg_paths, failed_paths = convert_pdf_to_jpeg(full_path, jpeg_dir)
+                    manifest.register_file(file_path, base_name)
+                    ocr_ran = False
+                    if manifest.is_file_done(file_path):
+                        logger.debug(f"Already OCR'd according to manifest: {full_path}")
+                    else:
+                        logger.debug(f"Starting processing for {full_path}")
+                        # Check file extension to determine processing path
+                        failed_paths = []
+                        if file_path.lower().endswith('.pdf'):
+                            if file_path in plans:
+                                plan = plans.pop(file_path)
+                            else:
+                                # Retried parts are planned and queued on demand
+                                plan = _plan_pdf(manifest, full_path, file_path, use_text_layer)
+                                if plan is not None:
+                                    scheduler.schedule([(full_path, plan[0])])
+                                    page_progress.add(done=plan[1], total=len(plan[0]) + plan[1])
+                            if plan is None:
+                                # Unreadable; already marked failed in the manifest
+                                continue
+                            pending, text_count = plan
+                            if text_count:
+                                ocr_ran = True
+                                text_layer_pages += text_count
+                            # Pages stream from the rasterizer pool straight into OCR, in page order
+                            pages = _track_rasterized(scheduler.pages(full_path, failed_paths), manifest, file_path)
+                        else:  # JPEG, JPG, PNG
+                            manifest.set_page_count(file_path, 1)
+                            pages = iter([(1, full_path)])  # Use the image file directly
+                            logger.debug(f"Using image file directly: {full_path}")
+                        first_page = next(pages, None)
+                        if first_page is None and not manifest.complete_file(file_path):
+                            logger.warning(f"Skipping {full_path}: No JPEGs converted")
+                            continue
+                        if first_page is not None:
+                            ocr_ran = True
+                            extract_ocr(full_path, chain([first_page], pages), api_key, logs_dir,
+                                        max_workers=max_workers, use_cache=use_cache, manifest=manifest, file_key=file_path,
+                                        page_filter=page_filter, batch=batch, tile=tile,
+                                        on_page=page_progress.page, cancel=cancel)
                         if failed_paths:
                             logger.warning(f"Failed to convert some pages for {full_path}: {failed_paths}")
-                    else:  # JPEG, JPG, PNG
-                        jpeg_paths = [full_path]  # Use the image file directly
-                        failed_paths = []
-                        logger.debug(f"Using image file directly: {full_path}")
-                    if not jpeg_paths:
-                        logger.warning(f"Skipping {full_path}: No JPEGs converted")
-                        continue
-                    _, ocr_text = extract_ocr(full_path, jpeg_paths, api_key, logs_dir)
-                    output = f"File: {base_name}\n### OCR ###\n{ocr_text}\n{'-'*50}\n"
-                    logger.debug(f"Writing OCR output for {base_name}")
-                    ocr_file = os.path.join(ocr_dir, f"{base_name}.txt")
-                    with open(ocr_file, "w", encoding='utf-8') as f:
-                        f.write(output)
-                        f.flush()
-                    logger.debug(f"Saved OCR file: {ocr_file}")
-                    combined_ocr_content += output
-            except (requests.RequestException, OSError, IOError) as e:
+                        if not manifest.complete_file(file_path):
+                            logger.warning(f"{full_path} has failed pages; they will be retried on the next run")
+                        _apply_jpeg_retention(manifest, file_path, jpeg_dir, jpeg_retention)
+                        if cancel is not None and cancel.is_set():
+                            logger.info(f"Cancelled during {full_path}; its remaining pages are left for the next run")
+                            break
+                    if ocr_ran or not writer.has_record(file_path):
+                        writer.append(base_name, file_path, manifest.document_pages(file_path))
+                    ocr_text = manifest.document_text(file_path)
+                    if ocr_ran:
+                        run_metrics.count("documents")
+                        # Keeps metrics.json and the textfile export current while a long run progresses
+                        run_metrics.save()
+                    group_output += f"File: {base_name}\n### OCR ###\n{ocr_text}\n{'-'*50}\n"
+                if cancel is not None and cancel.is_set():
+                    break
+                logger.debug(f"Writing OCR output for {base_name}")
+                ocr_file = os.path.join(ocr_dir, f"{base_name}.txt")
+                with open(ocr_file, "w", encoding='utf-8') as f:
+                    f.write(group_output)
+                    f.flush()
+                logger.debug(f"Saved OCR file: {ocr_file}")
+            except (requests.RequestException, OSError, IOError, ValueError, KeyError) as e:
                 logger.error(f"Error processing group {base_name}: {str(e)}")
-                # Retry each part as an individual file
-                for file_path in group:
-                    single_group = {f"{base_name}-{os.path.basename(file_path)}": [file_path]}
-                    pdf_groups_to_process.update(single_group)
-                    logger.info(f"Retrying {file_path} as individual due to group failure")
+                if len(group) > 1:
+                    # Retry each part as an individual file
+                    for file_path in group:
+                        pdf_groups_to_process.append((f"{base_name}-{os.path.basename(file_path)}", [file_path]))
+                        logger.info(f"Retrying {file_path} as individual due to group failure")
                 continue
 
-        # Write combined OCR file once after all processing
-        logger.debug(f"Writing combined OCR file: {combined_ocr_file}")
-        with open(combined_ocr_file, "w", encoding='utf-8') as f:
-            f.write(combined_ocr_content)
-            f.flush()
+        # Documents OCR'd in earlier runs that have no record yet (e.g. the index was lost)
+        for group_name, file_key in manifest.iter_documents():
+            if not writer.has_record(file_key):
+                writer.append(group_name, file_key, manifest.document_pages(file_key))
+        # Drop records superseded by documents re-OCR'd in this run
+        writer.compact()
+        writer.close()
         logger.debug(f"Saved combined OCR file: {combined_ocr_file}")
+        logger.info(f"Manifest page stats: {manifest.stats()}")
+        if use_text_layer:
+            logger.info(f"Pages taken from the PDF text layer: {text_layer_pages}")
+        if page_filter is not None:
+            logger.info(f"Page filter stats: {page_filter.stats()}")
+        logger.info(f"API latency stats: {get_client(api_key).latency_stats()}")
 
+        if cancel is not None and cancel.is_set():
+            raise ProcessingCancelled(f"Processing cancelled after {page_progress.done} of {page_progress.total} pages")
         return combined_ocr_file
+    except ProcessingCancelled as e:
+        logger.info(str(e))
+        raise
     except (OSError, IOError) as e:
         logger.error(f"File operation error in process_pdfs: {str(e)}")
         raise
     except Exception as e:
         logger.error(f"Unexpected error in process_pdfs: {str(e)}")
         raise
+    finally:
+        if own_scheduler and scheduler is not None:
+            scheduler.close()
+        if manifest is not None:
+            manifest.close()
+        run_metrics.add_time("process_pdfs", time.perf_counter() - start)
+        run_metrics.save()
 
-def analyze_combined_ocr(api_key, combined_ocr_file, analysis_dir, query):
+def _stream_to_file(client, payload, output_file, header="", footer=""):
+    """
+    Streams a chat completion, printing each token as it arrives and appending it to output_file
+    (after header) so partial answers survive an interrupted run. Returns the assembled response dict.
+    """
+    with open(output_file, "w", encoding='utf-8') as f:
+        f.write(header)
+        def on_text(text):
+            print(text, end="", flush=True)
+            f.write(text)
+            f.flush()
+        response_json = client.stream_chat(payload, on_text)
+        print()
+        f.write(footer)
+        f.flush()
+    return response_json
+
+def analyze_combined_ocr(api_key, combined_ocr_file, analysis_dir, query, map_reduce=ANALYSIS_MAP_REDUCE,
+                         stream=ANALYSIS_STREAM):
+    """
+    Analyzes the combined OCR file and returns the analysis text. Errors are logged and re-raised with their
+    own type (requests.RequestException, OSError or ValueError) so callers can tell them apart.
+    """
     logger = logging.getLogger(__name__)
+    run_metrics = begin_case(os.path.dirname(analysis_dir))
+    start = time.perf_counter()
     try:
         if not os.access(analysis_dir, os.W_OK):
             raise PermissionError(f"No write permission for {analysis_dir}")
         logs_dir = os.path.join(os.path.dirname(analysis_dir), "logs")
-        headers = {"Authorization": f"Bearer {api_key}"}
-        ocr_content = ""
-        if os.path.exists(combined_ocr_file):
-            with open(combined_ocr_file, "r", encoding='utf-8') as f:
-                ocr_content = f.read()
-        else:
+        if not os.path.exists(combined_ocr_file):
             raise FileNotFoundError(f"{combined_ocr_file} not found")
+        ocr_content = read_combined_ocr(combined_ocr_file)
 
-        logger.debug("Sending analysis API call")
         full_query = f"Here is the OCR-extracted text for your investigation:\n\n{ocr_content}\n\n{query}"
         query_tokens = estimate_tokens(full_query)
-        if query_tokens > 120000:
+        if query_tokens > MAX_TOKENS and map_reduce:
+            logger.info(f"Analysis query exceeds token limit ({query_tokens} tokens). Using map-reduce analysis")
+            return analyze_map_reduce(api_key, ocr_content, analysis_dir, logs_dir, query, combined_ocr_file)
+
+        logger.debug("Sending analysis API call")
+        if query_tokens > MAX_TOKENS:
             logger.warning(f"Analysis query exceeds token limit ({query_tokens} tokens). Truncating...")
-            full_query = truncate_text(full_query, 120000)
+            full_query = truncate_text(full_query, MAX_TOKENS)
 
         payload = {
-            "model": "grok-3-fast-latest",
+            "model": ANALYSIS_MODEL,
             "messages": [{"role": "user", "content": full_query}],
             "temperature": 0.01
         }
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=TIMEOUT)
-        response.raise_for_status()
-        response_json = response.json()
+        analysis_file = os.path.join(analysis_dir, "combined_analysis.txt")
+        if stream:
+            response_json = _stream_to_file(get_client(api_key), payload, analysis_file)
+        else:
+            response_json = get_client(api_key).chat(payload)
         response_content = response_json['choices'][0]['message']['content']
-        json_file = os.path.join(logs_dir, "analysis_response.json")
-        with open(json_file, "w", encoding='utf-8') as f:
-            json.dump(response_json, f, indent=2)
-            f.flush()
-        logger.debug(f"Saved JSON response: {json_file}")
+        get_response_archive(logs_dir).append("analysis_response", response_json)
         logger.debug("Received analysis response")
 
-        analysis_file = os.path.join(analysis_dir, "combined_analysis.txt")
-        with open(analysis_file, "w", encoding='utf-8') as f:
-            f.write(response_content)
-            f.flush()
+        if not stream:
+            with open(analysis_file, "w", encoding='utf-8') as f:
+                f.write(response_content)
+                f.flush()
         logger.debug(f"Saved analysis file: {analysis_file}")
         return response_content
     except requests.RequestException as e:
         logger.error(f"Analysis API error: {str(e)}")
-        return f"Analysis error: {str(e)}"
+        raise
     except (OSError, IOError) as e:
         logger.error(f"File operation error: {str(e)}")
-        return f"Analysis error: {str(e)}"
+        raise
+    except ValueError as e:
+        logger.error(f"Analysis error: {str(e)}")
+        raise
+    finally:
+        run_metrics.add_time("analysis", time.perf_counter() - start)
+        run_metrics.save()
 
-def interactive_query(api_key, combined_ocr_file, followups_dir):
+def interactive_query(api_key, combined_ocr_file, followups_dir, retrieval=FOLLOWUP_RETRIEVAL,
+                      top_k=FOLLOWUP_TOP_K, token_budget=FOLLOWUP_TOKEN_BUDGET, stream=ANALYSIS_STREAM,
+                      conversation=FOLLOWUP_CONVERSATION, use_cache=FOLLOWUP_ANSWER_CACHE):
     logger = logging.getLogger(__name__)
+    session = None
     try:
-        if not os.access(followups_dir, os.W_OK):
-            raise PermissionError(f"No write permission for {followups_dir}")
-        logs_dir = os.path.join(os.path.dirname(followups_dir), "logs")
-        followup_counter = len(get_followup_files(followups_dir)) + 1
-        headers = {"Authorization": f"Bearer {api_key}"}
-
+        session = FollowupSession(api_key, combined_ocr_file, followups_dir, retrieval=retrieval, top_k=top_k,
+                                  token_budget=token_budget, stream=stream, conversation=conversation, use_cache=use_cache)
+        if conversation:
+            print("\nConversation mode: each question continues the conversation so far.")
         while True:
-            ocr_content = ""
-            if os.path.exists(combined_ocr_file):
-                with open(combined_ocr_file, "r", encoding='utf-8') as f:
-                    ocr_content = f.read()
-
-            followup_files = get_followup_files(followups_dir)
             selected_content = ""
-            if followup_files:
+            previous = [] if conversation else session.previous_questions()
+            if previous:
                 print("\nPrevious Follow-up Questions:")
-                for idx, followup_file in enumerate(followup_files, 1):
-                    with open(os.path.join(followups_dir, followup_file), "r", encoding='utf-8') as f:
-                        content = f.read()
-                        question_match = re.search(r"Follow-up Query:\n(.*?)\nResponse:", content, re.DOTALL)
-                        if question_match:
-                            print(f"{idx}. {question_match.group(1).strip()}")
+                for idx, (_, question) in enumerate(previous, 1):
+                    if question:
+                        print(f"{idx}. {question}")
                 print("0. None (only include OCR data)")
                 selection = input("Select questions to include (e.g., 1, 3 for followups 1 and 3, or 0 for none): ").strip()
                 if selection != "0":
-                    # Deduplicate selected indices
-                    selected_indices = list(set(int(idx.strip()) for idx in selection.split(",") if idx.strip().isdigit()))
-                    for idx in selected_indices:
-                        if 1 <= idx <= len(followup_files):
-                            with open(os.path.join(followups_dir, followup_files[idx-1]), "r", encoding='utf-8') as f:
-                                selected_content += f"\nPrevious Follow-up:\n{f.read().strip()}\n"
+                    selected_content = session.selected_history(
+                        int(idx.strip()) for idx in selection.split(",") if idx.strip().isdigit())
 
             query = input("\nEnter follow-up query (or 'exit' to quit): ")
             if query.lower() == "exit":
                 break
 
-            logger.debug("Sending follow-up query API call")
-            full_query = f"Here is the OCR-extracted text for your investigation:\n\n{ocr_content}\n\n{selected_content}\n\nFollow-up question:\n{query}"
-            query_tokens = estimate_tokens(full_query)
-            if query_tokens > 120000:
-                logger.warning(f"Query exceeds token limit ({query_tokens} tokens). Truncating...")
-                full_query = truncate_text(full_query, 120000)
-
-            payload = {
-                "model": "grok-3-fast-latest",
-                "messages": [{"role": "user", "content": full_query}],
-                "temperature": 0.01
-            }
-            response = requests.post(API_URL, headers=headers, json=payload, timeout=TIMEOUT)
-            response.raise_for_status()
-            response_json = response.json()
-            response_content = response_json['choices'][0]['message']['content']
-            json_file = os.path.join(logs_dir, f"followup_response_{followup_counter:03d}.json")
-            with open(json_file, "w", encoding='utf-8') as f:
-                json.dump(response_json, f, indent=2)
-                f.flush()
-            logger.debug(f"Saved JSON response: {json_file}")
-            logger.debug("Received follow-up query response")
-            print(response_content)
-
-            followup_filename = f"followup_{followup_counter:03d}.txt"
-            followup_file = os.path.join(followups_dir, followup_filename)
-            with open(followup_file, "w", encoding='utf-8') as f:
-                f.write(f"Follow-up Query:\n{query}\nResponse:\n{response_content}\n{'-'*50}\n")
-                f.flush()
-            logger.debug(f"Saved follow-up file: {followup_file}")
-            followup_counter += 1
+            if stream:
+                session.ask(query, selected_content, on_text=lambda text: print(text, end="", flush=True))
+                print()
+            else:
+                print(session.ask(query, selected_content))
     except requests.RequestException as e:
         logger.error(f"Interactive query API error: {str(e)}")
         raise
     except (OSError, IOError) as e:
         logger.error(f"File operation error in interactive query: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+    finally:
+        if session is not None:
+            session.close()
@@ -0,0 +1,118 @@
+# raster_scheduler.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import logging
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from metrics import get_metrics
+from utils import POPPLER_PATH, RASTER_WINDOW, RASTER_WORKERS
+
+logger = logging.getLogger(__name__)
+
+def render_pages(pdf_path, first_page, last_page, jpeg_dir):
+    """
+    Pool worker: renders pages first_page..last_page of a PDF to JPEGs in jpeg_dir.
+    Returns (rendered, failed, errors, seconds): (page_num, jpeg_path) pairs saved, paths that failed to save,
+    their error messages (logging in worker processes does not reach the case log), and the render time.
+    """
+    from pdf2image import convert_from_path
+
+    start = time.perf_counter()
+    base_name = os.path.basename(pdf_path).replace(".pdf", "")
+    images = convert_from_path(pdf_path, dpi=200, first_page=first_page, last_page=last_page,
+                               thread_count=1, poppler_path=POPPLER_PATH)
+    rendered, failed, errors = [], [], []
+    for offset, image in enumerate(images):
+        page_num = first_page + offset
+        jpeg_path = os.path.join(jpeg_dir, f"{base_name}-page-{page_num}.jpg")
+        try:
+            image.save(jpeg_path, "JPEG", quality=85)
+            rendered.append((page_num, jpeg_path))
+        except (OSError, IOError) as e:
+            failed.append(jpeg_path)
+            errors.append(f"page {page_num}: {str(e)}")
+        finally:
+            image.close()
+    return rendered, failed, errors, time.perf_counter() - start
+
+def page_ranges(pages, size):
+    """Splits page numbers into contiguous (first_page, last_page) ranges of at most `size` pages."""
+    ranges = []
+    for page_num in sorted(pages):
+        if ranges and page_num == ranges[-1][1] + 1 and page_num - ranges[-1][0] < size:
+            ranges[-1][1] = page_num
+        else:
+            ranges.append([page_num, page_num])
+    return [tuple(r) for r in ranges]
+
+class RasterScheduler:
+    """
+    Renders page ranges of many PDFs on a process pool sized to the machine.
+    Every PDF of a run is queued up front in document order, split into jobs of at most `window` pages
+    (smaller when there are too few pages to keep every worker busy), so one large PDF is spread across
+    all workers instead of pinning one. Pages are handed back per PDF in page order as their jobs finish.
+    """
+    def __init__(self, jpeg_dir, workers=RASTER_WORKERS, window=RASTER_WINDOW):
+        if not os.access(jpeg_dir, os.W_OK):
+            raise PermissionError(f"No write permission for {jpeg_dir}")
+        self.jpeg_dir = jpeg_dir
+        self.workers = max(1, workers)
+        self.window = window
+        self.jobs = {}
+        self._pool = None
+
+    def _job_size(self, total_pages):
+        # Aim for at least two jobs per worker, but never more than one window per job
+        return max(1, min(self.window, math.ceil(total_pages / (self.workers * 2))))
+
+    def schedule(self, plans):
+        """Queues rendering for each (pdf_path, pages) in plans, in order."""
+        plans = [(pdf_path, pages) for pdf_path, pages in plans if pages]
+        if not plans:
+            return
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        size = self._job_size(sum(len(pages) for _, pages in plans))
+        for pdf_path, pages in plans:
+            ranges = page_ranges(pages, size)
+            self.jobs[pdf_path] = deque(
+                (first, last, self._pool.submit(render_pages, pdf_path, first, last, self.jpeg_dir))
+                for first, last in ranges
+            )
+            logger.debug(f"Scheduled {len(pages)} pages of {pdf_path} as {len(ranges)} rendering jobs")
+
+    def pages(self, pdf_path, failed_paths):
+        """
+        Yields (page_num, jpeg_path) for a scheduled PDF in page order, waiting on each job in turn.
+        Pages that fail to render or save are appended to failed_paths.
+        """
+        jobs = self.jobs.pop(pdf_path, deque())
+        run_metrics = get_metrics()
+        while jobs:
+            first, last, future = jobs.popleft()
+            try:
+                # Time spent here is OCR waiting on the rasterizer
+                with run_metrics.stage("rasterize_wait"):
+                    rendered, failed, errors, seconds = future.result()
+            except Exception as e:
+                # pdf2image reports missing or broken Poppler with its own exception types, and a crashed
+                # worker surfaces as BrokenProcessPool
+                logger.error(f"Error converting pages {first}-{last} of PDF {pdf_path}: {str(e)}")
+                failed_paths.append(pdf_path)
+                continue
+            for error in errors:
+                logger.error(f"Failed to save JPEG for {pdf_path}, {error}")
+            failed_paths.extend(failed)
+            run_metrics.add_time("rasterize", seconds)
+            run_metrics.count("pages_rasterized", len(rendered))
+            for page_num, jpeg_path in rendered:
+                logger.debug("Saved JPEG: %s", jpeg_path)
+                yield page_num, jpeg_path
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,126 @@
+# response_archive.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_NAME = "responses.jsonl.gz"
+
+def archive_index_path(archive_file):
+    return archive_file + ".idx"
+
+class ResponseArchive:
+    """
+    Append-only archive of raw API responses for a case, kept in the logs directory instead of one
+    pretty-printed JSON file per call. Each response is appended as its own gzip member, so the whole
+    file still decompresses as JSONL (zcat), and a JSONL index of {"key", "offset", "length"} gives
+    random access to any response. Bytes past the last indexed record (an interrupted append) are
+    dropped when the archive is opened for writing. A key written again supersedes its earlier response.
+    """
+    def __init__(self, logs_dir, read_only=False):
+        self.path = os.path.join(logs_dir, ARCHIVE_NAME)
+        self.index_file = archive_index_path(self.path)
+        self._lock = threading.Lock()
+        self.entries = {}
+        self._end = 0
+        self._recover(read_only)
+
+    def _recover(self, read_only):
+        if os.path.exists(self.index_file):
+            valid = 0
+            with open(self.index_file, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Dropping incomplete index line in {self.index_file}")
+                        break
+                    self.entries[entry["key"]] = entry
+                    self._end = max(self._end, entry["offset"] + entry["length"])
+                    valid += len(line)
+            if valid < os.path.getsize(self.index_file) and not read_only:
+                with open(self.index_file, "r+b") as f:
+                    f.truncate(valid)
+        if not read_only and os.path.exists(self.path) and os.path.getsize(self.path) > self._end:
+            logger.warning(f"Truncating {os.path.getsize(self.path) - self._end} unindexed bytes from {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(self._end)
+
+    def append(self, key, response_json):
+        data = gzip.compress(json.dumps(response_json).encode("utf-8") + b"\n", compresslevel=6)
+        with self._lock:
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(data)
+            entry = {"key": key, "offset": offset, "length": len(data)}
+            # The index line is written only after the data, so it never points at a partial record
+            with open(self.index_file, "a", encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+            self.entries[key] = entry
+            self._end = offset + len(data)
+        logger.debug("Archived response %s (%d bytes)", key, len(data))
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            raise KeyError(f"No archived response {key} in {self.path}")
+        with open(self.path, "rb") as f:
+            f.seek(entry["offset"])
+            return json.loads(gzip.decompress(f.read(entry["length"])))
+
+    def keys(self):
+        with self._lock:
+            return list(self.entries)
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+def get_response_archive(logs_dir):
+    """Returns the process-wide archive for logs_dir, opening it on first use."""
+    logs_dir = os.path.abspath(logs_dir)
+    with _archives_lock:
+        archive = _archives.get(logs_dir)
+        if archive is None:
+            archive = ResponseArchive(logs_dir)
+            _archives[logs_dir] = archive
+        return archive
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List or extract archived API responses of a case.")
+    parser.add_argument("case", help="Case directory, its logs directory, or the archive file")
+    parser.add_argument("keys", nargs="*", help="Responses to print, e.g. ocr_response_exhibit_page-3")
+    parser.add_argument("--list", action="store_true", help="List the archived response keys")
+    args = parser.parse_args(argv)
+
+    logs_dir = args.case
+    if os.path.isfile(logs_dir):
+        logs_dir = os.path.dirname(logs_dir)
+    elif os.path.isdir(os.path.join(logs_dir, "logs")):
+        logs_dir = os.path.join(logs_dir, "logs")
+    if not os.path.exists(os.path.join(logs_dir, ARCHIVE_NAME)):
+        print(f"No {ARCHIVE_NAME} in {logs_dir}", file=sys.stderr)
+        return 1
+    # Read only, so it is safe to use while a run is still appending
+    archive = ResponseArchive(logs_dir, read_only=True)
+    if args.list or not args.keys:
+        for key in archive.keys():
+            print(key)
+        return 0
+    for key in args.keys:
+        try:
+            print(json.dumps(archive.get(key), indent=2))
+        except KeyError as e:
+            print(str(e), file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
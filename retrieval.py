@@ -0,0 +1,136 @@
+# retrieval.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from analysis import split_units
+from combined_ocr import index_path, read_combined_ocr
+from token_utils import pack_to_budget
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "retrieval_index.json"
+INDEX_VERSION = 1
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its of on or our she that the their "
+    "them they this to was we were what when where which who why will with you your".split()
+)
+
+def tokenize(text):
+    return [term for term in re.findall(r"\w+", text.lower()) if term not in STOPWORDS and len(term) > 1]
+
+def source_signature(combined_ocr_file):
+    """Size and mtime of the OCR file and its offset index; the retrieval index is rebuilt when they change."""
+    signature = []
+    for path in (combined_ocr_file, index_path(combined_ocr_file)):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append([stat.st_size, stat.st_mtime])
+        else:
+            signature.append(None)
+    return signature
+
+class RetrievalIndex:
+    """
+    BM25 inverted index over OCR pages. Each page is one document labelled "file, page N";
+    the page texts are stored alongside the postings so a query never re-reads the OCR file.
+    """
+    def __init__(self, labels, texts, postings, lengths, signature=None):
+        self.labels = labels
+        self.texts = texts
+        self.postings = postings
+        self.lengths = lengths
+        self.signature = signature
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    @classmethod
+    def build(cls, combined_ocr_file):
+        units = split_units(read_combined_ocr(combined_ocr_file), combined_ocr_file)
+        labels, texts, lengths = [], [], []
+        postings = {}
+        for doc_id, (label, text) in enumerate(units):
+            terms = tokenize(text)
+            labels.append(label)
+            texts.append(text)
+            lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, []).append([doc_id, count])
+        logger.info(f"Built retrieval index: {len(units)} pages, {len(postings)} terms")
+        return cls(labels, texts, postings, lengths, source_signature(combined_ocr_file))
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "signature": self.signature,
+                "labels": self.labels,
+                "texts": self.texts,
+                "lengths": self.lengths,
+                "postings": self.postings
+            }, f)
+        os.replace(tmp_path, path)
+        logger.debug(f"Saved retrieval index: {path}")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported retrieval index version in {path}")
+        return cls(data["labels"], data["texts"], data["postings"], data["lengths"], data.get("signature"))
+
+    def search(self, query, top_k):
+        """Returns up to top_k (score, doc_id) pairs for query, best first."""
+        n_docs = len(self.labels)
+        scores = Counter()
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = K1 * (1 - B + B * self.lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] += idf * tf * (K1 + 1) / (tf + norm)
+        return [(score, doc_id) for doc_id, score in scores.most_common(top_k)]
+
+    def context_for(self, query, top_k, token_budget):
+        """
+        Returns the top_k most relevant pages for query that fit in token_budget, formatted for a prompt
+        in document order, along with the labels used.
+        """
+        ranked = [doc_id for _, doc_id in self.search(query, top_k)]
+        labelled = [f"[{self.labels[doc_id]}]\n{self.texts[doc_id]}" for doc_id in ranked]
+        packed, used = pack_to_budget(labelled, token_budget)
+        selected = [ranked[i] for i in packed]
+        selected.sort()
+        labels = [self.labels[doc_id] for doc_id in selected]
+        context = "\n\n".join(f"[{self.labels[doc_id]}]\n{self.texts[doc_id]}" for doc_id in selected)
+        logger.debug(f"Retrieved {len(selected)} pages (~{used} tokens) for follow-up query")
+        return context, labels
+
+def load_or_build(combined_ocr_file, index_dir):
+    """Loads the case's retrieval index from index_dir, rebuilding it when the OCR output has changed."""
+    path = os.path.join(index_dir, INDEX_NAME)
+    signature = source_signature(combined_ocr_file)
+    if os.path.exists(path):
+        try:
+            index = RetrievalIndex.load(path)
+            if index.signature == signature:
+                logger.debug(f"Loaded retrieval index: {path}")
+                return index
+            logger.info("OCR output changed since the retrieval index was built; rebuilding")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load retrieval index {path}, rebuilding: {str(e)}")
+    index = RetrievalIndex.build(combined_ocr_file)
+    index.save(path)
+    return index
@@ -0,0 +1,42 @@
+# test_analysis.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import json
+import os
+import requests
+import analysis
+from combined_ocr import PAGE_BREAK
+
+class FlakyClient:
+    """Answers every analysis call, except the map call for part 2 and the first merge call."""
+    def __init__(self):
+        self.merge_calls = 0
+
+    def chat(self, payload):
+        prompt = payload["messages"][0]["content"]
+        if "part 2 of" in prompt:
+            raise requests.ConnectionError("connection reset")
+        if "consolidated set of findings" in prompt:
+            self.merge_calls += 1
+            if self.merge_calls == 1:
+                raise requests.HTTPError("503 Server Error")
+        return {"choices": [{"message": {"content": "finding " * 150}}]}
+
+def test_failed_chunks_and_merges_do_not_lose_findings(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis, "get_client", lambda api_key: FlakyClient())
+    pages = [f"page {n} " + "evidence " * 150 for n in range(1, 6)]
+    ocr_content = "File: memo\n### OCR ###\n" + PAGE_BREAK.join(pages)
+    result = analysis.analyze_map_reduce("key", ocr_content, str(tmp_path), str(tmp_path), "Summarize.",
+                                         chunk_tokens=300, max_workers=1)
+    assert result.endswith("could not be analyzed, so these findings do not cover:\n- memo, page 2\n")
+    with open(os.path.join(tmp_path, "combined_analysis.txt"), "r", encoding='utf-8') as f:
+        assert f.read() == result
+    with open(os.path.join(tmp_path, "analysis_chunks.json"), "r", encoding='utf-8') as f:
+        provenance = json.load(f)
+    assert [chunk["status"] for chunk in provenance["chunks"]][1].startswith("failed")
+    first_pass = provenance["reduce_passes"][0]
+    assert first_pass[0]["status"].startswith("failed")
+    # The failed merge's findings were merged in a later pass instead of being dropped
+    later_inputs = [source for merges in provenance["reduce_passes"][1:] for merge in merges for source in merge["inputs"]]
+    later_inputs += provenance["final_inputs"]
+    assert set(first_pass[0]["inputs"]) <= set(later_inputs)
@@ -0,0 +1,45 @@
+# test_api_client.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import json
+from api_client import XAIClient
+from mock_xai_server import MockXAIServer
+
+USAGE = {"prompt_tokens": 12, "completion_tokens": 7, "total_tokens": 19}
+
+def _event(data):
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _canned_stream():
+    # Raw UTF-8, as real servers send it, with no charset in the Content-Type
+    return "".join([
+        ": keep-alive\n\n",
+        _event({"id": "cmpl-1", "model": "grok-test", "choices": [{"index": 0, "delta": {"role": "assistant", "content": "Café § "}}]}),
+        _event({"id": "cmpl-1", "choices": [{"index": 0, "delta": {"content": "— “x”"}}]}),
+        _event({"id": "cmpl-1", "choices": [{"index": 0, "delta": {}, "finish_reason": "length"}]}),
+        _event({"id": "cmpl-1", "choices": [], "usage": USAGE}),
+        "data: [DONE]\n\n",
+        _event({"choices": [{"index": 0, "delta": {"content": "after done"}}]}),
+    ]).encode("utf-8")
+
+def test_stream_chat_replays_canned_stream():
+    # 5-byte pieces split the multi-byte characters across network chunks
+    with MockXAIServer(latency=0, jitter=0, stream_chunk_chars=5, canned_stream=_canned_stream()) as server:
+        client = XAIClient("test-key", api_url=server.url)
+        deltas = []
+        response = client.stream_chat({"model": "grok-test", "messages": [{"role": "user", "content": "Hi"}]},
+                                       on_text=deltas.append)
+        assert server.snapshot()["streams"] == 1
+    assert "".join(deltas) == "Café § — “x”"
+    assert response["choices"][0]["message"]["content"] == "Café § — “x”"
+    assert response["choices"][0]["finish_reason"] == "length"
+    assert response["usage"] == USAGE
+    assert response["model"] == "grok-test"
+    assert response["timing"]["ttft"] is not None
+
+def test_chat_returns_json():
+    with MockXAIServer(latency=0, jitter=0, response_chars=50, seed=1) as server:
+        response = XAIClient("test-key", api_url=server.url).chat(
+            {"model": "grok-test", "messages": [{"role": "user", "content": "Hi"}]})
+    assert response["choices"][0]["finish_reason"] == "stop"
+    assert len(response["choices"][0]["message"]["content"]) == 50
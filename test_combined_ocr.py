@@ -0,0 +1,89 @@
+# test_combined_ocr.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import os
+from combined_ocr import CombinedOCRWriter, index_path, iter_pages, load_index, read_combined_ocr
+
+def _write(path, documents):
+    writer = CombinedOCRWriter(path)
+    for group, file_key, pages in documents:
+        writer.append(group, file_key, pages)
+    return writer
+
+def test_pages_are_read_from_indexed_ranges(tmp_path):
+    path = str(tmp_path / "combined_ocr.txt")
+    _write(path, [("memo", "memo.pdf", [(1, "Première page"), (2, "second")]),
+                  ("photo", "photo.png", [(1, "receipt")])]).close()
+    assert list(iter_pages(path)) == [("memo", "memo.pdf", 1, "Première page"), ("memo", "memo.pdf", 2, "second"),
+                                      ("photo", "photo.png", 1, "receipt")]
+    assert read_combined_ocr(path).startswith("File: memo\n### OCR ###\nPremière page")
+
+def test_compact_keeps_the_newest_record_in_document_order(tmp_path):
+    path = str(tmp_path / "combined_ocr.txt")
+    writer = _write(path, [("a", "a.pdf", [(1, "old a")]), ("b", "b.pdf", [(1, "b")])])
+    writer.append("a", "a.pdf", [(1, "new a")])
+    size = os.path.getsize(path)
+    writer.compact()
+    writer.close()
+    assert os.path.getsize(path) < size
+    assert [entry["file_key"] for entry in load_index(path)] == ["a.pdf", "b.pdf"]
+    assert [text for _, _, _, text in iter_pages(path)] == ["new a", "b"]
+
+def test_torn_record_is_truncated_on_open(tmp_path):
+    path = str(tmp_path / "combined_ocr.txt")
+    _write(path, [("a", "a.pdf", [(1, "complete")])]).close()
+    size = os.path.getsize(path)
+    # A crash after the data was written but before its index line
+    with open(path, "ab") as f:
+        f.write(b"File: b\n### OCR ###\nhalf a rec")
+    with open(index_path(path), "a", encoding='utf-8') as f:
+        f.write('{"group": "b", "file_')
+    writer = CombinedOCRWriter(path)
+    assert os.path.getsize(path) == size
+    assert [text for _, _, _, text in iter_pages(path)] == ["complete"]
+    writer.append("b", "b.pdf", [(1, "redone")])
+    writer.close()
+    assert [text for _, _, _, text in iter_pages(path)] == ["complete", "redone"]
+
+def test_unindexed_file_is_moved_aside(tmp_path):
+    path = str(tmp_path / "combined_ocr.txt")
+    with open(path, "w", encoding='utf-8') as f:
+        f.write("File: legacy\n### OCR ###\nold format\n")
+    writer = _write(path, [("a", "a.pdf", [(1, "text")])])
+    writer.close()
+    assert os.path.exists(path + ".bak")
+    assert "legacy" not in read_combined_ocr(path)
+
+def test_compaction_interrupted_between_replaces_is_finished_on_open(tmp_path, monkeypatch):
+    path = str(tmp_path / "combined_ocr.txt")
+    writer = _write(path, [("a", "a.pdf", [(1, "old a")]), ("b", "b.pdf", [(1, "b")])])
+    writer.append("a", "a.pdf", [(1, "new a")])
+    replace = os.replace
+    def crash_on_index(src, dst):
+        if dst == index_path(path):
+            raise KeyboardInterrupt("crash")
+        replace(src, dst)
+    monkeypatch.setattr(os, "replace", crash_on_index)
+    try:
+        writer.compact()
+    except KeyboardInterrupt:
+        pass
+    monkeypatch.setattr(os, "replace", replace)
+    # The data file is compacted but the index still points into the old layout
+    assert len(load_index(path)) == 3
+    writer = CombinedOCRWriter(path)
+    assert [text for _, _, _, text in iter_pages(path)] == ["new a", "b"]
+    assert writer.has_record("a.pdf") and writer.has_record("b.pdf")
+    writer.close()
+
+def test_index_not_matching_its_data_is_moved_aside(tmp_path):
+    path = str(tmp_path / "combined_ocr.txt")
+    _write(path, [("a", "a.pdf", [(1, "first text")]), ("b", "b.pdf", [(1, "second")])]).close()
+    with open(path, "r+b") as f:
+        f.write(b"File: z")
+    writer = CombinedOCRWriter(path)
+    assert not writer.has_record("a.pdf")
+    assert os.path.exists(path + ".bak") and os.path.exists(index_path(path) + ".bak")
+    writer.append("a", "a.pdf", [(1, "rewritten")])
+    writer.close()
+    assert [text for _, _, _, text in iter_pages(path)] == ["rewritten"]
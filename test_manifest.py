@@ -0,0 +1,60 @@
+# test_manifest.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+from benchmark import generate_inputs
+from manifest import JobManifest
+from processing import process_pdfs
+from utils import create_case_dir
+
+def test_resume_from_the_first_page_not_done(tmp_path):
+    manifest = JobManifest(str(tmp_path))
+    manifest.register_file("doc.pdf", "doc")
+    manifest.set_page_count("doc.pdf", 3)
+    manifest.record_page("doc.pdf", 1, "page one")
+    manifest.record_page("doc.pdf", 2, "[OCR failed]", error="timeout")
+    assert not manifest.complete_file("doc.pdf")
+    assert manifest.failures() == (0, 1)
+    manifest.close()
+
+    # A new run sees what the interrupted one left
+    manifest = JobManifest(str(tmp_path))
+    assert manifest.pending_pages("doc.pdf", 3) == [2, 3]
+    assert manifest.completed_groups() == set()
+    manifest.record_page("doc.pdf", 3, "page three")
+    manifest.record_page("doc.pdf", 2, "page two")
+    assert manifest.complete_file("doc.pdf")
+    assert manifest.is_file_done("doc.pdf")
+    assert manifest.completed_groups() == {"doc"}
+    assert manifest.document_text("doc.pdf") == "page one\n\n--- Page Break ---\n\npage two\n\n--- Page Break ---\n\npage three"
+    assert manifest.stats()["ocr_done"] == {"pages": 3, "attempts": 4}
+    manifest.close()
+
+def test_failed_file_keeps_its_group_open(tmp_path):
+    manifest = JobManifest(str(tmp_path))
+    for file_key in ("scan-part_1_of_2.pdf", "scan-part_2_of_2.pdf"):
+        manifest.register_file(file_key, "scan")
+        manifest.set_page_count(file_key, 1)
+        manifest.record_page(file_key, 1, "text")
+        manifest.complete_file(file_key)
+    assert manifest.completed_groups() == {"scan"}
+    manifest.fail_file("scan-part_2_of_2.pdf")
+    assert not manifest.is_file_done("scan-part_2_of_2.pdf")
+    assert manifest.completed_groups() == set()
+    assert manifest.failures() == (1, 0)
+    manifest.close()
+
+def test_rerun_only_ocrs_new_files(tmp_path, mock_client):
+    api_key, server = mock_client
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    names = generate_inputs(str(input_dir), 3, 1, "png")
+    case_dir = create_case_dir(str(tmp_path / "cases"), "case")
+    def run(files):
+        return process_pdfs(api_key, str(input_dir), files, f"{case_dir}/JPEG", f"{case_dir}/OCR", use_cache=False)
+    run(names[:2])
+    assert server.snapshot()["requests"] == 2
+    combined = run(names)
+    assert server.snapshot()["requests"] == 3
+    with open(combined, "r", encoding='utf-8') as f:
+        text = f.read()
+    assert [name for name in names if f"File: {name}\n" in text] == names
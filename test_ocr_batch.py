@@ -0,0 +1,67 @@
+# test_ocr_batch.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import os
+import processing
+from benchmark import generate_inputs
+from ocr_batch import BatchPacker, split_batch_text
+from ocr_cache import OCRCache
+from processing import extract_ocr
+
+def test_split_batch_text():
+    text = "=== PAGE 1 ===\nfirst page\n\n=== PAGE 2 ===\nsecond\npage\n"
+    assert split_batch_text(text, 2) == ["first page", "second\npage"]
+
+def test_split_batch_text_rejects_garbled_responses():
+    assert split_batch_text("=== PAGE 1 ===\na\n=== PAGE 3 ===\nc", 2) is None
+    assert split_batch_text("=== PAGE 2 ===\nb\n=== PAGE 1 ===\na", 2) is None
+    assert split_batch_text("=== PAGE 1 ===\na", 2) is None
+    assert split_batch_text("Here is the text:\n=== PAGE 1 ===\na\n=== PAGE 2 ===\nb", 2) is None
+
+def test_packer_closes_batches_at_the_page_limit():
+    packer = BatchPacker(max_pages=3, max_bytes=10 ** 9, max_output_tokens=10 ** 6)
+    closed = [packer.add(n, 1024) for n in range(1, 8)]
+    assert [batch for batch in closed if batch] == [[1, 2, 3], [4, 5, 6]]
+    assert packer.flush() == [7]
+    assert packer.flush() == []
+
+def test_packer_learns_from_responses():
+    packer = BatchPacker(max_pages=8, max_bytes=10 ** 9, max_output_tokens=1000)
+    assert not packer.is_single(100 * 1024)
+    # Pages turn out to produce far more text per KB than the prior assumes
+    for _ in range(20):
+        packer.observe(100 * 1024, 2000)
+    assert packer.is_single(100 * 1024)
+    assert packer.add("a", 20 * 1024) is None
+    assert packer.add("b", 20 * 1024) is None
+    assert packer.add("c", 20 * 1024) == ["a", "b"]
+
+def test_short_pages_share_one_request(tmp_path, mock_client):
+    api_key, server = mock_client
+    names = generate_inputs(str(tmp_path), 3, 1, "png")
+    logs_dir = tmp_path / "logs"
+    logs_dir.mkdir()
+    pages = [(n, os.path.join(tmp_path, name)) for n, name in enumerate(names, 1)]
+    _, text = extract_ocr("synthetic.pdf", pages, api_key, str(logs_dir), use_cache=False, optimize=False, batch=True)
+    assert server.snapshot()["requests"] == 1
+    texts = text.split("\n\n--- Page Break ---\n\n")
+    assert len(texts) == 3
+    assert all(texts) and not any("=== PAGE" in page for page in texts)
+
+def test_batched_text_is_cached_apart_from_single_page_text(tmp_path, monkeypatch, mock_client):
+    api_key, server = mock_client
+    names = generate_inputs(str(tmp_path), 2, 1, "png")
+    logs_dir = tmp_path / "logs"
+    logs_dir.mkdir()
+    cache = OCRCache(str(tmp_path / "cache"))
+    monkeypatch.setattr(processing, "get_ocr_cache", lambda: cache)
+    pages = [(n, os.path.join(tmp_path, name)) for n, name in enumerate(names, 1)]
+    extract_ocr("synthetic.pdf", pages, api_key, str(logs_dir), optimize=False, batch=True)
+    assert server.snapshot()["requests"] == 1
+    # A single-page run must not be served the batch prompt's output
+    extract_ocr("synthetic.pdf", pages, api_key, str(logs_dir), optimize=False)
+    assert server.snapshot()["requests"] == 3
+    # Batches reuse either
+    extract_ocr("synthetic.pdf", pages, api_key, str(logs_dir), optimize=False, batch=True)
+    assert server.snapshot()["requests"] == 3
+    cache.close()
@@ -0,0 +1,56 @@
+# test_page_filter.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import os
+import shutil
+from benchmark import generate_inputs, PAGE_SIZE
+from page_filter import PageFilter, NEW, BLANK, DUPLICATE
+
+def test_different_pages_are_never_merged(tmp_path):
+    # Synthetic pages share a layout and vocabulary, so they look alike at thumbnail scale
+    names = generate_inputs(str(tmp_path), 12, 1, "png")
+    page_filter = PageFilter()
+    kinds = [page_filter.classify(os.path.join(tmp_path, name), name)[0] for name in names]
+    assert kinds == [NEW] * 12
+    assert page_filter.stats() == {NEW: 12, BLANK: 0, DUPLICATE: 0}
+
+def test_identical_pages_reuse_the_first(tmp_path):
+    names = generate_inputs(str(tmp_path), 2, 1, "png")
+    shutil.copy(os.path.join(tmp_path, names[0]), os.path.join(tmp_path, "copy.png"))
+    page_filter = PageFilter()
+    kind, first = page_filter.classify(os.path.join(tmp_path, names[0]), "first")
+    assert kind == NEW
+    assert page_filter.classify(os.path.join(tmp_path, names[1]), "second")[0] == NEW
+    kind, entry = page_filter.classify(os.path.join(tmp_path, "copy.png"), "copy")
+    assert kind == DUPLICATE
+    assert entry is first
+
+def test_blank_page(tmp_path):
+    from PIL import Image
+
+    path = os.path.join(tmp_path, "blank.png")
+    Image.new("L", PAGE_SIZE, 255).save(path)
+    assert PageFilter().classify(path, "blank") == (BLANK, None)
+
+def test_sparse_pages_are_not_blank(tmp_path):
+    from PIL import Image, ImageDraw
+
+    # Slip sheets, stamps and signature pages carry a single short line of ink
+    for name, draw_mark in [("slip", lambda draw: draw.text((600, 800), "EXHIBIT 14", fill=0)),
+                            ("stamp", lambda draw: draw.text((900, 1500), "CONFIDENTIAL", fill=0)),
+                            ("signature", lambda draw: draw.line((200, 1200, 700, 1200), fill=0, width=2))]:
+        image = Image.new("L", PAGE_SIZE, 255)
+        draw_mark(ImageDraw.Draw(image))
+        path = os.path.join(tmp_path, f"{name}.png")
+        image.save(path)
+        assert PageFilter().classify(path, name)[0] == NEW
+
+def test_scanner_specks_are_blank(tmp_path):
+    from PIL import Image
+
+    image = Image.new("L", PAGE_SIZE, 255)
+    for x, y in [(300, 400), (301, 400), (900, 1200), (640, 1500)]:
+        image.putpixel((x, y), 0)
+    path = os.path.join(tmp_path, "specks.png")
+    image.save(path)
+    assert PageFilter().classify(path, "specks") == (BLANK, None)
@@ -0,0 +1,47 @@
+# test_page_tiler.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import io
+from page_tiler import crop_tiles, plan_tiles, stitch_tiles
+
+def _page(lines, columns=1, width=1275, pitch=30):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("L", (width, 120 + lines * pitch), 255)
+    draw = ImageDraw.Draw(image)
+    column_width = (width - 200) // columns
+    for column in range(columns):
+        left = 100 + column * column_width
+        for line in range(lines):
+            draw.rectangle((left, 60 + line * pitch, left + column_width - 80, 60 + line * pitch + 12), fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+def test_light_page_is_not_tiled():
+    assert plan_tiles(_page(20)) == []
+
+def test_dense_page_is_split_into_bands_in_reading_order():
+    image = _page(90)
+    tiles = plan_tiles(image, min_lines=70, lines_per_tile=35)
+    assert len(tiles) == 3
+    assert {column for column, _, _ in tiles} == {0}
+    tops = [box[1] for _, box, _ in tiles]
+    assert tops == sorted(tops)
+    # Cuts fall in the white space between lines, so no tile overlaps the previous one
+    assert not any(overlaps for _, _, overlaps in tiles)
+    assert len(crop_tiles(image, [box for _, box, _ in tiles])) == 3
+
+def test_columns_are_tiled_separately():
+    tiles = plan_tiles(_page(50, columns=2), min_lines=70, lines_per_tile=35)
+    assert {column for column, _, _ in tiles} == {0, 1}
+
+def test_stitch_drops_lines_repeated_at_an_overlapping_cut():
+    tiles = [(0, (0, 0, 10, 10), False), (0, (0, 8, 10, 20), True)]
+    texts = ["line one\nline two\nline three", "Line  three\nline four"]
+    assert stitch_tiles(tiles, texts) == "line one\nline two\nline three\nline four"
+
+def test_stitch_keeps_similar_lines_at_a_clean_cut():
+    tiles = [(0, (0, 0, 10, 10), False), (0, (0, 10, 10, 20), False), (1, (10, 0, 20, 20), False)]
+    texts = ["tile text 1", "tile text 1\ntile text 2", "right column"]
+    assert stitch_tiles(tiles, texts) == "tile text 1\ntile text 1\ntile text 2\n\nright column"
@@ -0,0 +1,56 @@
+# test_text_layer.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+from text_layer import covers_page, is_usable_text, parse_bbox, parse_image_list
+
+FILING_STAMP = "Case 1:20-cv-01234-ABC Document 45-3 Filed 05/01/20 Page 3 of 50 PageID #: 1234"
+LEGEND = "CONFIDENTIAL - SUBJECT TO PROTECTIVE ORDER DEF-000123"
+BODY = ("The parties met on March 3 to discuss the terms of the settlement agreement and the schedule "
+        "for producing the remaining documents")
+
+def _words(text, y):
+    return [(y, y + 10, word) for word in text.split()]
+
+def _bbox(pages):
+    parts = ['<html><body><doc>']
+    for words in pages:
+        parts.append('<page width="612.000000" height="792.000000">')
+        parts.extend(f'<word xMin="72.0" yMin="{top:.6f}" xMax="100.0" yMax="{bottom:.6f}">{word}</word>'
+                     for top, bottom, word in words)
+        parts.append('</page>')
+    parts.append('</doc></body></html>')
+    return "\n".join(parts)
+
+def test_stamps_pass_the_text_check_but_do_not_cover_the_page():
+    # Both would have skipped OCR on the text quality check alone
+    assert is_usable_text(FILING_STAMP)
+    assert is_usable_text(LEGEND)
+    layout = (612.0, 792.0, _words(FILING_STAMP, 20) + _words(LEGEND, 760))
+    assert not covers_page(layout)
+    assert not covers_page(layout, image_coverage=1.0)
+
+def test_body_text_covers_the_page():
+    words = _words(FILING_STAMP, 20) + [w for i in range(30) for w in _words(BODY, 120 + i * 18)]
+    assert covers_page((612.0, 792.0, words))
+    assert covers_page((612.0, 792.0, words), image_coverage=1.0)
+
+def test_scan_with_a_short_text_block_goes_to_ocr():
+    # A scan with a stamped line in the body: fine as text on a vector page, not as the text of a scan
+    words = _words(BODY, 300)
+    assert covers_page((612.0, 792.0, words))
+    assert not covers_page((612.0, 792.0, words), image_coverage=0.9)
+
+def test_parse_bbox_and_image_list():
+    layouts = parse_bbox(_bbox([_words("Smith &amp; Co", 100), []]))
+    assert layouts == {1: (612.0, 792.0, [(100.0, 110.0, "Smith"), (100.0, 110.0, "&"), (100.0, 110.0, "Co")]),
+                       2: (612.0, 792.0, [])}
+    image_list = (
+        "page   num  type   width height color comp bpc  enc interp  object ID x-ppi y-ppi size ratio\n"
+        "--------------------------------------------------------------------------------------------\n"
+        "   1     0 image    2550  3300  gray    1   8  jpeg   no         9  0   300   300  571K 9.1%\n"
+        "   2     1 image     300   100  rgb     3   8  image  no        12  0   150   150  20K  22%\n"
+        "   2     2 smask     300   100  gray    1   8  image  no        12  0   150   150  2K   7%\n"
+    )
+    coverage = parse_image_list(image_list, layouts)
+    assert coverage[1] == 1.0
+    assert round(coverage[2], 3) == round((144 * 48) / (612 * 792), 3)
@@ -0,0 +1,19 @@
+# test_token_utils.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+from token_utils import TokenCounter, count_tokens, pack_to_budget
+
+def test_pack_to_budget_skips_items_that_overflow():
+    items = ["alpha " * 100, "beta " * 1000, "gamma " * 50]
+    budget = count_tokens(items[0]) + count_tokens(items[2]) + count_tokens("\n\n")
+    packed, used = pack_to_budget(items, budget)
+    assert packed == [0, 2]
+    assert used == budget
+
+def test_token_counter_counts_separators_between_parts():
+    counter = TokenCounter(10 ** 6, separator="\n\n")
+    first = counter.add("system prompt", "question")
+    assert first == count_tokens("system prompt") + count_tokens("question")
+    assert counter.try_add("earlier answer")
+    assert counter.total == first + count_tokens("\n\n") + count_tokens("earlier answer")
+    assert not TokenCounter(1).try_add("far too long for the budget")
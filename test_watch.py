@@ -0,0 +1,53 @@
+# test_watch.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import os
+import pdf2image
+from pdf2image.exceptions import PDFPageCountError
+from benchmark import generate_inputs
+from utils import create_case_dir
+from watch import IntakeWatcher, is_complete_group
+
+def _watcher(tmp_path, api_key="test-key"):
+    intake = tmp_path / "intake"
+    intake.mkdir(exist_ok=True)
+    case_dir = create_case_dir(str(tmp_path / "cases"), "intake")
+    return IntakeWatcher(api_key, str(intake), case_dir, stable_seconds=0, retry_seconds=300,
+                         use_cache=False)
+
+def test_image_parts_wait_for_the_whole_group(tmp_path):
+    watcher = _watcher(tmp_path)
+    intake = tmp_path / "intake"
+    (intake / "scan-part_1_of_2.png").write_bytes(b"part one")
+    watcher.stable_files(now=0)
+    assert watcher.ready_groups(watcher.stable_files(now=1)) == {}
+    (intake / "scan-part_2_of_2.PNG").write_bytes(b"part two")
+    watcher.stable_files(now=2)
+    assert watcher.ready_groups(watcher.stable_files(now=3)) == {
+        "scan": ["scan-part_1_of_2.png", "scan-part_2_of_2.PNG"]}
+
+def test_is_complete_group():
+    assert is_complete_group(["memo.pdf"])
+    assert is_complete_group(["a-part_2_of_2.jpg", "a-part_1_of_2.pdf"])
+    assert not is_complete_group(["a-part_1_of_3.pdf", "a-part_3_of_3.pdf"])
+
+def test_unreadable_pdf_is_retried_alone(tmp_path, monkeypatch, mock_client):
+    api_key, server = mock_client
+    def unreadable(pdf_path, **kwargs):
+        raise PDFPageCountError("Unable to get page count.")
+    monkeypatch.setattr(pdf2image, "pdfinfo_from_path", unreadable)
+    watcher = _watcher(tmp_path, api_key)
+    intake = str(tmp_path / "intake")
+    names = generate_inputs(intake, 3, 1, "png")
+    with open(os.path.join(intake, "broken.pdf"), "wb") as f:
+        f.write(b"%PDF-1.4 truncated")
+    try:
+        watcher.run_once()  # First sighting; nothing is stable yet
+        assert watcher.run_once() == 4
+        assert sorted(watcher.processed) == names
+        assert list(watcher.retry_at) == ["broken.pdf"]
+        assert server.snapshot()["requests"] == 3
+        # The healthy files are not picked up again while the broken one waits for its retry
+        assert watcher.run_once() == 0
+    finally:
+        watcher.close()
@@ -0,0 +1,153 @@
+# text_layer.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import html
+import logging
+import os
+import re
+import subprocess
+from utils import POPPLER_PATH, TEXT_LAYER_MIN_CHARS, TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Share of non-space characters that must be letters, digits or common punctuation
+MIN_CLEAN_RATIO = 0.85
+# Share of word-like tokens that must look like real words (contain a vowel, or are numbers)
+MIN_WORD_RATIO = 0.6
+# Glyphs without a Unicode mapping come out as replacement characters or "(cid:NN)"
+GARBAGE_PATTERN = re.compile(r"�|\(cid:\d+\)")
+# Words centred within this share of the page height from the top or bottom edge are headers and footers
+# (court filing stamps, Bates numbers, confidentiality legends) and say nothing about the page body
+EDGE_STRIP_FRACTION = 0.12
+# A page with an embedded image covering this share of its area is a scan; its body text must then span
+# at least SCAN_TEXT_SPAN of the page height to count as an OCR layer for the whole image
+SCAN_IMAGE_COVERAGE = 0.5
+SCAN_TEXT_SPAN = 0.3
+
+BBOX_PATTERN = re.compile(r'<page width="([\d.]+)" height="([\d.]+)">'
+                          r'|<word xMin="[\d.]+" yMin="([\d.]+)" xMax="[\d.]+" yMax="([\d.]+)">(.*?)</word>')
+
+def _poppler_binary(name):
+    candidate = os.path.join(POPPLER_PATH, name)
+    return candidate if os.path.exists(candidate) else name
+
+def _run_poppler(name, args):
+    """Runs a Poppler command-line tool and returns its output, or None if it is unavailable or fails."""
+    try:
+        result = subprocess.run([_poppler_binary(name)] + args, capture_output=True, timeout=TIMEOUT * 4, check=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"{name} {' '.join(args)} failed: {str(e)}")
+        return None
+    return result.stdout.decode("utf-8", errors="replace")
+
+def extract_pdf_text(pdf_path):
+    """
+    Extracts the embedded text layer of every page with Poppler's pdftotext in a single call.
+    Returns {page_num: text}; empty if the PDF has no text layer or pdftotext is unavailable.
+    """
+    output = _run_poppler("pdftotext", ["-layout", "-enc", "UTF-8", pdf_path, "-"])
+    if output is None:
+        return {}
+    pages = output.split("\f")
+    # pdftotext ends the last page with a form feed too
+    if pages and not pages[-1].strip():
+        pages.pop()
+    return {page_num: text for page_num, text in enumerate(pages, 1)}
+
+def parse_bbox(xhtml):
+    """
+    Parses pdftotext -bbox output into {page_num: (width, height, [(y_min, y_max, word), ...])}, in points
+    with y growing downwards.
+    """
+    layouts = {}
+    words = None
+    for match in BBOX_PATTERN.finditer(xhtml):
+        if match.group(1) is not None:
+            words = []
+            layouts[len(layouts) + 1] = (float(match.group(1)), float(match.group(2)), words)
+        elif words is not None:
+            words.append((float(match.group(3)), float(match.group(4)), html.unescape(match.group(5))))
+    return layouts
+
+def parse_image_list(output, layouts):
+    """
+    Parses pdfimages -list output into {page_num: share of the page area covered by its largest image}.
+    Masks are skipped; an image's size on the page follows from its pixel size and resolution.
+    """
+    coverage = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) < 14 or not fields[0].isdigit() or fields[2] != "image":
+            continue
+        page_num = int(fields[0])
+        if page_num not in layouts:
+            continue
+        try:
+            width, height, x_ppi, y_ppi = (float(fields[i]) for i in (3, 4, 12, 13))
+        except ValueError:
+            continue
+        if x_ppi <= 0 or y_ppi <= 0:
+            continue
+        page_width, page_height, _ = layouts[page_num]
+        share = (width / x_ppi * 72) * (height / y_ppi * 72) / max(1.0, page_width * page_height)
+        coverage[page_num] = max(coverage.get(page_num, 0.0), min(1.0, share))
+    return coverage
+
+def is_usable_text(text, min_chars=TEXT_LAYER_MIN_CHARS):
+    """
+    Quality check for an extracted text layer: enough characters, few unmapped glyphs, and mostly
+    real words. Scans with an invisible OCR layer of poor quality or font-encoding garbage fail it.
+    """
+    compact = re.sub(r"\s+", "", text)
+    if len(compact) < min_chars:
+        return False
+    if len(GARBAGE_PATTERN.findall(text)) > len(compact) * 0.01:
+        return False
+    clean = sum(1 for ch in compact if ch.isalnum() or ch in ".,;:!?'\"()-/$%&@#*+=[]<>_§")
+    if clean / len(compact) < MIN_CLEAN_RATIO:
+        return False
+    words = re.findall(r"[^\W_]+", text)
+    if not words:
+        return False
+    wordlike = sum(1 for word in words if word.isdigit() or re.search(r"[aeiouyAEIOUY]", word) or not word.isascii())
+    return wordlike / len(words) >= MIN_WORD_RATIO
+
+def covers_page(layout, image_coverage=0.0, min_chars=TEXT_LAYER_MIN_CHARS):
+    """
+    Whether a page's text layer covers its body rather than just a header or footer strip. Text in the
+    top and bottom EDGE_STRIP_FRACTION is ignored, and what remains must pass is_usable_text on its own.
+    On a scanned page (an image covering SCAN_IMAGE_COVERAGE of it) the body text must also span
+    SCAN_TEXT_SPAN of the page height, so a stamp added to a scan doesn't pass for its text.
+    """
+    _, height, words = layout
+    strip = height * EDGE_STRIP_FRACTION
+    body = [(top, bottom, word) for top, bottom, word in words if strip <= (top + bottom) / 2 <= height - strip]
+    if not is_usable_text(" ".join(word for _, _, word in body), min_chars):
+        return False
+    if image_coverage >= SCAN_IMAGE_COVERAGE:
+        span = max(bottom for _, bottom, _ in body) - min(top for top, _, _ in body)
+        return span >= height * SCAN_TEXT_SPAN
+    return True
+
+def usable_text_pages(pdf_path, pages):
+    """
+    Returns {page_num: text} for those of `pages` whose embedded text layer passes the quality check and
+    covers the page body. Word positions come from pdftotext -bbox and image sizes from pdfimages -list;
+    if word positions can't be read, every page goes to OCR.
+    """
+    text_pages = extract_pdf_text(pdf_path)
+    candidates = {page_num: text_pages[page_num] for page_num in pages
+                  if page_num in text_pages and is_usable_text(text_pages[page_num])}
+    if not candidates:
+        logger.debug(f"Text layer usable for 0 of {len(pages)} pages of {pdf_path}")
+        return {}
+    bbox = _run_poppler("pdftotext", ["-bbox", "-enc", "UTF-8", pdf_path, "-"])
+    layouts = parse_bbox(bbox) if bbox is not None else {}
+    image_list = _run_poppler("pdfimages", ["-list", pdf_path])
+    images = parse_image_list(image_list, layouts) if image_list is not None else {}
+    usable = {page_num: text.strip() for page_num, text in candidates.items()
+              if page_num in layouts and covers_page(layouts[page_num], images.get(page_num, 0.0))}
+    if len(usable) < len(candidates):
+        logger.info(f"{len(candidates) - len(usable)} pages of {pdf_path} only have header or footer text; sending them to OCR")
+    logger.debug(f"Text layer usable for {len(usable)} of {len(pages)} pages of {pdf_path}")
+    return usable
@@ -1,7 +1,11 @@
-# token_utils.py 
+# token_utils.py
 # Created by SuperGrok and Sir_Cornealious on X
 
 import logging
+import math
+import re
+import threading
+from functools import lru_cache
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -9,27 +13,141 @@ logger = logging.getLogger(__name__)
 # Maximum token limit with a 10% safety margin (131072 * 0.9)
 MAX_TOKENS = 120000
 
+# Pre-tokenizer modelled on byte-pair-encoding tokenizers: contractions, words with an optional
+# leading space, numbers in groups of up to three digits, punctuation runs, and whitespace
+PIECE_PATTERN = re.compile(r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+(?!\S)|\s+""")
+
+# Running ratio of actual (API-reported) to counted prompt tokens, kept within sane bounds
+_calibration = 1.0
+_calibration_lock = threading.Lock()
+CALIBRATION_BOUNDS = (0.7, 1.5)
+CALIBRATION_WEIGHT = 0.2
+
+@lru_cache(maxsize=200000)
+def _piece_tokens(piece: str) -> int:
+    """
+    Token count of one pre-tokenized piece. Cached, so the vocabulary of a corpus is only costed once.
+    """
+    word = piece.lstrip(" ")
+    if not word:
+        return 1
+    if word.isalpha():
+        if not word.isascii():
+            # Non-Latin scripts split into roughly one token per two UTF-8 bytes
+            return max(1, math.ceil(len(word.encode("utf-8")) / 2))
+        if word.isupper() and len(word) > 3:
+            return math.ceil(len(word) / 3)
+        if len(word) <= 8:
+            return 1
+        return math.ceil(len(word) / 6)
+    if word.isdigit() or word.isspace():
+        return 1
+    # Punctuation and symbol runs: common pairs merge, the rest are one token per character
+    return max(1, math.ceil(len(word.encode("utf-8")) / 2))
+
+def _segment_pieces(text: str):
+    return PIECE_PATTERN.findall(text)
+
+# Texts up to this size are cached whole; larger ones are counted paragraph by paragraph
+SEGMENT_CACHE_CHARS = 65536
+
+def _count_pieces(text: str) -> int:
+    return sum(_piece_tokens(piece) for piece in _segment_pieces(text))
+
+@lru_cache(maxsize=4096)
+def _count_cached(text: str) -> int:
+    return _count_pieces(text)
+
+def _count_segment(text: str) -> int:
+    # Pages and paragraphs that recur across prompts hit the cache instead of being re-tokenized
+    if len(text) <= SEGMENT_CACHE_CHARS:
+        return _count_cached(text)
+    total = text.count("\n\n")
+    for paragraph in text.split("\n\n"):
+        total += _count_cached(paragraph) if len(paragraph) <= SEGMENT_CACHE_CHARS else _count_pieces(paragraph)
+    return total
+
+def count_tokens(text: str) -> int:
+    """
+    Counts tokens offline with the pre-tokenizer and cached piece costs, scaled by the calibration
+    learned from API-reported usage. Use this instead of estimate_tokens where logging every call is noise.
+    """
+    with _calibration_lock:
+        factor = _calibration
+    return max(1, int(round(_count_segment(text) * factor)))
+
+def calibrate(text: str, actual_tokens: int) -> float:
+    """
+    Updates the calibration factor from a prompt whose real token count was reported by the API.
+    Returns the new factor.
+    """
+    global _calibration
+    counted = _count_segment(text)
+    if counted <= 0 or actual_tokens <= 0:
+        return _calibration
+    ratio = min(max(actual_tokens / counted, CALIBRATION_BOUNDS[0]), CALIBRATION_BOUNDS[1])
+    with _calibration_lock:
+        _calibration = (1 - CALIBRATION_WEIGHT) * _calibration + CALIBRATION_WEIGHT * ratio
+        logger.debug("Token calibration updated to %.3f (counted=%d, actual=%d)", _calibration, counted, actual_tokens)
+        return _calibration
+
 def estimate_tokens(text: str) -> int:
     """
-    Estimates the number of tokens in a text string using a word-based heuristic.
-    Based on xAI's tokenizer: 445 chars = 100 tokens (~4.45 chars/token).
-    Uses 1.33 tokens per word (assuming ~0.75 words/token) and adds 1% of chars for punctuation.
+    Estimates the number of tokens in a text string with the offline tokenizer (see count_tokens).
     """
     if not isinstance(text, str):
         logger.error(f"Invalid input for estimate_tokens: {type(text)}")
         raise ValueError("Text must be a string")
-    
-    # Count words (split on whitespace) and adjust for punctuation
-    word_count = len(text.split())
-    char_count = len(text)
-    estimated_tokens = int(word_count * 1.33 + char_count / 100)
-    logger.debug(f"Estimated tokens: {estimated_tokens} (words={word_count}, chars={char_count})")
-    return max(1, estimated_tokens)  # Ensure at least 1 token
+
+    estimated_tokens = count_tokens(text)
+    logger.debug("Estimated tokens: %d (chars=%d)", estimated_tokens, len(text))
+    return estimated_tokens
+
+class TokenCounter:
+    """
+    Incremental token count for a prompt assembled from parts within max_tokens, so growing a prompt never
+    re-tokenizes what has already been counted. `separator` is counted between parts.
+    """
+    def __init__(self, max_tokens: int, separator: str = ""):
+        self.max_tokens = max_tokens
+        self.separator_tokens = count_tokens(separator) if separator else 0
+        self.total = 0
+        self.parts = 0
+
+    def _cost(self, texts) -> int:
+        return sum(count_tokens(text) for text in texts) + (self.separator_tokens if self.parts else 0)
+
+    def add(self, *texts: str) -> int:
+        """Counts a part made of texts whether or not it fits; returns its tokens."""
+        tokens = self._cost(texts)
+        self.total += tokens
+        self.parts += 1
+        return tokens
+
+    def try_add(self, *texts: str) -> bool:
+        """Counts a part made of texts only if it fits in what is left of the budget; returns whether it did."""
+        tokens = self._cost(texts)
+        if self.total + tokens > self.max_tokens:
+            return False
+        self.total += tokens
+        self.parts += 1
+        return True
+
+def pack_to_budget(items, max_tokens: int, separator: str = "\n\n"):
+    """
+    Packs whole items (pages, documents) in order into max_tokens. Items that would overflow the budget
+    are skipped, and later, smaller items still get a chance to fill the remaining space.
+    Returns (indices of the packed items, tokens used).
+    """
+    counter = TokenCounter(max_tokens, separator)
+    packed = [i for i, item in enumerate(items) if counter.try_add(item)]
+    return packed, counter.total
 
 def truncate_text(text: str, max_tokens: int = MAX_TOKENS) -> str:
     """
     Truncates text to fit within the specified token limit.
     Returns the original text if within limit, otherwise truncates and logs the event.
+    The cut falls on the piece boundary where the running count reaches the limit.
     """
     if not isinstance(text, str):
         logger.error(f"Invalid input for truncate_text: {type(text)}")
@@ -39,8 +157,18 @@ def truncate_text(text: str, max_tokens: int = MAX_TOKENS) -> str:
     if estimated_tokens <= max_tokens:
         return text
 
-    # Estimate truncation point: approximate chars per token (~4.45 from xAI data)
-    max_chars = int(max_tokens * 4.45)
-    truncated = text[:max_chars] + "... [Truncated due to token limit]"
-    logger.warning(f"Text truncated: {estimated_tokens} tokens exceeded limit of {max_tokens}. Truncated to {max_chars} chars.")
-    return truncated
\ No newline at end of file
+    with _calibration_lock:
+        factor = _calibration
+    # Leave room for the truncation marker
+    limit = (max_tokens - 10) / factor
+    used = 0
+    cut = 0
+    for match in PIECE_PATTERN.finditer(text):
+        cost = _piece_tokens(match.group())
+        if used + cost > limit:
+            break
+        used += cost
+        cut = match.end()
+    truncated = text[:cut] + "... [Truncated due to token limit]"
+    logger.warning(f"Text truncated: {estimated_tokens} tokens exceeded limit of {max_tokens}. Truncated to {cut} chars.")
+    return truncated
@@ -1,74 +1,234 @@
 # utils.py 
 # Created by SuperGrok and Sir_Cornealious on X
 
+import atexit
 import os
-import re
+import queue
 import logging
-import base64
+import logging.handlers
 import shutil
-import tempfile
+import threading
+from datetime import datetime
 
 # Constants
-API_URL = "https://api.x.ai/v1/chat/completions"
+# Chat-completions endpoint; XAI_API_URL points the app at another server (e.g. a local stub)
+API_URL = os.environ.get("XAI_API_URL", "https://api.x.ai/v1/chat/completions")
 TIMEOUT = 30
+# Shared API client: retries per request, exponential backoff bounds (seconds) and pooled connections
+API_MAX_RETRIES = 4
+API_BACKOFF_BASE = 1
+API_BACKOFF_MAX = 30
+API_POOL_SIZE = 16
 # Path to API key file, used in gui.py for saving/loading API keys
 API_KEY_FILE = os.path.expanduser("~/.grok_sleuth_api_key")
 POPPLER_PATH = "/opt/homebrew/Cellar/poppler/25.04.0/bin"
+# Environment variable checked for the API key in command-line mode
+API_KEY_ENV = "XAI_API_KEY"
+DEFAULT_QUERY = "Analyze this text for insights related to the investigation of this crime. Identify crimes committed or evidence of conspiracy"
+OCR_EXTENSIONS = ('.pdf', '.jpeg', '.jpg', '.png')
+CASE_SUBDIRS = ["JPEG", "OCR", "ANALYSIS", "QUARRY", "logs"]
+# Vision model and request settings used for OCR; all of them are part of the OCR cache key
+OCR_MODEL = "grok-2-vision-latest"
+OCR_PROMPT = "Perform OCR on this image and extract the raw text."
+OCR_DETAIL = "high"
+# Pre-upload image optimization: crop margins, drop unneeded colour, compress towards a byte target
+OCR_IMAGE_OPTIMIZE = True
+OCR_IMAGE_TARGET_BYTES = 350 * 1024
+# Pages are never scaled below this long edge (pixels) to keep small print legible
+OCR_IMAGE_MIN_LONG_EDGE = 1600
+# Skip blank pages and reuse the OCR text of pixel-identical duplicate pages instead of calling the API
+OCR_SKIP_BLANK_DUPLICATES = True
+# Pages with fewer dark pixels than this (full resolution, scanner specks excluded) are blank
+OCR_BLANK_MAX_INK_PIXELS = 20
+# Pack several short pages into one multi-image OCR request, split back into pages by delimiter lines
+OCR_BATCH = False
+# Per batch: at most this many pages, image bytes in the payload, and expected output tokens
+OCR_BATCH_MAX_PAGES = 8
+OCR_BATCH_MAX_BYTES = 4 * 1024 * 1024
+OCR_BATCH_MAX_OUTPUT_TOKENS = 4000
+# Split dense pages (ledgers, spreadsheets, multi-column statements) into tiles OCR'd concurrently and stitched
+OCR_TILING = False
+# A page is dense from this many text lines, summed over its columns; tiles cover about OCR_TILE_LINES lines each
+OCR_TILE_MIN_LINES = 70
+OCR_TILE_LINES = 35
+OCR_TILE_MAX = 8
+# Use the embedded text layer of born-digital PDF pages (pdftotext) and only OCR pages that fail the quality check
+OCR_USE_TEXT_LAYER = True
+# Minimum non-whitespace characters for a page's text layer to be trusted
+TEXT_LAYER_MIN_CHARS = 40
+# Persistent OCR result cache shared across runs, evicted least-recently-used above the size limit
+OCR_CACHE_DIR = os.path.expanduser("~/.casecracker_cache")
+OCR_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Model for analysis and follow-up queries
+ANALYSIS_MODEL = "grok-3-fast-latest"
+# Analyze cases over the token limit in chunks (map) and merge the findings (reduce) instead of truncating
+ANALYSIS_MAP_REDUCE = True
+# Estimated tokens of OCR text per map-reduce chunk, and concurrent chunk calls
+ANALYSIS_CHUNK_TOKENS = 60000
+ANALYSIS_WORKERS = 4
+# Follow-up queries send only the top-k most relevant OCR pages (BM25) within a token budget
+FOLLOWUP_RETRIEVAL = True
+FOLLOWUP_TOP_K = 40
+FOLLOWUP_TOKEN_BUDGET = 60000
+# Follow-ups as one conversation (fixed context prefix, earlier turns as messages) instead of picking earlier answers
+FOLLOWUP_CONVERSATION = False
+# Answer repeated follow-up questions from a per-case local cache
+FOLLOWUP_ANSWER_CACHE = True
+# Stream analysis and follow-up answers token by token to the terminal and output files
+ANALYSIS_STREAM = False
+# Pages rendered per pdf2image call; bounds how many page images are held in memory
+RASTER_WINDOW = 4
+# Processes rendering PDF pages in parallel, across all PDFs of a run
+RASTER_WORKERS = os.cpu_count() or 1
+# Concurrent OCR calls per document; 1 processes pages sequentially
+OCR_WORKERS = 4
+# What happens to rasterized page JPEGs once their PDF is processed: "keep", "keep-on-failure" or "delete"
+JPEG_RETENTION = "keep-on-failure"
+JPEG_RETENTION_POLICIES = ("keep", "keep-on-failure", "delete")
+# Input directories are searched recursively; threads used to list directories and hash inputs for duplicates
+INPUT_RECURSIVE = True
+INPUT_WORKERS = 8
+# Where each input document came from, including the paths of skipped byte-identical copies (in OCR/)
+INPUTS_INDEX = "inputs.json"
+# Watch mode: seconds between intake directory scans, and how long a file's size and mtime must stay unchanged
+WATCH_POLL_SECONDS = 2.0
+WATCH_STABLE_SECONDS = 5.0
+# Seconds before a watched file with failed pages is tried again
+WATCH_RETRY_SECONDS = 300
+# Per-case metrics (stage timings, API requests, tokens) saved in the case directory
+METRICS_FILE = "metrics.json"
+# Optional Prometheus textfile-collector path, rewritten as the run progresses
+METRICS_TEXTFILE = os.environ.get("CASECRACKER_METRICS_TEXTFILE")
+# USD per million (prompt, completion) tokens by model; when set, metrics.json includes a cost estimate
+MODEL_PRICES = {}
+# Log record format, console and case-log file levels
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_CONSOLE_LEVEL = "DEBUG"
+LOG_FILE_LEVEL = "DEBUG"
+# Per-module log levels; overridden with e.g. CASECRACKER_LOG_LEVELS="processing=INFO,api_client=DEBUG"
+LOG_LEVELS = {"urllib3": "WARNING", "PIL": "INFO"}
+LOG_LEVELS_ENV = "CASECRACKER_LOG_LEVELS"
+
+def parse_log_levels(spec):
+    """Parses "module=LEVEL,module=LEVEL" into {module: level}."""
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def _level(level):
+    return level if isinstance(level, int) else logging.getLevelName(level.upper())
+
+_log_queue = queue.SimpleQueue()
+_log_listener = None
+_log_file_handler = None
+_log_lock = threading.Lock()
+
+def _file_handler(log_file, level, mode):
+    handler = logging.FileHandler(log_file, mode=mode)
+    handler.setLevel(_level(level))
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+def _restart_listener(handlers):
+    global _log_listener
+    _log_listener = logging.handlers.QueueListener(_log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    # Nothing below the most verbose handler is kept, so such records are dropped before formatting
+    logging.getLogger().setLevel(min(handler.level for handler in handlers))
+
+def start_logging(console_level=LOG_CONSOLE_LEVEL, file_level=LOG_FILE_LEVEL, log_file=None, module_levels=None):
+    """
+    Routes every record through a QueueHandler on the root logger; a QueueListener thread does the
+    console and file I/O, so worker threads never block on a handler. module_levels defaults to
+    LOG_LEVELS plus any overrides in $CASECRACKER_LOG_LEVELS.
+    """
+    global _log_file_handler
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(_level(console_level))
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handlers = [console_handler]
+    with _log_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+        if _log_file_handler is not None:
+            _log_file_handler.close()
+        _log_file_handler = _file_handler(log_file, file_level, 'w') if log_file else None
+        if _log_file_handler is not None:
+            handlers.append(_log_file_handler)
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+        root.addHandler(logging.handlers.QueueHandler(_log_queue))
+        if module_levels is None:
+            module_levels = dict(LOG_LEVELS, **parse_log_levels(os.environ.get(LOG_LEVELS_ENV)))
+        for name, level in module_levels.items():
+            logging.getLogger(name).setLevel(_level(level))
+        _restart_listener(handlers)
+
+def switch_log_file(log_file):
+    """
+    Moves file logging to log_file. The listener is drained before the swap and records logged meanwhile
+    wait in the queue, so nothing is dropped; the earlier log's contents are appended to log_file, which
+    keeps what earlier runs of a resumed case logged.
+    """
+    global _log_file_handler
+    with _log_lock:
+        if _log_listener is None:
+            raise RuntimeError("start_logging must be called before switch_log_file")
+        _log_listener.stop()
+        handlers = [handler for handler in _log_listener.handlers if handler is not _log_file_handler]
+        level = LOG_FILE_LEVEL
+        if _log_file_handler is not None:
+            previous = _log_file_handler.baseFilename
+            level = _log_file_handler.level
+            _log_file_handler.close()
+            if os.path.abspath(previous) != os.path.abspath(log_file) and os.path.exists(previous):
+                with open(previous, "rb") as src, open(log_file, "ab") as dst:
+                    shutil.copyfileobj(src, dst)
+        _log_file_handler = _file_handler(log_file, level, 'a')
+        _restart_listener(handlers + [_log_file_handler])
+
+def stop_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _log_listener
+    with _log_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+            _log_listener = None
+
+atexit.register(stop_logging)
 
 def setup_logging(timestamp_dir):
+    """
+    Sends the run's log to grok_sleuth.log in the timestamped directory, carrying over what was logged
+    before the case directory existed, and returns the run logger.
+    """
     log_file = os.path.join(timestamp_dir, "grok_sleuth.log")
-    # Create a new logger instance specific to this timestamped directory
+    if _log_listener is None:
+        start_logging(log_file=log_file)
+    else:
+        switch_log_file(log_file)
+    # Named per case directory; records propagate to the root queue handler
     logger = logging.getLogger(f"grok_sleuth_{timestamp_dir}")
-    logger.setLevel(logging.DEBUG)
-    
-    # Remove any existing handlers to avoid conflicts
-    logger.handlers.clear()
-    
-    # Add file handler
-    file_handler = logging.FileHandler(log_file, mode='w')
-    file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(file_handler)
-    
-    # Add stream handler
-    stream_handler = logging.StreamHandler()
-    stream_handler.setLevel(logging.DEBUG)
-    stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(stream_handler)
-    
     logger.debug("Logging initialized")
     return logger
 
-def encode_image(image_path):
-    try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
-    except (OSError, IOError) as e:
-        logging.getLogger(__name__).error(f"Error encoding image {image_path}: {str(e)}")
-        raise
-
-def group_split_files(pdf_files):
-    grouped_files = {}
-    for pdf in pdf_files:
-        base_name = re.sub(r"-part_\d+_of_\d+\.pdf$", "", pdf, flags=re.IGNORECASE)
-        grouped_files.setdefault(base_name, []).append(pdf)
-    
-    for base_name in grouped_files:
-        grouped_files[base_name].sort(
-            key=lambda x: int(re.search(r"part_(\d+)_of_\d+", x).group(1)) if "part_" in x.lower() else 0
-        )
-    
-    return grouped_files
-
-def get_processed_files(ocr_dir):
-    processed_files = set()
-    ocr_file = os.path.join(ocr_dir, "combined_ocr.txt")
-    if os.path.exists(ocr_file):
-        with open(ocr_file, "r", encoding='utf-8') as f:
-            content = f.read()
-            matches = re.findall(r"File: (.*?)\n", content)
-            processed_files = set(matches)
-    return processed_files
+def create_case_dir(save_dir, case_name=None):
+    """
+    Creates the timestamped case directory (or save_dir/case_name) with its standard subdirectories.
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    if not case_name:
+        case_name = datetime.now().strftime("%Y%m%d%H%M")
+    timestamp_dir = os.path.join(save_dir, case_name)
+    os.makedirs(timestamp_dir, exist_ok=True)
+    for subdir in CASE_SUBDIRS:
+        os.makedirs(os.path.join(timestamp_dir, subdir), exist_ok=True)
+    return timestamp_dir
 
 def get_followup_files(followups_dir):
     followup_files = [f for f in os.listdir(followups_dir) if f.startswith("followup_") and f.endswith(".txt")]
@@ -0,0 +1,173 @@
+# watch.py
+# Created by SuperGrok and Sir_Cornealious on X
+
+import logging
+import os
+import threading
+import time
+from manifest import JobManifest
+from processing import PART_PATTERN, group_split_files, part_number, process_pdfs
+from raster_scheduler import RasterScheduler
+from utils import OCR_EXTENSIONS, OCR_WORKERS, WATCH_POLL_SECONDS, WATCH_STABLE_SECONDS, WATCH_RETRY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+def _signature(entry):
+    stat = entry.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+def is_complete_group(files):
+    """A group of -part_N_of_M files is complete once parts 1..M are all present; other groups always are."""
+    parts = [PART_PATTERN.search(name) for name in files]
+    if not any(parts):
+        return True
+    if not all(parts) or len({int(part.group(2)) for part in parts}) != 1:
+        return False
+    return {int(part.group(1)) for part in parts} == set(range(1, int(parts[0].group(2)) + 1))
+
+class IntakeWatcher:
+    """
+    Long-running ingest of an intake directory into one persistent case directory. The directory is polled;
+    a file is picked up once its size and mtime have not changed for stable_seconds, so files still being
+    copied in are left alone. Split files are grouped with group_split_files and processed only when every
+    part of the group has arrived. Each batch runs process_pdfs with the same rasterizer pool and API
+    client, so nothing is restarted between batches, and the job manifest makes sure only new files are
+    OCR'd. Only the files that failed (an unreadable PDF, pages the API failed on) are retried, after
+    retry_seconds; the rest of their batch is kept.
+    """
+    def __init__(self, api_key, intake_dir, case_dir, poll_seconds=WATCH_POLL_SECONDS, stable_seconds=WATCH_STABLE_SECONDS,
+                 retry_seconds=WATCH_RETRY_SECONDS, max_workers=OCR_WORKERS, use_cache=True, **ocr_options):
+        if not os.path.isdir(intake_dir):
+            raise ValueError(f"Intake directory does not exist: {intake_dir}")
+        self.api_key = api_key
+        self.intake_dir = intake_dir
+        self.jpeg_dir = os.path.join(case_dir, "JPEG")
+        self.ocr_dir = os.path.join(case_dir, "OCR")
+        self.poll_seconds = poll_seconds
+        self.stable_seconds = stable_seconds
+        self.retry_seconds = retry_seconds
+        self.max_workers = max_workers
+        self.use_cache = use_cache
+        self.ocr_options = ocr_options
+        self.scheduler = None
+        self.candidates = {}  # file -> (signature, time the signature was first seen)
+        self.processed = {}  # file -> signature when it was OCR'd
+        self.retry_at = {}
+        self.waiting_groups = set()
+        self._stop = threading.Event()
+        self._load_processed()
+
+    def _load_processed(self):
+        """Files the case has already OCR'd in earlier runs are not picked up again."""
+        manifest = JobManifest(self.ocr_dir)
+        try:
+            for name, signature in self._scan().items():
+                if manifest.is_file_done(name):
+                    self.processed[name] = signature
+        finally:
+            manifest.close()
+        logger.info(f"Watching {self.intake_dir}; {len(self.processed)} files already processed")
+
+    def _scan(self):
+        files = {}
+        with os.scandir(self.intake_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.name.lower().endswith(OCR_EXTENSIONS):
+                    continue
+                try:
+                    if entry.is_file():
+                        files[entry.name] = _signature(entry)
+                except OSError:
+                    # Removed or renamed between listing and stat
+                    continue
+        return files
+
+    def stable_files(self, now=None):
+        """Returns the new files whose size and mtime have stayed unchanged for stable_seconds."""
+        now = time.monotonic() if now is None else now
+        current = self._scan()
+        stable = []
+        for name, signature in current.items():
+            if name in self.processed:
+                if signature != self.processed[name]:
+                    logger.warning(f"{name} changed after it was processed; add it under a new name to OCR it again")
+                    self.processed[name] = signature
+                continue
+            if self.retry_at.get(name, 0) > now:
+                continue
+            seen = self.candidates.get(name)
+            if seen is None or seen[0] != signature:
+                self.candidates[name] = (signature, now)
+            elif now - seen[1] >= self.stable_seconds:
+                stable.append(name)
+        for name in set(self.candidates) - set(current):
+            del self.candidates[name]
+        return stable
+
+    def ready_groups(self, stable):
+        """Groups the stable files, keeping back split groups that are still missing parts."""
+        ready = {}
+        for base_name, files in group_split_files(stable).items():
+            # Parts OCR'd before a failed sibling are still part of the group
+            group = sorted(set(files) | {name for name in self.processed if PART_PATTERN.sub("", name) == base_name},
+                           key=part_number)
+            if is_complete_group(group):
+                ready[base_name] = group
+                self.waiting_groups.discard(base_name)
+            elif base_name not in self.waiting_groups:
+                logger.info(f"Waiting for the remaining parts of {base_name} ({len(group)} arrived)")
+                self.waiting_groups.add(base_name)
+        return ready
+
+    def _process(self, groups):
+        files = [name for group in groups.values() for name in group]
+        logger.info(f"Ingesting {len(groups)} groups ({len(files)} files): {sorted(groups)}")
+        if self.scheduler is None:
+            # Kept for the life of the watcher so the rasterizer processes stay warm between batches
+            self.scheduler = RasterScheduler(self.jpeg_dir)
+        try:
+            process_pdfs(self.api_key, self.intake_dir, files, self.jpeg_dir, self.ocr_dir, max_workers=self.max_workers,
+                         use_cache=self.use_cache, scheduler=self.scheduler, **self.ocr_options)
+        except Exception as e:
+            # The watcher outlives any one batch; a broken pool is replaced on the next batch
+            logger.exception(f"Error ingesting {sorted(groups)}: {str(e)}")
+            self.scheduler.close()
+            self.scheduler = None
+        signatures = self._scan()
+        retry_at = time.monotonic() + self.retry_seconds
+        manifest = JobManifest(self.ocr_dir)
+        try:
+            for name in files:
+                self.candidates.pop(name, None)
+                if manifest.is_file_done(name) and name in signatures:
+                    self.processed[name] = signatures[name]
+                    self.retry_at.pop(name, None)
+                else:
+                    logger.warning(f"{name} was not fully OCR'd; retrying in {self.retry_seconds}s")
+                    self.retry_at[name] = retry_at
+        finally:
+            manifest.close()
+
+    def run_once(self):
+        """Scans the intake directory once and ingests the groups that are ready. Returns the number of groups."""
+        groups = self.ready_groups(self.stable_files())
+        if groups:
+            self._process(groups)
+        return len(groups)
+
+    def run(self):
+        """Polls until stop() is called."""
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except OSError as e:
+                logger.error(f"Error scanning {self.intake_dir}: {str(e)}")
+            self._stop.wait(self.poll_seconds)
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.close()
+            self.scheduler = None